@@ -1,11 +1,18 @@
 from django.contrib import admin
-from .models import GlobalMemory, ChatSession, ChatMessage, Quiz, Question, UserQuizAttempt, Goal
+from .models import GlobalMemory, MemoryEntry, ChatSession, ChatMessage, Quiz, Question, UserQuizAttempt, Goal, QuizGenerationCache, QuizBatchJob, QuizBatchItem, SessionStats, QuizStats, QuestionStats
 
 admin.site.register(GlobalMemory)
+admin.site.register(MemoryEntry)
 admin.site.register(ChatSession)
 admin.site.register(ChatMessage)
 admin.site.register(Quiz)
 admin.site.register(Question)
 admin.site.register(UserQuizAttempt)
 admin.site.register(Goal)
+admin.site.register(QuizGenerationCache)
+admin.site.register(QuizBatchJob)
+admin.site.register(QuizBatchItem)
+admin.site.register(SessionStats)
+admin.site.register(QuizStats)
+admin.site.register(QuestionStats)
 # Register your models here.
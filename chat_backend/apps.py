@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ChatBackendConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat_backend'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from . import signals  # noqa: F401 - registers cache invalidation handlers
+        from .utils.sqlite import configure_sqlite_connection
+        connection_created.connect(configure_sqlite_connection, dispatch_uid="chat_backend_sqlite_pragmas")
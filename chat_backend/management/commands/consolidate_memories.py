@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from chat_backend.utils.memory import consolidate_memories
+from chat_backend.utils.vectorstore import load_embedding_model
+
+
+class Command(BaseCommand):
+    help = "Merge near-duplicate learner memories (safe to run periodically, e.g. from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=getattr(settings, 'MEMORY_CONSOLIDATE_THRESHOLD', 0.92),
+            help="Cosine similarity above which two memories count as duplicates",
+        )
+
+    def handle(self, *args, **options):
+        removed = consolidate_memories(load_embedding_model(), threshold=options["threshold"])
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} near-duplicate memories"))
@@ -0,0 +1,193 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import numpy as np
+from django.core.management.base import BaseCommand
+
+SAMPLE_DOCUMENT = [
+    "Photosynthesis converts light energy into chemical energy stored in glucose.",
+    "It takes place in the chloroplasts of plant cells, mainly in the leaves.",
+    "The light dependent reactions split water and release oxygen as a by-product.",
+    "They produce ATP and NADPH, which carry energy to the Calvin cycle.",
+    "The Calvin cycle fixes carbon dioxide into three-carbon sugars using that energy.",
+    "Chlorophyll absorbs mostly red and blue light and reflects green light.",
+    "The rate of photosynthesis depends on light intensity, carbon dioxide and temperature.",
+    "Cellular respiration reverses the process, releasing energy from glucose.",
+]
+
+SAMPLE_QUERIES = [
+    "Summarize the main idea of the document.",
+    "What happens during the light dependent reactions?",
+    "Explain the Calvin cycle in simple terms.",
+    "Which factors limit the rate of photosynthesis?",
+]
+
+
+def build_pdf(lines):
+    """Build a minimal single-page PDF with one line of Helvetica text per entry"""
+    def escape(text):
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    content = "BT /F1 11 Tf 14 TL 40 750 Td " + " ".join(f"({escape(line)}) Tj T*" for line in lines) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>",
+        f"<< /Length {len(content)} >>\nstream\n{content}\nendstream",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{body}\nendobj\n"
+    xref_at = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n"
+    return pdf.encode("latin-1")
+
+
+class LoadStats:
+    """Latency samples and error counts per endpoint, shared by the worker threads"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, ok=True):
+        with self._lock:
+            self.samples[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def report(self, wall_time):
+        rows = []
+        for endpoint in sorted(self.samples):
+            values = np.array(self.samples[endpoint]) * 1000
+            rows.append({
+                "endpoint": endpoint,
+                "requests": len(values),
+                "errors": self.errors[endpoint],
+                "throughput_rps": round(len(values) / wall_time, 2) if wall_time else None,
+                "p50_ms": round(float(np.percentile(values, 50)), 1),
+                "p95_ms": round(float(np.percentile(values, 95)), 1),
+                "p99_ms": round(float(np.percentile(values, 99)), 1),
+                "max_ms": round(float(values.max()), 1),
+            })
+        return rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive concurrent sessions through create session -> upload -> chat -> quiz against a running "
+        "server and report throughput and latency percentiles per endpoint (pair with mock_llm_server)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000/api", help="API root of the server under test")
+        parser.add_argument("--sessions", type=int, default=10, help="Number of sessions to run")
+        parser.add_argument("--concurrency", type=int, default=None, help="Sessions in flight at once (default: all)")
+        parser.add_argument("--turns", type=int, default=2, help="Chat turns per session")
+        parser.add_argument("--pdf", default=None, help="PDF to upload (default: a small generated document)")
+        parser.add_argument("--skip-upload", action="store_true")
+        parser.add_argument("--skip-quiz", action="store_true")
+        parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout, seconds")
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.base_url = options["base_url"].rstrip("/")
+        if options["pdf"]:
+            with open(options["pdf"], "rb") as f:
+                self.pdf_bytes = f.read()
+        else:
+            self.pdf_bytes = build_pdf(SAMPLE_DOCUMENT)
+
+        stats = LoadStats()
+        concurrency = options["concurrency"] or options["sessions"]
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(self.run_session, number, stats) for number in range(options["sessions"])]
+            failed = sum(1 for future in futures if future.exception() is not None)
+        wall_time = time.perf_counter() - started_at
+
+        rows = stats.report(wall_time)
+        if options["json"]:
+            self.stdout.write(json.dumps({"wall_time_s": round(wall_time, 2), "failed_sessions": failed, "endpoints": rows}, indent=2))
+            return
+
+        self.stdout.write(f"{options['sessions']} sessions ({concurrency} concurrent) in {wall_time:.1f}s, {failed} aborted")
+        header = f"{'endpoint':<16}{'requests':>9}{'errors':>8}{'req/s':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        self.stdout.write(header)
+        for row in rows:
+            self.stdout.write(
+                f"{row['endpoint']:<16}{row['requests']:>9}{row['errors']:>8}{row['throughput_rps']:>8}"
+                f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}"
+            )
+
+    def _timed(self, stats, endpoint, send):
+        """Run one request, recording its latency; returns the response or None on failure"""
+        started_at = time.perf_counter()
+        try:
+            response = send()
+        except httpx.HTTPError:
+            stats.record(endpoint, time.perf_counter() - started_at, ok=False)
+            return None
+        stats.record(endpoint, time.perf_counter() - started_at, ok=response.is_success)
+        return response if response.is_success else None
+
+    def run_session(self, number, stats):
+        with httpx.Client(base_url=self.base_url, timeout=self.options["timeout"]) as client:
+            response = self._timed(stats, "session_create", lambda: client.post("/session/create/"))
+            if response is None:
+                raise RuntimeError("session creation failed")
+            session_id = response.json()["session_id"]
+
+            if not self.options["skip_upload"]:
+                self._timed(stats, "upload", lambda: client.post(
+                    f"/session/{session_id}/upload/",
+                    files={"pdf": (f"load-test-{number}.pdf", self.pdf_bytes, "application/pdf")},
+                ))
+
+            message_id = None
+            for turn in range(self.options["turns"]):
+                query = SAMPLE_QUERIES[(number + turn) % len(SAMPLE_QUERIES)]
+                message_id = self.chat(client, session_id, query, stats) or message_id
+
+            if not self.options["skip_quiz"] and message_id:
+                self._timed(stats, "quiz_generate", lambda: client.post(f"/message/{message_id}/generate-quiz/"))
+
+    def chat(self, client, session_id, query, stats):
+        """Stream one answer, recording time to first chunk and total time; returns the answer's message id"""
+        started_at = time.perf_counter()
+        first_chunk_at = None
+        final = None
+        try:
+            with client.stream("POST", f"/session/{session_id}/rag/stream/", json={"query": query}) as response:
+                if not response.is_success:
+                    stats.record("chat_total", time.perf_counter() - started_at, ok=False)
+                    return None
+                for line in response.iter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    event = json.loads(line[len("data: "):])
+                    if first_chunk_at is None and event.get("chunk"):
+                        first_chunk_at = time.perf_counter()
+                    if event.get("done"):
+                        final = event
+                        break
+        except httpx.HTTPError:
+            stats.record("chat_total", time.perf_counter() - started_at, ok=False)
+            return None
+
+        ok = final is not None and not final.get("error")
+        stats.record("chat_total", time.perf_counter() - started_at, ok=ok)
+        if first_chunk_at is not None:
+            stats.record("chat_ttfb", first_chunk_at - started_at)
+        return (final.get("metadata") or {}).get("new_message_id") if ok else None
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import math
+import random
+import re
+import socket
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+FILLER_WORDS = (
+    "the learner can review this concept by working through a short example step by step "
+    "then compare the result with the definition and note which assumptions matter most"
+).split()
+
+
+def build_quiz():
+    questions = []
+    for number in range(1, 6):
+        options = [f"Option {letter} for question {number}" for letter in "ABCD"]
+        questions.append({
+            "question_text": f"Mock question {number} about the message content?",
+            "options": options,
+            "correct_answer": options[number % 4],
+        })
+    return {"title": "Mock Quiz", "description": "Generated by the mock LLM server", "questions": questions}
+
+
+def build_reply(messages, completion_tokens):
+    """Pick a reply that the calling code can use: quiz JSON, extraction JSON or filler prose"""
+    system = " ".join(m.get("content") or "" for m in messages if m.get("role") == "system")
+    prompt = " ".join(m.get("content") or "" for m in messages if m.get("role") == "user")
+    if '"questions"' in prompt:
+        return json.dumps(build_quiz())
+    if "valid JSON" in system:
+        return json.dumps({"save": False})
+    words = [FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(completion_tokens)]
+    return " ".join(words).capitalize() + "."
+
+
+def hashed_embedding(text, dim):
+    """Deterministic bag-of-words embedding: texts sharing words get similar vectors"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    else:
+        vector[0] = 1.0
+    return vector.tolist()
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    # Set on the server by Command.handle
+    options = None
+
+    def log_message(self, format, *args):
+        if self.options["verbosity"] > 1:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        try:
+            payload = self._read_json()
+        except json.JSONDecodeError:
+            return self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            return self._chat_completions(payload)
+        if self.path.rstrip("/").endswith("/embeddings"):
+            return self._embeddings(payload)
+        return self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _inject_error(self):
+        """Fail the request up front with the configured probabilities; returns True if it did"""
+        roll = random.random()
+        if roll < self.options["rate_limit_rate"]:
+            self._send_json(429, {"error": {"message": "Mock rate limit", "type": "rate_limit_exceeded"}}, {"retry-after": "1"})
+            return True
+        if roll < self.options["rate_limit_rate"] + self.options["error_rate"]:
+            self._send_json(500, {"error": {"message": "Mock server error", "type": "internal_server_error"}})
+            return True
+        return False
+
+    def _sample_ttft(self):
+        # Log-normal with the configured median and p99 (z(0.99) ~= 2.326)
+        median = self.options["ttft_median"]
+        sigma = math.log(max(self.options["ttft_p99"], median) / median) / 2.326 if median > 0 else 0
+        return median * math.exp(random.gauss(0, sigma)) if median > 0 else 0.0
+
+    def _chat_completions(self, payload):
+        if self._inject_error():
+            return
+
+        max_tokens = payload.get("max_completion_tokens") or payload.get("max_tokens") or self.options["completion_tokens"]
+        reply = build_reply(payload.get("messages", []), min(self.options["completion_tokens"], max_tokens))
+        # Whitespace-separated pieces stand in for tokens
+        pieces = re.findall(r"\S+\s*", reply)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = payload.get("model", "mock-model")
+        usage = {"prompt_tokens": 0, "completion_tokens": len(pieces), "total_tokens": len(pieces)}
+        token_interval = 1.0 / self.options["tokens_per_second"] if self.options["tokens_per_second"] > 0 else 0.0
+        ttft = self._sample_ttft()
+
+        if not payload.get("stream"):
+            time.sleep(ttft + token_interval * len(pieces))
+            return self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        def chunk(delta, finish_reason=None, **extra):
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                **extra,
+            }
+            return f"data: {json.dumps(data)}\n\n".encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        abort_at = random.randrange(len(pieces)) if pieces and random.random() < self.options["abort_rate"] else None
+        try:
+            time.sleep(ttft)
+            self.wfile.write(chunk({"role": "assistant", "content": ""}))
+            for index, piece in enumerate(pieces):
+                if index == abort_at:
+                    # Simulate the upstream dropping the connection mid-answer
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    return
+                if index:
+                    time.sleep(token_interval)
+                self.wfile.write(chunk({"content": piece}))
+                self.wfile.flush()
+            self.wfile.write(chunk({}, "stop", x_groq={"id": completion_id, "usage": usage}))
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client cancelled the stream (e.g. a hedged request lost the race)
+            pass
+
+    def _embeddings(self, payload):
+        if self._inject_error():
+            return
+        inputs = payload.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        time.sleep(self.options["embedding_latency"])
+        self._send_json(200, {
+            "object": "list",
+            "model": payload.get("model", "mock-embedding"),
+            "data": [
+                {"object": "embedding", "index": index, "embedding": hashed_embedding(text, self.options["embedding_dim"])}
+                for index, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local OpenAI-compatible stand-in for Groq chat completions and embeddings, for load tests. "
+        "Point the backend at it with GROQ_BASE_URL=http://HOST:PORT and "
+        "EMBEDDING_BACKEND=openai EMBEDDING_BASE_URL=http://HOST:PORT"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--tokens-per-second", type=float, default=150.0, help="Streaming rate per request (0 = no delay)")
+        parser.add_argument("--ttft-median", type=float, default=0.3, help="Median time to first token, seconds")
+        parser.add_argument("--ttft-p99", type=float, default=1.5, help="99th percentile time to first token, seconds")
+        parser.add_argument("--completion-tokens", type=int, default=200, help="Length of prose answers, in tokens")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with HTTP 500")
+        parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests failing with HTTP 429")
+        parser.add_argument("--abort-rate", type=float, default=0.0, help="Fraction of streams cut off mid-answer")
+        parser.add_argument("--embedding-dim", type=int, default=768)
+        parser.add_argument("--embedding-latency", type=float, default=0.02, help="Seconds per embeddings request")
+        parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible latencies and errors")
+
+    def handle(self, *args, **options):
+        if options["seed"] is not None:
+            random.seed(options["seed"])
+
+        handler = type("ConfiguredMockLLMHandler", (MockLLMHandler,), {"options": options})
+        server = ThreadingHTTPServer((options["host"], options["port"]), handler)
+        server.daemon_threads = True
+        self.stdout.write(self.style.SUCCESS(
+            f"Mock LLM server listening on http://{options['host']}:{server.server_port} "
+            f"(ttft median {options['ttft_median']}s / p99 {options['ttft_p99']}s, "
+            f"{options['tokens_per_second']} tokens/s, errors {options['error_rate']:.0%}, "
+            f"429s {options['rate_limit_rate']:.0%}, aborts {options['abort_rate']:.0%})"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
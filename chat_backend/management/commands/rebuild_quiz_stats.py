@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from chat_backend.utils.quiz_stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the session, quiz and question stats tables from the stored quiz attempts (backfill or repair)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--session", type=int, default=None, help="Only rebuild the stats of this session")
+
+    def handle(self, *args, **options):
+        counts = rebuild_stats(session_id=options["session"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt stats for {counts['sessions']} sessions, {counts['quizzes']} quizzes and {counts['questions']} questions"
+        ))
@@ -0,0 +1,159 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat_backend.utils.sqlite import pragma_statements, LOCK_ERRORS
+
+SCHEMA = """
+CREATE TABLE message (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    is_complete BOOLEAN NOT NULL
+);
+CREATE INDEX message_session ON message (session_id);
+"""
+
+# Reads and writes shaped like the chat hot paths: a history page, and a streamed answer
+# (insert the placeholder after reading the latest turn, then write the full text)
+READ_SQL = "SELECT id, message FROM message WHERE session_id = ? ORDER BY id DESC LIMIT 50"
+WRITE_SQL = (
+    "SELECT MAX(id) FROM message WHERE session_id = ?",
+    "INSERT INTO message (session_id, message, is_complete) VALUES (?, '', 0)",
+    "UPDATE message SET message = ?, is_complete = 1 WHERE id = ?",
+)
+ANSWER = "A streamed answer about photosynthesis and the Calvin cycle. " * 20
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent read/write throughput of a scratch SQLite database with SQLite defaults "
+        "(rollback journal, deferred transactions) and with the production profile "
+        "(settings.SQLITE_PRAGMAS, BEGIN IMMEDIATE)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=8, help="Reader threads")
+        parser.add_argument("--writers", type=int, default=4, help="Writer threads")
+        parser.add_argument("--duration", type=float, default=5.0, help="Seconds per profile")
+        parser.add_argument("--sessions", type=int, default=20, help="Sessions the load is spread over")
+        parser.add_argument("--seed-messages", type=int, default=5000, help="Messages in the database before the run")
+        parser.add_argument("--timeout", type=float, default=5.0, help="Busy timeout of both profiles, seconds")
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        profiles = [
+            ("default", {"journal_mode": "DELETE"}, "DEFERRED"),
+            ("production", getattr(settings, "SQLITE_PRAGMAS", {}), "IMMEDIATE"),
+        ]
+        rows = []
+        with tempfile.TemporaryDirectory() as directory:
+            for name, pragmas, begin in profiles:
+                path = os.path.join(directory, f"{name}.sqlite3")
+                self.seed(path, pragmas, options)
+                rows.append({"profile": name, **self.run_profile(path, pragmas, begin, options)})
+
+        if options["json"]:
+            self.stdout.write(json.dumps(rows, indent=2))
+            return
+        self.stdout.write(
+            f"{options['readers']} readers, {options['writers']} writers, {options['duration']}s per profile"
+        )
+        self.stdout.write(
+            f"{'profile':<12}{'reads/s':>10}{'writes/s':>10}{'read p95':>10}{'write p95':>11}{'locked':>8}"
+        )
+        for row in rows:
+            self.stdout.write(
+                f"{row['profile']:<12}{row['reads_per_s']:>10}{row['writes_per_s']:>10}"
+                f"{row['read_p95_ms']:>10}{row['write_p95_ms']:>11}{row['lock_errors']:>8}"
+            )
+
+    def connect(self, path, pragmas, options):
+        db = sqlite3.connect(path, timeout=options["timeout"], isolation_level=None, check_same_thread=False)
+        for statement in pragma_statements(pragmas):
+            db.execute(statement)
+        return db
+
+    def seed(self, path, pragmas, options):
+        db = self.connect(path, pragmas, options)
+        db.executescript(SCHEMA)
+        db.execute("BEGIN")
+        db.executemany(
+            "INSERT INTO message (session_id, message, is_complete) VALUES (?, ?, 1)",
+            ((number % options["sessions"], ANSWER) for number in range(options["seed_messages"]))
+        )
+        db.execute("COMMIT")
+        db.close()
+
+    def run_profile(self, path, pragmas, begin, options):
+        stop = threading.Event()
+        lock = threading.Lock()
+        reads, writes = [], []
+        errors = [0]
+
+        def reader():
+            db = self.connect(path, pragmas, options)
+            while not stop.is_set():
+                started_at = time.perf_counter()
+                try:
+                    db.execute(READ_SQL, (random.randrange(options["sessions"]),)).fetchall()
+                except sqlite3.OperationalError as e:
+                    if not any(message in str(e) for message in LOCK_ERRORS):
+                        raise
+                    with lock:
+                        errors[0] += 1
+                    continue
+                with lock:
+                    reads.append(time.perf_counter() - started_at)
+            db.close()
+
+        def writer():
+            db = self.connect(path, pragmas, options)
+            while not stop.is_set():
+                session_id = random.randrange(options["sessions"])
+                started_at = time.perf_counter()
+                try:
+                    db.execute(f"BEGIN {begin}")
+                    db.execute(WRITE_SQL[0], (session_id,)).fetchone()
+                    message_id = db.execute(WRITE_SQL[1], (session_id,)).lastrowid
+                    db.execute(WRITE_SQL[2], (ANSWER, message_id))
+                    db.execute("COMMIT")
+                except sqlite3.OperationalError as e:
+                    if db.in_transaction:
+                        db.execute("ROLLBACK")
+                    if not any(message in str(e) for message in LOCK_ERRORS):
+                        raise
+                    with lock:
+                        errors[0] += 1
+                    continue
+                with lock:
+                    writes.append(time.perf_counter() - started_at)
+            db.close()
+
+        threads = [threading.Thread(target=reader) for _ in range(options["readers"])]
+        threads += [threading.Thread(target=writer) for _ in range(options["writers"])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options["duration"])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        def p95(samples):
+            return round(float(np.percentile(np.array(samples) * 1000, 95)), 2) if samples else None
+
+        return {
+            "reads_per_s": round(len(reads) / options["duration"], 1),
+            "writes_per_s": round(len(writes) / options["duration"], 1),
+            "read_p95_ms": p95(reads),
+            "write_p95_ms": p95(writes),
+            "lock_errors": errors[0],
+        }
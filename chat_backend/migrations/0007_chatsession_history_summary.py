@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_backend', '0006_question_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='history_summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='summary_until_message_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:36
+
+from django.db import migrations, models
+
+
+def split_preferences_into_entries(apps, schema_editor):
+    """Turn each line of the legacy GlobalMemory.preferences blob into a core Preferences entry"""
+    GlobalMemory = apps.get_model('chat_backend', 'GlobalMemory')
+    MemoryEntry = apps.get_model('chat_backend', 'MemoryEntry')
+    entries = []
+    for memory in GlobalMemory.objects.all():
+        for line in memory.preferences.splitlines():
+            line = line.strip()
+            if line:
+                entries.append(MemoryEntry(content=line, category='Preferences', is_core=True))
+    MemoryEntry.objects.bulk_create(entries)
+
+
+def join_entries_into_preferences(apps, schema_editor):
+    GlobalMemory = apps.get_model('chat_backend', 'GlobalMemory')
+    MemoryEntry = apps.get_model('chat_backend', 'MemoryEntry')
+    memory = GlobalMemory.objects.first()
+    if memory:
+        memory.preferences = "\n".join(MemoryEntry.objects.order_by('id').values_list('content', flat=True))
+        memory.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_backend', '0007_chatsession_history_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemoryEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content', models.TextField()),
+                ('category', models.CharField(blank=True, max_length=50)),
+                ('is_core', models.BooleanField(default=False)),
+                ('embedding', models.BinaryField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(split_preferences_into_entries, join_entries_into_preferences),
+    ]
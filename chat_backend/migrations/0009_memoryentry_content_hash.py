@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_backend', '0008_memoryentry'),
+    ]
+
+    operations = [
+        # Nullable until 0010 has filled it in; 0011 makes it unique
+        migrations.AddField(
+            model_name='memoryentry',
+            name='content_hash',
+            field=models.CharField(max_length=64, null=True),
+        ),
+    ]
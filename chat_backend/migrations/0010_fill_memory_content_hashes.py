@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:02
+
+import hashlib
+import re
+
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+
+def _normalize(content):
+    # Frozen copy of chat_backend.utils.memory.normalize_memory
+    return re.sub(r"\s+", " ", content).strip().strip(".!;,").lower()
+
+
+def fill_content_hashes(apps, schema_editor):
+    """Hash existing entries, dropping exact duplicates (the oldest copy is kept)"""
+    MemoryEntry = apps.get_model('chat_backend', 'MemoryEntry')
+    seen = set()
+    duplicates = []
+    batch = []
+    for entry in MemoryEntry.objects.order_by('id').only('id', 'content').iterator():
+        content_hash = hashlib.sha256(_normalize(entry.content).encode("utf-8")).hexdigest()
+        if content_hash in seen:
+            duplicates.append(entry.id)
+            continue
+        seen.add(content_hash)
+        entry.content_hash = content_hash
+        batch.append(entry)
+        if len(batch) >= BATCH_SIZE:
+            MemoryEntry.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    MemoryEntry.objects.bulk_update(batch, ['content_hash'])
+    MemoryEntry.objects.filter(id__in=duplicates).delete()
+
+
+def clear_content_hashes(apps, schema_editor):
+    """Reverse: forget the hashes (duplicates dropped on the way forward are not restored)"""
+    MemoryEntry = apps.get_model('chat_backend', 'MemoryEntry')
+    MemoryEntry.objects.update(content_hash=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_backend', '0009_memoryentry_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_content_hashes, clear_content_hashes),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_backend', '0010_fill_memory_content_hashes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='memoryentry',
+            name='content_hash',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+    ]
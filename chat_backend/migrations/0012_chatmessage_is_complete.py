@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_backend', '0011_memoryentry_content_hash_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='is_complete',
+            field=models.BooleanField(default=True),
+        ),
+    ]
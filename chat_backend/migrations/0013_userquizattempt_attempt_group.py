@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_backend', '0012_chatmessage_is_complete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userquizattempt',
+            name='attempt_group',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+    ]
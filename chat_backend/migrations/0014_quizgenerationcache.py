@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_backend', '0013_userquizattempt_attempt_group'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizGenerationCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('prompt_version', models.CharField(max_length=20)),
+                ('payload', models.JSONField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
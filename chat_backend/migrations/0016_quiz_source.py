@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_backend', '0015_quizbatchjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='source',
+            field=models.CharField(default='chat', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='source_chunks',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
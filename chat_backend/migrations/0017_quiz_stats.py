@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_backend', '0016_quiz_source'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionStats',
+            fields=[
+                ('session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='chat_backend.chatsession')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('graded', models.PositiveIntegerField(default=0)),
+                ('correct', models.PositiveIntegerField(default=0)),
+                ('submissions', models.PositiveIntegerField(default=0)),
+                ('current_streak', models.PositiveIntegerField(default=0)),
+                ('best_streak', models.PositiveIntegerField(default=0)),
+                ('last_attempt_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuestionStats',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='chat_backend.question')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('graded', models.PositiveIntegerField(default=0)),
+                ('correct', models.PositiveIntegerField(default=0)),
+                ('last_attempt_at', models.DateTimeField(blank=True, null=True)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='question_stats', to='chat_backend.quiz')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuizStats',
+            fields=[
+                ('quiz', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='chat_backend.quiz')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('graded', models.PositiveIntegerField(default=0)),
+                ('correct', models.PositiveIntegerField(default=0)),
+                ('submissions', models.PositiveIntegerField(default=0)),
+                ('last_attempt_at', models.DateTimeField(blank=True, null=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quiz_stats', to='chat_backend.chatsession')),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_backend', '0017_quiz_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='goal',
+            index=models.Index(fields=['session', 'created_at'], name='goal_session_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='goal',
+            index=models.Index(fields=['deadline', 'created_at'], name='goal_deadline_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(fields=['created_at', 'id'], name='quiz_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userquizattempt',
+            index=models.Index(fields=['session', 'attempted_at'], name='attempt_session_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userquizattempt',
+            index=models.Index(fields=['session', 'quiz', 'attempted_at'], name='attempt_session_quiz_time_idx'),
+        ),
+    ]
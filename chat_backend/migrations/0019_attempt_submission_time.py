@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:32
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_backend', '0018_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userquizattempt',
+            name='attempted_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -1,14 +1,28 @@
 from django.db import models
+from django.utils import timezone
 
 class GlobalMemory(models.Model):
-    preferences = models.TextField() 
+    preferences = models.TextField() # Legacy memory blob, migrated into MemoryEntry rows
 
     def __str__(self):
         return "Global Preferences"
 
+class MemoryEntry(models.Model):
+    content = models.TextField()
+    content_hash = models.CharField(max_length=64, unique=True) # sha256 of the normalized content, deduplicates appends
+    category = models.CharField(max_length=50, blank=True) # e.g., 'Goals', 'Difficulties', 'Preferences', 'Progress'
+    is_core = models.BooleanField(default=False) # Core profile entries are always part of the system prompt
+    embedding = models.BinaryField(null=True, blank=True) # float32 vector, computed in the background after the entry is saved
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Memory {self.id} ({self.category or 'General'}): {self.content[:50]}"
+
 class ChatSession(models.Model):
     uploaded_pdf = models.FileField(upload_to='pdfs/', null=True, blank=True) # PDF upload is per-session
     created_at = models.DateTimeField(auto_now_add=True)
+    history_summary = models.TextField(blank=True, default='') # Rolling summary of turns that fell out of the history window
+    summary_until_message_id = models.BigIntegerField(null=True, blank=True) # Last ChatMessage id folded into history_summary
 
     def __str__(self):
         return f"Chat Session {self.id}"
@@ -17,19 +31,36 @@ class Quiz(models.Model):
     title = models.CharField(max_length=255)
     session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name='quizzes')
     description = models.TextField(blank=True)
+    source = models.CharField(max_length=20, default='chat') # 'chat' (from a message) or 'document' (pre-generated from the session PDF)
+    source_chunks = models.JSONField(default=list, blank=True) # PDF chunk indices a document quiz was generated from
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='quiz_created_id_idx'), # quiz list keyset pages
+        ]
+
     def __str__(self):
         return f"Quiz {self.id}: {self.title} (Session: {self.session_id if self.session else 'N/A'})"
 
+class QuizGenerationCache(models.Model):
+    key = models.CharField(max_length=64, unique=True) # sha256 of prompt version + normalized message content
+    prompt_version = models.CharField(max_length=20)
+    payload = models.JSONField() # title, description and questions as generated
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Quiz cache {self.key[:12]} (v{self.prompt_version}): {self.payload.get('title', '')[:50]}"
+
 class ChatMessage(models.Model):
     session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name='messages')
     message = models.TextField()
     is_user = models.BooleanField(default=True)
+    is_complete = models.BooleanField(default=True) # False while an assistant answer is still streaming (or was cut off)
     created_at = models.DateTimeField(auto_now_add=True)
     quiz = models.ForeignKey(Quiz, on_delete=models.SET_NULL, related_name='chat_messages', null=True, blank=True)
 
-
     def __str__(self):
         return f"Session {self.session.id} - {'User' if self.is_user else 'Bot'}: {self.message[:50]}..."
 
@@ -48,7 +79,14 @@ class UserQuizAttempt(models.Model):
     question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='user_answers', null=True, blank=True)
     user_answer = models.TextField(blank=True)
     is_correct = models.BooleanField(null=True) # Null for ungraded, True/False after checking
-    attempted_at = models.DateTimeField(auto_now_add=True)
+    attempt_group = models.UUIDField(null=True, blank=True, db_index=True) # Shared by all answers of one submission
+    attempted_at = models.DateTimeField(default=timezone.now, editable=False) # One time per submission, see save_submission
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['session', 'attempted_at'], name='attempt_session_time_idx'),
+            models.Index(fields=['session', 'quiz', 'attempted_at'], name='attempt_session_quiz_time_idx'),
+        ]
 
     def __str__(self):
         return f"Attempt {self.id} for Quiz {self.quiz.id} by Session {self.session.id}"
@@ -61,5 +99,69 @@ class Goal(models.Model):
     status = models.CharField(max_length=50, default='pending') # e.g., 'pending', 'in progress', 'completed', 'failed'
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['session', 'created_at'], name='goal_session_created_idx'), # goals in the prompt
+            models.Index(fields=['deadline', 'created_at'], name='goal_deadline_created_idx'), # ListGoalsView
+        ]
+
+    def __str__(self):
+        return f"Goal {self.id}: {self.title} (Status: {self.status})"
+class QuizBatchJob(models.Model):
+    session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name='quiz_batch_jobs', null=True, blank=True)
+    status = models.CharField(max_length=20, default='pending') # 'pending', 'running', 'completed', 'failed'
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Quiz batch {self.id} (Status: {self.status})"
+
+class QuizBatchItem(models.Model):
+    job = models.ForeignKey(QuizBatchJob, on_delete=models.CASCADE, related_name='items')
+    message = models.ForeignKey(ChatMessage, on_delete=models.CASCADE, related_name='quiz_batch_items')
+    status = models.CharField(max_length=20, default='pending') # 'pending', 'running', 'completed', 'skipped', 'failed'
+    quiz = models.ForeignKey(Quiz, on_delete=models.SET_NULL, related_name='batch_items', null=True, blank=True)
+    cached = models.BooleanField(default=False) # Quiz cloned from the quiz generation cache
+    error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Batch {self.job_id} item for Message {self.message_id} (Status: {self.status})"
+
+# Attempt aggregates, updated in the same transaction as the attempts they count
+# (see utils/quiz_stats.py; rebuild with `manage.py rebuild_quiz_stats`)
+class SessionStats(models.Model):
+    session = models.OneToOneField(ChatSession, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    attempts = models.PositiveIntegerField(default=0)
+    graded = models.PositiveIntegerField(default=0) # attempts with is_correct set
+    correct = models.PositiveIntegerField(default=0)
+    submissions = models.PositiveIntegerField(default=0)
+    current_streak = models.PositiveIntegerField(default=0) # consecutive correct graded answers, latest first
+    best_streak = models.PositiveIntegerField(default=0)
+    last_attempt_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Stats for Session {self.session_id}: {self.correct}/{self.graded} correct"
+
+class QuizStats(models.Model):
+    quiz = models.OneToOneField(Quiz, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name='quiz_stats')
+    attempts = models.PositiveIntegerField(default=0)
+    graded = models.PositiveIntegerField(default=0)
+    correct = models.PositiveIntegerField(default=0)
+    submissions = models.PositiveIntegerField(default=0)
+    last_attempt_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Stats for Quiz {self.quiz_id}: {self.correct}/{self.graded} correct"
+
+class QuestionStats(models.Model):
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='question_stats')
+    attempts = models.PositiveIntegerField(default=0)
+    graded = models.PositiveIntegerField(default=0)
+    correct = models.PositiveIntegerField(default=0)
+    last_attempt_at = models.DateTimeField(null=True, blank=True)
+
     def __str__(self):
-        return f"Goal {self.id}: {self.title} (Status: {self.status})"
\ No newline at end of file
+        return f"Stats for Question {self.question_id}: {self.correct}/{self.graded} correct"
@@ -0,0 +1,46 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import MemoryEntry, Goal, ChatSession, Quiz, Question
+from .utils.memory import invalidate_memory_index
+from .utils.prompt_cache import bump_memory_version, bump_goals_version
+from .utils.response_cache import bump_version, bump_quiz_versions, quiz_resource, SESSIONS, GOALS
+
+
+@receiver([post_save, post_delete], sender=MemoryEntry)
+def invalidate_memory_prompt(sender, instance, **kwargs):
+    # Only core entries are part of the cached prompt prefix
+    if instance.is_core:
+        bump_memory_version()
+
+
+@receiver([post_save, post_delete], sender=MemoryEntry)
+def invalidate_memory_retrieval(sender, instance, **kwargs):
+    invalidate_memory_index()
+
+
+@receiver([post_save, post_delete], sender=Goal)
+def invalidate_goals_prompt(sender, instance, **kwargs):
+    if instance.session_id:
+        bump_goals_version(instance.session_id)
+
+
+@receiver([post_save, post_delete], sender=Goal)
+def invalidate_goals_response(sender, instance, **kwargs):
+    bump_version(GOALS)
+
+
+@receiver([post_save, post_delete], sender=ChatSession)
+def invalidate_sessions_response(sender, instance, **kwargs):
+    bump_version(SESSIONS)
+
+
+@receiver([post_save, post_delete], sender=Quiz)
+def invalidate_quiz_response(sender, instance, **kwargs):
+    bump_quiz_versions(instance.id, instance.session_id)
+
+
+@receiver([post_save, post_delete], sender=Question)
+def invalidate_question_response(sender, instance, **kwargs):
+    # Questions are only shown in their quiz's details
+    bump_version(quiz_resource(instance.quiz_id))
@@ -1,3 +1,1171 @@
-from django.test import TestCase
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.client import MULTIPART_CONTENT
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import views
+from .management.commands.load_test import build_pdf, SAMPLE_DOCUMENT
+from .management.commands.mock_llm_server import build_reply, hashed_embedding
+from .models import (
+    GlobalMemory, MemoryEntry, ChatSession, ChatMessage, Quiz, Question, UserQuizAttempt, Goal,
+    QuizBatchJob, QuizBatchItem, SessionStats, QuizStats, QuestionStats
+)
+from .utils import groq_utils, hedging, history, llm_admission, semantic_cache, sse, vectorstore
+from .utils.history import build_history_messages
+from .utils.llm_admission import (
+    AdmissionController, LLMOverloaded, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_QUIZ, TokenBucket
+)
+from .utils.memory import embed_pending_memories, get_core_profile, memory_hash, retrieve_relevant_memories
+from .utils.message_writer import StreamingMessageWriter
+from .utils.metrics import MetricsRegistry
+from .utils.prompt_cache import build_system_prompt_prefix
+from .utils.quiz_stats import rebuild_stats
+from .utils.stream_registry import StreamBuffer, parse_last_event_id, stream_registry
+from .utils.streaming_json import StreamingJSONParser
+from .utils.tokens import count_tokens
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite specific")
+class QueryPlanTests(TestCase):
+    """
+    The hot read paths must be served by an index: run each one, then EXPLAIN the SQL it issued
+    against the table it reads and fail on a full table scan or an ORDER BY sorted in a temp b-tree
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.session = ChatSession.objects.create()
+        cls.quiz = Quiz.objects.create(session=cls.session, title="Quiz")
+        Quiz.objects.create(session=cls.session, title="Other quiz")
+        question = Question.objects.create(quiz=cls.quiz, question_text="Q?", correct_answer="a", options=["a", "b"])
+        for number in range(3):
+            ChatMessage.objects.create(session=cls.session, message=f"message {number}", is_user=number % 2 == 0)
+            UserQuizAttempt.objects.create(session=cls.session, quiz=cls.quiz, question=question, user_answer="a", is_correct=True)
+            Goal.objects.create(session=cls.session, title=f"Goal {number}")
+
+    def assert_indexed(self, run, table):
+        with CaptureQueriesContext(connection) as captured:
+            run()
+        statements = [
+            query["sql"] for query in captured.captured_queries
+            if query["sql"].startswith("SELECT") and re.search(rf'\bFROM "{table}"', query["sql"])
+        ]
+        self.assertTrue(statements, f"no query on {table} was issued")
+        for sql in statements:
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                plan = [row[-1] for row in cursor.fetchall()]
+            for step in plan:
+                self.assertNotRegex(step, rf"^SCAN {table}$", f"full table scan:\n{sql}\n{plan}")
+                self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", step, f"unindexed sort:\n{sql}\n{plan}")
+
+    def test_session_history_page(self):
+        self.assert_indexed(lambda: self.client.get(f"/api/session/{self.session.id}/memory/"), "chat_backend_chatmessage")
+
+    def test_session_history_sync(self):
+        self.assert_indexed(lambda: self.client.get(f"/api/session/{self.session.id}/memory/?after=1"), "chat_backend_chatmessage")
+
+    def test_llm_history(self):
+        self.assert_indexed(lambda: build_history_messages(self.session, 1000, before_message_id=3), "chat_backend_chatmessage")
+
+    def test_quiz_attempts(self):
+        self.assert_indexed(lambda: self.client.get(f"/api/session/{self.session.id}/quiz_attempts/"), "chat_backend_userquizattempt")
+
+    def test_quiz_attempts_for_quiz(self):
+        self.assert_indexed(
+            lambda: self.client.get(f"/api/session/{self.session.id}/quiz_attempts/?quiz_id={self.quiz.id}"),
+            "chat_backend_userquizattempt"
+        )
+
+    def test_session_goals_in_prompt(self):
+        self.assert_indexed(lambda: build_system_prompt_prefix(self.session), "chat_backend_goal")
+
+    def test_goal_list(self):
+        self.assert_indexed(lambda: self.client.get("/api/goals/"), "chat_backend_goal")
+
+    def test_quiz_list_pages(self):
+        def run():
+            first = self.client.get("/api/quiz/?pagination=cursor&page_size=1").json()
+            self.client.get(first["next"])
+        self.assert_indexed(run, "chat_backend_quiz")
+
+
+# Fixture volumes for the query budget tests: large enough that a per-row query shows up as
+# hundreds of extra queries against the budget
+SEED_SESSIONS = 5
+SEED_MESSAGES = 300
+SEED_QUIZZES = 40
+SEED_QUESTIONS_PER_QUIZ = 8
+SEED_SUBMISSIONS_PER_QUIZ = 3
+SEED_GOALS = 50
+SEED_MEMORIES = 20
+
+
+class StubCompletions:
+    """Groq chat completions returning what the calling code expects (see mock_llm_server.build_reply)"""
+
+    def create(self, **kwargs):
+        reply = build_reply(kwargs.get("messages", []), 40)
+        if kwargs.get("stream"):
+            return iter([
+                SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+                for piece in re.findall(r"\S+\s*", reply)
+            ])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))])
+
+
+class StubGroq:
+    def __init__(self, **kwargs):
+        self.chat = SimpleNamespace(completions=StubCompletions())
+
+
+class StubEmbeddings:
+    def embed_documents(self, texts):
+        return [hashed_embedding(text, 64) for text in texts]
+
+    def embed_query(self, text):
+        return hashed_embedding(text, 64)
+
+
+class QueryCounter:
+    """
+    Count the SQL statements run on any connection while active, including connections opened
+    by worker threads (streamed answers are generated off the request thread)
+    """
+
+    def __init__(self):
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def _attach(self, sender, connection, **kwargs):
+        connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        connection_created.connect(self._attach)
+        for conn in connections.all():
+            conn.execute_wrappers.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self._attach)
+        for conn in connections.all():
+            if self in conn.execute_wrappers:
+                conn.execute_wrappers.remove(self)
+        with self._lock:
+            self.queries = list(self.queries)
+
+
+def seed_learning_data():
+    """A long-running learner: many sessions, a long chat history, quizzes with graded attempts and goals"""
+    GlobalMemory.objects.create(preferences="")
+    # Memories are embedded right after they are saved, so the seeded ones already are
+    MemoryEntry.objects.bulk_create([
+        MemoryEntry(content=text, content_hash=memory_hash(text), category="Preferences", is_core=number < 5,
+                    embedding=np.asarray(hashed_embedding(text, 64), dtype=np.float32).tobytes())
+        for number, text in enumerate(f"Learner note {number}: prefers worked examples about topic {number}" for number in range(SEED_MEMORIES))
+    ])
+
+    sessions = [ChatSession.objects.create() for _ in range(SEED_SESSIONS)]
+    session = sessions[0]
+    ChatMessage.objects.bulk_create([
+        ChatMessage(session=session, is_user=number % 2 == 0, message=f"Turn {number}: " + " ".join(SAMPLE_DOCUMENT[number % len(SAMPLE_DOCUMENT):][:2]))
+        for number in range(SEED_MESSAGES)
+    ])
+    messages = list(session.messages.order_by("id"))
+    answers = [message for message in messages if not message.is_user]
+    # Older turns are folded into the rolling summary, as they would be after a long session
+    ChatSession.objects.filter(id=session.id).update(history_summary="The learner studied photosynthesis.", summary_until_message_id=messages[-6].id)
+    session.refresh_from_db()
+
+    quizzes = Quiz.objects.bulk_create([Quiz(session=session, title=f"Quiz {number}", description="Seeded") for number in range(SEED_QUIZZES)])
+    quizzes.append(Quiz.objects.create(session=session, title="Practice", source="document", source_chunks=[0, 1, 2]))
+    Question.objects.bulk_create([
+        Question(quiz=quiz, question_text=f"Question {number}?", correct_answer="A", options=["A", "B", "C", "D"])
+        for quiz in quizzes for number in range(SEED_QUESTIONS_PER_QUIZ)
+    ])
+    for quiz, answer in zip(quizzes, answers):
+        answer.quiz = quiz
+    ChatMessage.objects.bulk_update(answers[:len(quizzes)], ["quiz"])
+
+    questions = list(Question.objects.order_by("id"))
+    UserQuizAttempt.objects.bulk_create([
+        UserQuizAttempt(session=session, quiz_id=question.quiz_id, question=question, user_answer="A" if (question.id + submission) % 3 else "B",
+                        is_correct=bool((question.id + submission) % 3), attempt_group=groups[question.quiz_id])
+        for submission in range(SEED_SUBMISSIONS_PER_QUIZ)
+        for groups in [{quiz.id: uuid.uuid4() for quiz in quizzes}]
+        for question in questions
+    ])
+    rebuild_stats()
+
+    now = timezone.now()
+    Goal.objects.bulk_create([
+        Goal(session=sessions[number % SEED_SESSIONS], title=f"Goal {number}", deadline=now + timedelta(days=number))
+        for number in range(SEED_GOALS)
+    ])
+
+    job = QuizBatchJob.objects.create(session=session, status="completed", finished_at=now)
+    QuizBatchItem.objects.bulk_create([
+        QuizBatchItem(job=job, message=answer, status="skipped", quiz=answer.quiz) for answer in answers[:10]
+    ])
+
+    return SimpleNamespace(
+        session=session,
+        quiz=quizzes[0],
+        questions=list(quizzes[0].questions.order_by("id")),
+        quizzed_answer=answers[0],
+        free_answer=answers[len(quizzes)],
+        goal=Goal.objects.filter(session=session).first(),
+        job=job
+    )
+
+
+class QueryBudgetMixin:
+    """
+    Call an endpoint, record its query count and response time, and fail if it needs more
+    queries than its budget. Budgets hold whatever the fixture volumes: a query per row
+    (N+1) overshoots them by hundreds.
+    """
+    timings = []
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        # Background work started by a request (answer producers, memory maintenance) must not
+        # outlive the test database it writes to
+        threads_before = set(threading.enumerate())
+        self.addCleanup(self.join_new_threads, threads_before)
+        self.storage_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.storage_dir, ignore_errors=True)
+        for patcher in (
+            mock.patch.object(views, "Groq", StubGroq),
+            mock.patch.object(vectorstore, "load_embedding_model", StubEmbeddings),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        settings_override = override_settings(
+            VECTOR_STORE_FILE=os.path.join(self.storage_dir, "vector_store.pkl"),
+            MEDIA_ROOT=self.storage_dir,
+            SSE_HEARTBEAT_INTERVAL=0
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def join_new_threads(self, threads_before):
+        for thread in set(threading.enumerate()) - threads_before:
+            thread.join(5)
+
+    def call(self, endpoint, budget, method, path, status=200, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        if "data" in kwargs and kwargs["content_type"] == "application/json":
+            kwargs["data"] = json.dumps(kwargs["data"])
+        with QueryCounter() as counter:
+            started_at = time.perf_counter()
+            response = getattr(self.client, method)(path, **kwargs)
+            if response.streaming:
+                response.content_bytes = b"".join(response.streaming_content)
+            elapsed_ms = (time.perf_counter() - started_at) * 1000
+        QueryBudgetMixin.timings.append((endpoint, len(counter.queries), budget, elapsed_ms))
+
+        self.assertEqual(response.status_code, status, getattr(response, "content_bytes", None) or response.content[:500])
+        self.assertLessEqual(
+            len(counter.queries), budget,
+            f"{endpoint} ran {len(counter.queries)} queries (budget {budget}):\n" + "\n".join(counter.queries)
+        )
+        return response
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if QueryBudgetMixin.timings:
+            sys.stderr.write(f"\n{'endpoint':<40}{'queries':>9}{'budget':>8}{'ms':>10}\n")
+            for endpoint, queries, budget, elapsed_ms in QueryBudgetMixin.timings:
+                sys.stderr.write(f"{endpoint:<40}{queries:>9}{budget:>8}{elapsed_ms:>10.1f}\n")
+            QueryBudgetMixin.timings.clear()
+
+
+class EndpointQueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_learning_data()
+
+    def test_memory(self):
+        self.call("GET memory/", 2, "get", "/api/memory/")
+        self.call("POST memory/", 4, "post", "/api/memory/", data={"preferences": "Likes diagrams"})
+        self.call("POST memory/init/ (exists)", 1, "post", "/api/memory/init/", status=400)
+
+    def test_memory_init(self):
+        GlobalMemory.objects.all().delete()
+        self.call("POST memory/init/", 8, "post", "/api/memory/init/", data={"preferences": "Visual learner\nPrefers short answers"})
+
+    def test_sessions(self):
+        self.call("POST session/create/", 1, "post", "/api/session/create/")
+        self.call("GET sessions/", 1, "get", "/api/sessions/")
+
+    def test_upload(self):
+        pdf = SimpleUploadedFile("notes.pdf", build_pdf(SAMPLE_DOCUMENT), content_type="application/pdf")
+        self.call("POST session/<id>/upload/", 2, "post", f"/api/session/{self.data.session.id}/upload/",
+                  data={"pdf": pdf}, content_type=MULTIPART_CONTENT)
+
+    def test_add_message(self):
+        self.call("POST session/<id>/message/", 3, "post", f"/api/session/{self.data.session.id}/message/",
+                  data={"message": "A note", "is_user": True, "quiz_id": self.data.quiz.id})
+
+    def test_session_history(self):
+        response = self.call("GET session/<id>/memory/", 2, "get", f"/api/session/{self.data.session.id}/memory/")
+        before = response.json()["before"]
+        self.call("GET session/<id>/memory/?before=", 2, "get", f"/api/session/{self.data.session.id}/memory/?before={before}")
+        self.call("GET session/<id>/memory/?after=", 2, "get", f"/api/session/{self.data.session.id}/memory/?after={before}")
+
+    def test_quiz_create_and_questions(self):
+        response = self.call("POST session/<id>/quiz/create/", 2, "post", f"/api/session/{self.data.session.id}/quiz/create/",
+                             data={"title": "New quiz"}, status=201)
+        questions = [{"question_text": f"Q{number}?", "options": ["A", "B"], "correct_answer": "A"} for number in range(10)]
+        self.call("POST quiz/<id>/questions/add/", 2, "post", f"/api/quiz/{response.json()['quiz_id']}/questions/add/",
+                  data={"questions": questions}, status=201)
+        self.call("POST quiz/questions/add/", 5, "post", "/api/quiz/questions/add/",
+                  data={"session_id": self.data.session.id, "title": "Combined", "questions": questions}, status=201)
+
+    def test_quiz_details(self):
+        self.call("GET quiz/<id>/", 3, "get", f"/api/quiz/{self.data.quiz.id}/")
+
+    def test_cached_polls(self):
+        quiz_path = f"/api/quiz/{self.data.quiz.id}/"
+        first = self.call("GET quiz/<id>/", 3, "get", quiz_path)
+        # Last-Modified only carries seconds: it is withheld until the second of the last write is over
+        self.assertNotIn("Last-Modified", first)
+        self.call("GET quiz/<id>/ (cached)", 0, "get", quiz_path)
+        self.call("GET quiz/<id>/ (If-None-Match)", 0, "get", quiz_path, status=304, HTTP_IF_NONE_MATCH=first["ETag"])
+        with mock.patch("time.time", return_value=time.time() + 2):
+            later = self.call("GET quiz/<id>/ (2s later)", 0, "get", quiz_path)
+            self.call("GET quiz/<id>/ (If-Modified-Since)", 0, "get", quiz_path, status=304,
+                      HTTP_IF_MODIFIED_SINCE=later["Last-Modified"])
+        self.call("POST quiz/<id>/questions/add/", 2, "post", f"{quiz_path}questions/add/",
+                  data={"questions": [{"question_text": "New?", "options": ["A", "B"], "correct_answer": "A"}]}, status=201)
+        changed = self.call("GET quiz/<id>/ (changed)", 3, "get", quiz_path, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertNotEqual(changed["ETag"], first["ETag"])
+        self.call("GET quiz/<id>/ (changed, If-Modified-Since)", 0, "get", quiz_path,
+                  HTTP_IF_MODIFIED_SINCE=later["Last-Modified"])
+
+        goals = self.call("GET goals/", 1, "get", "/api/goals/")
+        self.call("GET goals/ (If-None-Match)", 0, "get", "/api/goals/", status=304, HTTP_IF_NONE_MATCH=goals["ETag"])
+        self.call("PATCH goal/<id>/", 2, "patch", f"/api/goal/{self.data.goal.id}/", data={"status": "completed"})
+        self.call("GET goals/ (changed)", 1, "get", "/api/goals/", HTTP_IF_NONE_MATCH=goals["ETag"])
+
+        quizzes_path = f"/api/session/{self.data.session.id}/quizzes/"
+        quizzes = self.call("GET session/<id>/quizzes/", 2, "get", quizzes_path)
+        self.call("GET session/<id>/quizzes/ (If-None-Match)", 0, "get", quizzes_path, status=304,
+                  HTTP_IF_NONE_MATCH=quizzes["ETag"])
+        Quiz.objects.get(id=self.data.quiz.id).delete()
+        self.call("GET session/<id>/quizzes/ (changed)", 2, "get", quizzes_path, HTTP_IF_NONE_MATCH=quizzes["ETag"])
+        self.call("GET quiz/<id>/ (deleted)", 1, "get", quiz_path, status=404)
+
+        sessions = self.call("GET sessions/", 1, "get", "/api/sessions/")
+        self.call("GET sessions/ (If-None-Match)", 0, "get", "/api/sessions/", status=304, HTTP_IF_NONE_MATCH=sessions["ETag"])
+        self.call("POST session/create/", 1, "post", "/api/session/create/")
+        self.call("GET sessions/ (changed)", 1, "get", "/api/sessions/", HTTP_IF_NONE_MATCH=sessions["ETag"])
+
+    def test_submit_answers(self):
+        answers = [{"question_id": question.id, "user_answer": "A"} for question in self.data.questions]
+        self.call("POST quiz/<id>/submit/", 12, "post", f"/api/quiz/{self.data.quiz.id}/submit/", data={"answers": answers}, status=201)
+
+    def test_session_quizzes(self):
+        self.call("GET session/<id>/quizzes/", 2, "get", f"/api/session/{self.data.session.id}/quizzes/")
+        self.call("GET session/<id>/practice-quiz/", 3, "get", f"/api/session/{self.data.session.id}/practice-quiz/")
+
+    def test_quiz_attempts(self):
+        self.call("GET session/<id>/quiz_attempts/", 2, "get", f"/api/session/{self.data.session.id}/quiz_attempts/")
+        self.call("GET session/<id>/quiz_attempts/?quiz_id=", 2, "get",
+                  f"/api/session/{self.data.session.id}/quiz_attempts/?quiz_id={self.data.quiz.id}")
+
+    def test_stats(self):
+        self.call("GET session/<id>/stats/", 3, "get", f"/api/session/{self.data.session.id}/stats/")
+        self.call("GET quiz/<id>/stats/", 3, "get", f"/api/quiz/{self.data.quiz.id}/stats/")
+
+    def test_goals(self):
+        self.call("POST session/<id>/goal/create/", 2, "post", f"/api/session/{self.data.session.id}/goal/create/",
+                  data={"title": "Finish chapter 3", "deadline": "2030-01-01T00:00:00Z"}, status=201)
+        self.call("GET goals/", 1, "get", "/api/goals/")
+        goal_path = f"/api/goal/{self.data.goal.id}/"
+        self.call("GET goal/<id>/", 2, "get", goal_path)
+        self.call("PUT goal/<id>/", 2, "put", goal_path, data={"title": "Renamed", "status": "in progress"})
+        self.call("PATCH goal/<id>/", 2, "patch", goal_path, data={"status": "completed"})
+        self.call("DELETE goal/<id>/", 2, "delete", goal_path, status=204)
+
+    def test_generate_quiz(self):
+        path = f"/api/message/{self.data.free_answer.id}/generate-quiz/"
+        self.call("POST message/<id>/generate-quiz/", 14, "post", path, status=201)
+        self.call("POST message/<id>/generate-quiz/ (exists)", 2, "post", path, status=400)
+
+    def test_generate_quiz_stream(self):
+        self.call("POST message/<id>/generate-quiz/stream/", 19, "post", f"/api/message/{self.data.free_answer.id}/generate-quiz/stream/")
+
+    def test_quiz_list(self):
+        self.call("GET quiz/", 2, "get", "/api/quiz/?page_size=20")
+        self.call("GET quiz/?page=", 2, "get", "/api/quiz/?page=2&page_size=20")
+        response = self.call("GET quiz/?pagination=cursor", 1, "get", "/api/quiz/?pagination=cursor&page_size=20")
+        self.call("GET quiz/?cursor=", 1, "get", response.json()["next"])
+
+    def test_quiz_batch(self):
+        # Every message already has a quiz, so the job completes without starting a worker thread
+        message_ids = list(ChatMessage.objects.filter(quiz__isnull=False).values_list("id", flat=True)[:20])
+        self.call("POST quiz/batch/", 8, "post", "/api/quiz/batch/", data={"message_ids": message_ids}, status=202)
+        self.call("GET quiz/batch/<id>/", 2, "get", f"/api/quiz/batch/{self.data.job.id}/")
+
+    def test_quiz_batch_rejects_messages_of_another_session(self):
+        own = ChatMessage.objects.filter(session=self.data.session, quiz__isnull=False).first()
+        foreign = ChatMessage.objects.create(session=ChatSession.objects.create(), message="Answer", is_user=False, quiz=own.quiz)
+        jobs_before = QuizBatchJob.objects.count()
+
+        response = self.call(
+            "POST quiz/batch/ (foreign message)", 1, "post", "/api/quiz/batch/",
+            data={"session_id": self.data.session.id, "message_ids": [own.id, foreign.id]}, status=400
+        )
+        self.assertEqual(response.json()["message_ids"], [foreign.id])
+        self.assertEqual(QuizBatchJob.objects.count(), jobs_before)
+
+        response = self.call(
+            "POST quiz/batch/ (own messages)", 8, "post", "/api/quiz/batch/",
+            data={"session_id": str(self.data.session.id), "message_ids": [own.id]}, status=202
+        )
+        self.assertEqual([item["message_id"] for item in response.json()["items"]], [own.id])
+
+    def test_metrics(self):
+        self.call("GET metrics/", 0, "get", "/api/metrics/")
+
+
+class StreamingQueryBudgetTests(QueryBudgetMixin, TransactionTestCase):
+    """Chat answers are generated in a worker thread, which must see committed fixtures"""
+
+    def setUp(self):
+        super().setUp()
+        self.data = seed_learning_data()
+
+    def test_rag_stream_and_resume(self):
+        path = f"/api/session/{self.data.session.id}/rag/stream/"
+        response = self.call("POST session/<id>/rag/stream/", 13, "post", path, data={"query": "Explain the Calvin cycle"})
+        final = json.loads(response.content_bytes.decode().strip().split("data: ")[-1])
+        self.assertTrue(final["done"])
+        self.assertNotIn("error", final)
+        stream_id = response["X-Stream-Id"]
+        self.call("GET session/<id>/rag/stream/<stream_id>/", 0, "get", f"{path}{stream_id}/?last_event_id={stream_id}:1")
+
+
+class HistoryTests(TestCase):
+
+    def setUp(self):
+        self.session = ChatSession.objects.create()
+        self.messages = [
+            ChatMessage.objects.create(session=self.session, message=f"Turn {number}: " + "word " * 20, is_user=number % 2 == 0)
+            for number in range(6)
+        ]
+
+    def cost(self, message):
+        return count_tokens(message.message) + history.MESSAGE_TOKEN_OVERHEAD
+
+    def test_budget_cutoff_keeps_newest_messages(self):
+        budget = sum(self.cost(message) for message in self.messages[-3:])
+        result = build_history_messages(self.session, budget)
+        self.assertEqual([m["content"] for m in result], [message.message for message in self.messages[-3:]])
+        self.assertEqual([m["role"] for m in result], ["assistant", "user", "assistant"])
+
+        result = build_history_messages(self.session, budget - 1)
+        self.assertEqual([m["content"] for m in result], [message.message for message in self.messages[-2:]])
+
+    def test_current_and_incomplete_messages_are_excluded(self):
+        current = self.messages[-1]
+        ChatMessage.objects.filter(id=self.messages[-2].id).update(is_complete=False)
+        result = build_history_messages(self.session, 10000, before_message_id=current.id)
+        self.assertEqual([m["content"] for m in result], [message.message for message in self.messages[:-2]])
+
+    def test_summary_never_exceeds_budget(self):
+        self.session.history_summary = "summary " * 500
+        result = build_history_messages(self.session, 100)
+        used = sum(count_tokens(m["content"]) + history.MESSAGE_TOKEN_OVERHEAD for m in result)
+        self.assertLessEqual(used, 100)
+        self.assertEqual(result[0]["role"], "system")
+
+    def test_refresh_does_not_overwrite_a_newer_summary(self):
+        newer_until = self.messages[3].id
+
+        def concurrent_refresh(previous_summary, transcript, groq_client):
+            # Another refresh finishes while this one waits for the LLM
+            ChatSession.objects.filter(id=self.session.id).update(history_summary="newer", summary_until_message_id=newer_until)
+            return "stale"
+
+        with mock.patch.object(history, "summarize_conversation", concurrent_refresh), \
+                mock.patch.object(history, "connections"):
+            history._refresh_summary(self.session.id, self.messages[2].id, groq_client=None)
+
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.history_summary, "newer")
+        self.assertEqual(self.session.summary_until_message_id, newer_until)
+
+    def test_refresh_folds_complete_turns_only(self):
+        ChatMessage.objects.filter(id=self.messages[1].id).update(is_complete=False)
+        transcripts = []
+
+        def summarize(previous_summary, transcript, groq_client):
+            transcripts.append(transcript)
+            return "summary"
+
+        with mock.patch.object(history, "summarize_conversation", summarize), \
+                mock.patch.object(history, "connections"):
+            history._refresh_summary(self.session.id, self.messages[3].id, groq_client=None)
+
+        self.assertNotIn("Turn 1:", transcripts[0])
+        self.assertIn("Turn 2:", transcripts[0])
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.summary_until_message_id, self.messages[2].id)
+
+
+class FakeVectorStore:
+    """Every session has the same document, so semantic cache entries are shared between them"""
+    embedding_model = StubEmbeddings()
+
+    def get_pdf_info(self, pdf_id):
+        return {"content_hash": "shared-document"}
+
+    def embed_query(self, text):
+        vector = np.asarray(hashed_embedding(text, 64), dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+
+
+@override_settings(SEMANTIC_CACHE_ENABLED=True, LLM_HEDGING_ENABLED=False)
+class SemanticCacheTests(TestCase):
+
+    def setUp(self):
+        for patcher in (
+            mock.patch.object(groq_utils, "get_vector_store", FakeVectorStore),
+            mock.patch.object(groq_utils, "get_rag_context", lambda *args, **kwargs: "Photosynthesis happens in chloroplasts."),
+            mock.patch.object(groq_utils, "schedule_memory_maintenance", lambda *args: None),
+            mock.patch.object(semantic_cache, "_semantic_cache", None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        cache.clear()
+
+    def ask(self, session, query):
+        chunks = list(groq_utils.generate_streaming_assistant_response(query, session.id, StubGroq()))
+        final = chunks[-1]
+        self.assertTrue(final["done"], final)
+        return final["metadata"]["cached"]
+
+    def test_opening_question_is_reused(self):
+        self.assertFalse(self.ask(ChatSession.objects.create(), "What is photosynthesis?"))
+        self.assertTrue(self.ask(ChatSession.objects.create(), "What is photosynthesis?"))
+
+    def test_follow_up_is_not_served_from_another_conversation(self):
+        self.assertFalse(self.ask(ChatSession.objects.create(), "Explain that in more detail"))
+
+        session = ChatSession.objects.create()
+        ChatMessage.objects.create(session=session, message="What is the Calvin cycle?", is_user=True)
+        ChatMessage.objects.create(session=session, message="The Calvin cycle fixes carbon.", is_user=False)
+        self.assertFalse(self.ask(session, "Explain that in more detail"))
+
+
+def paced(*steps):
+    """Source yielding chunk dicts, sleeping wherever a step is a number of seconds"""
+    for step in steps:
+        if isinstance(step, (int, float)):
+            time.sleep(step)
+        else:
+            yield step
+
+
+def sse_data(event):
+    return json.loads(event[len("data: "):])
+
+
+class SseTests(SimpleTestCase):
+
+    def test_text_deltas_are_merged_up_to_max_bytes(self):
+        source = [{"chunk": "abcd", "done": False} for _ in range(5)] + [{"chunk": "", "done": True}]
+        events = list(sse.stream_sse(iter(source), max_bytes=8, max_delay=60, heartbeat_interval=0))
+        self.assertEqual([sse_data(event) for event in events], [
+            {"chunk": "abcdabcd", "done": False},
+            {"chunk": "abcdabcd", "done": False},
+            {"chunk": "abcd", "done": False},
+            {"chunk": "", "done": True},
+        ])
+
+    def test_buffer_is_flushed_once_it_is_max_delay_old(self):
+        source = paced({"chunk": "first", "done": False}, 0.3, {"chunk": "second", "done": False}, {"done": True})
+        events = list(sse.stream_sse(source, max_bytes=1000, max_delay=0.05, threaded=True))
+        self.assertEqual([sse_data(event).get("chunk") for event in events], ["first", "second", None])
+
+    def test_keep_alive_while_the_source_is_quiet(self):
+        source = paced(0.3, {"chunk": "late", "done": False}, {"done": True})
+        events = list(sse.stream_sse(source, max_bytes=1000, max_delay=60, heartbeat_interval=0.05))
+        self.assertGreaterEqual(events.count(sse.KEEP_ALIVE), 2)
+        self.assertEqual(events[-2:], [sse.format_sse({"chunk": "late", "done": False}), sse.format_sse({"done": True})])
+
+    def test_no_keep_alive_while_text_is_buffered(self):
+        source = paced({"chunk": "held", "done": False}, 0.3, {"done": True})
+        events = list(sse.stream_sse(source, max_bytes=1000, max_delay=60, heartbeat_interval=0.05))
+        self.assertNotIn(sse.KEEP_ALIVE, events)
+        self.assertEqual(events, [sse.format_sse({"chunk": "held", "done": False}), sse.format_sse({"done": True})])
+
+    def test_buffer_is_flushed_before_done_and_iteration_stops(self):
+        source = iter([
+            {"chunk": "partial ", "done": False},
+            {"chunk": "answer", "done": False},
+            {"chunk": "", "done": True, "metadata": {"message_id": 7}},
+            {"chunk": "never sent", "done": False},
+        ])
+        events = list(sse.stream_sse(source, max_bytes=1000, max_delay=60, heartbeat_interval=0))
+        self.assertEqual(events, [
+            sse.format_sse({"chunk": "partial answer", "done": False}),
+            sse.format_sse({"chunk": "", "done": True, "metadata": {"message_id": 7}}),
+        ])
+        self.assertEqual(next(source)["chunk"], "never sent")
+
+    def test_buffer_is_flushed_before_an_error(self):
+        source = paced({"chunk": "so far", "done": False}, {"error": "overloaded", "done": True})
+        events = list(sse.stream_sse(source, max_bytes=1000, max_delay=60, threaded=True))
+        self.assertEqual(events, [
+            sse.format_sse({"chunk": "so far", "done": False}),
+            sse.format_sse({"error": "overloaded", "done": True}),
+        ])
+
+    def test_source_exception_propagates_from_the_worker_thread(self):
+        def failing():
+            yield {"chunk": "x", "done": False}
+            raise RuntimeError("source failed")
+
+        with self.assertRaisesMessage(RuntimeError, "source failed"):
+            list(sse.stream_sse(failing(), max_bytes=1000, max_delay=60, threaded=True))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class AdmissionControllerTests(SimpleTestCase):
+
+    def wait_until_queued(self, controller, count):
+        deadline = time.monotonic() + 5
+        while controller.stats()["queued"] < count:
+            self.assertLess(time.monotonic(), deadline, "callers never queued")
+            time.sleep(0.005)
+
+    def test_waiters_are_admitted_by_priority_then_arrival(self):
+        controller = AdmissionController(max_in_flight=1)
+        controller.acquire(PRIORITY_INTERACTIVE)
+        admitted = []
+
+        def call(name, priority):
+            controller.acquire(priority)
+            admitted.append(name)
+            controller.release()
+
+        threads = []
+        for name, priority in [
+            ("summary", PRIORITY_BACKGROUND), ("quiz", PRIORITY_QUIZ), ("chat", PRIORITY_INTERACTIVE),
+            ("extraction", PRIORITY_BACKGROUND), ("second chat", PRIORITY_INTERACTIVE),
+        ]:
+            thread = threading.Thread(target=call, args=(name, priority))
+            thread.start()
+            threads.append(thread)
+            self.wait_until_queued(controller, len(threads))
+
+        controller.release()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(admitted, ["chat", "second chat", "quiz", "summary", "extraction"])
+        self.assertEqual(controller.stats(), {"in_flight": 0, "queued": 0, "tokens_available": None})
+
+    def test_full_queue_sheds_newcomers_that_do_not_outrank_a_waiter(self):
+        controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=5)
+        controller.acquire(PRIORITY_INTERACTIVE)
+        outcome = []
+
+        def background_call():
+            try:
+                controller.acquire(PRIORITY_BACKGROUND)
+                outcome.append("admitted")
+            except LLMOverloaded:
+                outcome.append("shed")
+
+        waiter = threading.Thread(target=background_call)
+        waiter.start()
+        self.wait_until_queued(controller, 1)
+
+        with self.assertRaises(LLMOverloaded) as shed:
+            controller.acquire(PRIORITY_BACKGROUND)
+        self.assertEqual(shed.exception.retry_after, 5)
+
+        # An interactive call displaces the queued background call instead
+        chat = threading.Thread(target=controller.acquire, args=(PRIORITY_INTERACTIVE,))
+        chat.start()
+        waiter.join(5)
+        self.assertEqual(outcome, ["shed"])
+        controller.release()
+        chat.join(5)
+        self.assertEqual(controller.stats()["in_flight"], 1)
+
+    def test_queue_timeout_sheds_the_waiter(self):
+        controller = AdmissionController(max_in_flight=1, queue_timeout=0.05)
+        controller.acquire(PRIORITY_INTERACTIVE)
+        with self.assertRaisesMessage(LLMOverloaded, "Timed out"):
+            controller.acquire(PRIORITY_INTERACTIVE)
+        self.assertEqual(controller.stats()["queued"], 0)
+
+    def test_token_bucket_refills_continuously_up_to_capacity(self):
+        clock = FakeClock()
+        with mock.patch.object(llm_admission.time, "monotonic", clock):
+            bucket = TokenBucket(tokens_per_minute=600)
+            bucket.consume(600)
+            self.assertEqual(bucket.delay_for(100), 10.0)
+            clock.now += 4
+            self.assertAlmostEqual(bucket.delay_for(100), 6.0)
+            clock.now += 6
+            self.assertEqual(bucket.delay_for(100), 0.0)
+            clock.now += 3600
+            self.assertEqual(bucket.delay_for(600), 0.0)
+            self.assertGreater(bucket.delay_for(601), 0.0)
+            bucket.drain()
+            self.assertEqual(bucket.delay_for(10), 1.0)
+
+    def test_token_budget_delays_admission(self):
+        controller = AdmissionController(max_in_flight=4, tokens_per_minute=6000, queue_timeout=5)
+        controller.acquire(PRIORITY_INTERACTIVE, tokens=6000)
+        controller.release()
+        started_at = time.monotonic()
+        controller.acquire(PRIORITY_INTERACTIVE, tokens=10)  # 10 tokens refill in 0.1s
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.08)
+        controller.release()
+
+
+class OverloadedStreamTests(TestCase):
+
+    def setUp(self):
+        for patcher in (
+            mock.patch.object(groq_utils, "get_vector_store", FakeVectorStore),
+            mock.patch.object(groq_utils, "get_rag_context", lambda *args, **kwargs: "Photosynthesis happens in chloroplasts."),
+            mock.patch.object(groq_utils, "schedule_memory_maintenance", lambda *args: None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        cache.clear()
+
+    @override_settings(LLM_HEDGING_ENABLED=False)
+    def test_shed_call_becomes_an_overloaded_sse_error(self):
+        controller = AdmissionController(max_in_flight=1, queue_timeout=0.05)
+        controller.acquire(PRIORITY_INTERACTIVE)
+        session = ChatSession.objects.create()
+        with mock.patch.object(llm_admission, "_controller", controller):
+            events = list(sse.stream_sse(
+                groq_utils.generate_streaming_assistant_response("What is photosynthesis?", session.id, StubGroq()),
+                heartbeat_interval=0
+            ))
+
+        self.assertEqual(len(events), 1)
+        error = json.loads(events[0][len("data: "):])
+        self.assertEqual(error["error_type"], "overloaded")
+        self.assertEqual(error["retry_after"], 0.05)
+        self.assertTrue(error["done"])
+        # The unanswered question is dropped so the client's retry does not duplicate it
+        self.assertFalse(ChatMessage.objects.filter(session=session).exists())
+
+
+class SlowStream:
+    """Upstream stream whose first token arrives after a delay; close() aborts it like an HTTP response"""
+
+    def __init__(self, text, delay):
+        self.text = text
+        self.delay = delay
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        if self.closed.wait(self.delay):
+            return
+        for piece in re.findall(r"\S+\s*", self.text):
+            if self.closed.is_set():
+                return
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+    def close(self):
+        self.closed.set()
+
+
+class DelayedCompletions:
+    """Streaming completions answering per model after a delay, or raising when the behaviour is an exception"""
+
+    def __init__(self, behaviours):
+        self.behaviours = behaviours
+        self.streams = {}
+
+    def create(self, **kwargs):
+        model = kwargs["model"]
+        behaviour = self.behaviours[model]
+        if isinstance(behaviour, Exception):
+            raise behaviour
+        self.streams[model] = SlowStream(f"Answer from {model}.", behaviour)
+        return self.streams[model]
+
+
+class DelayedGroq:
+    def __init__(self, **behaviours):
+        self.chat = SimpleNamespace(completions=DelayedCompletions(behaviours))
+
+
+def stream_text(stream):
+    return "".join(chunk.choices[0].delta.content for chunk in stream)
+
+
+@override_settings(LLM_HEDGE_DEFAULT_DELAY=0.05, LLM_HEDGE_MIN_DELAY=0.01)
+class HedgingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.budget = hedging.HedgeBudget(ratio=0.0, burst=1)
+        for patcher in (
+            mock.patch.object(hedging, "_budget", self.budget),
+            mock.patch.object(hedging, "metrics_registry", MetricsRegistry()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def hedged(self, client):
+        return hedging.hedged_completion(client, PRIORITY_INTERACTIVE, hedge_model="fast", model="slow", messages=[])
+
+    def test_slow_primary_is_hedged_and_cancelled(self):
+        client = DelayedGroq(slow=10, fast=0)
+        started_at = time.monotonic()
+        self.assertEqual(stream_text(self.hedged(client)), "Answer from fast.")
+        self.assertLess(time.monotonic() - started_at, 5)
+
+        streams = client.chat.completions.streams
+        self.assertTrue(streams["slow"].closed.wait(5), "the losing request was not aborted")
+        self.assertTrue(streams["fast"].closed.is_set())
+        self.assertFalse(self.budget.try_spend())
+
+    def test_fast_primary_is_not_hedged(self):
+        client = DelayedGroq(slow=0, fast=0)
+        self.assertEqual(stream_text(self.hedged(client)), "Answer from slow.")
+        self.assertEqual(list(client.chat.completions.streams), ["slow"])
+        self.assertTrue(self.budget.try_spend())
+
+    def test_failed_primary_fails_over_to_the_hedge(self):
+        client = DelayedGroq(slow=RuntimeError("upstream 500"), fast=0)
+        self.assertEqual(stream_text(self.hedged(client)), "Answer from fast.")
+
+    def test_exhausted_budget_stops_hedging(self):
+        client = DelayedGroq(slow=0.3, fast=0)
+        self.assertEqual(stream_text(self.hedged(client)), "Answer from fast.")
+
+        client = DelayedGroq(slow=0.3, fast=0)
+        self.assertEqual(stream_text(self.hedged(client)), "Answer from slow.")
+        self.assertEqual(list(client.chat.completions.streams), ["slow"])
+
+        # Failover needs the budget too, so the primary's error is raised as is
+        client = DelayedGroq(slow=RuntimeError("upstream 500"), fast=0)
+        with self.assertRaisesMessage(RuntimeError, "upstream 500"):
+            self.hedged(client)
+        self.assertEqual(list(client.chat.completions.streams), [])
+
+    @override_settings(LLM_HEDGE_DEFAULT_DELAY=2.0, LLM_HEDGE_MIN_SAMPLES=20, LLM_HEDGE_MIN_DELAY=0.5, LLM_HEDGE_MAX_DELAY=5.0)
+    def test_hedge_delay_follows_observed_ttft(self):
+        self.assertEqual(hedging.get_hedge_delay(), 2.0)
+        for _ in range(19):
+            hedging.metrics_registry.observe("chat.llm_ttft", 0.9)
+        self.assertEqual(hedging.get_hedge_delay(), 2.0)
+        hedging.metrics_registry.observe("chat.llm_ttft", 0.9)
+        self.assertEqual(hedging.get_hedge_delay(), 1.0)
+        for _ in range(1000):
+            hedging.metrics_registry.observe("chat.llm_ttft", 0.001)
+        self.assertEqual(hedging.get_hedge_delay(), 0.5)
+        for _ in range(20000):
+            hedging.metrics_registry.observe("chat.llm_ttft", 20)
+        self.assertEqual(hedging.get_hedge_delay(), 5.0)
+
+
+def event_seqs(events):
+    return [int(re.match(r"id: \w+:(\d+)\n", event).group(1)) for event in events]
+
+
+class StreamReplayTests(TestCase):
+
+    def finished_buffer(self, count, max_events):
+        buffer = StreamBuffer(1, max_events)
+        for number in range(count):
+            buffer.append(sse.format_sse({"chunk": f"{number} ", "done": False}))
+        buffer.finish()
+        return buffer
+
+    def start_stream(self, session_id, chunks):
+        buffer = stream_registry.start(session_id, iter(chunks))
+        self.addCleanup(stream_registry._streams.pop, buffer.stream_id, None)
+        list(buffer.subscribe(heartbeat_interval=0))  # wait until the producer has finished
+        return buffer
+
+    def test_resume_within_the_ring_replays_the_missing_events(self):
+        buffer = self.finished_buffer(5, max_events=3)
+        self.assertEqual(event_seqs(buffer.subscribe(after_seq=2)), [3, 4, 5])
+        self.assertEqual(list(buffer.subscribe(after_seq=5)), [])
+
+    def test_resume_after_the_ring_wrapped_reports_a_gap(self):
+        buffer = self.finished_buffer(5, max_events=3)
+        for after_seq in (0, 1):
+            events = list(buffer.subscribe(after_seq=after_seq))
+            self.assertEqual(len(events), 1)
+            error = json.loads(events[0][len("data: "):])
+            self.assertEqual(error["error_type"], "replay_unavailable")
+            self.assertTrue(error["done"])
+
+    def test_live_tail_sends_keep_alives_until_the_answer_is_done(self):
+        buffer = StreamBuffer(1, 10)
+        subscriber = buffer.subscribe(heartbeat_interval=0.02)
+        self.assertEqual(next(subscriber), sse.KEEP_ALIVE)
+        buffer.append(sse.format_sse({"chunk": "", "done": True}))
+        buffer.finish()
+        self.assertEqual(event_seqs(subscriber), [1])
+
+    def test_parse_last_event_id(self):
+        self.assertEqual(parse_last_event_id("abc123:7"), ("abc123", 7))
+        self.assertEqual(parse_last_event_id(" 7 "), (None, 7))
+        for malformed in (None, "", "abc123:", "abc123:seven", "7.5", "abc123:-3", "-1"):
+            self.assertEqual(parse_last_event_id(malformed), (None, 0), malformed)
+
+    def test_malformed_last_event_id_replays_from_the_start(self):
+        buffer = self.start_stream(1, [{"chunk": "Hello ", "done": False}, {"chunk": "", "done": True}])
+        path = f"/api/session/1/rag/stream/{buffer.stream_id}/"
+        for malformed in ("garbage", f"{buffer.stream_id}:-4"):
+            response = self.client.get(path, HTTP_LAST_EVENT_ID=malformed)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(event_seqs(b"".join(response.streaming_content).decode().split("\n\n")[:-1]), [1, 2])
+
+        response = self.client.get(path, HTTP_LAST_EVENT_ID="0123456789abcdef:1")
+        self.assertEqual(response.status_code, 400)
+
+    def test_finished_stream_expires_after_the_replay_ttl(self):
+        buffer = self.start_stream(1, [{"chunk": "", "done": True}])
+        path = f"/api/session/1/rag/stream/{buffer.stream_id}/"
+        response = self.client.get(path, HTTP_LAST_EVENT_ID=f"{buffer.stream_id}:1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"")
+
+        self.assertEqual(self.client.get(f"/api/session/2/rag/stream/{buffer.stream_id}/").status_code, 404)
+
+        buffer.finished_at -= 301
+        with override_settings(SSE_REPLAY_TTL=300):
+            self.start_stream(1, [{"chunk": "", "done": True}])
+        self.assertIsNone(stream_registry.get(buffer.stream_id))
+        self.assertEqual(self.client.get(path).status_code, 404)
+
+
+class MemoryUpdateTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.post("/api/memory/init/", data={"preferences": "Visual learner\nPrefers short answers"}, content_type="application/json")
+
+    def test_update_adds_one_retrievable_entry_per_line(self):
+        response = self.client.post(
+            "/api/memory/", data={"preferences": "Studies biology\n\n  Exam on Friday  \n"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+
+        entries = list(MemoryEntry.objects.order_by("id").values_list("content", "category", "is_core"))
+        self.assertEqual(entries, [
+            ("Visual learner", "Preferences", True),
+            ("Prefers short answers", "Preferences", True),
+            ("Studies biology", "", False),
+            ("Exam on Friday", "", False),
+        ])
+        self.assertEqual(get_core_profile(), "- Visual learner\n- Prefers short answers")
+
+        # Non-core entries are ranked per turn once embedded
+        embed_pending_memories(StubEmbeddings())
+        query = np.asarray(hashed_embedding("Exam on Friday", 64), dtype=np.float32)
+        memories = retrieve_relevant_memories(query / np.linalg.norm(query))
+        self.assertEqual(memories[0][1], "Exam on Friday")
+
+    def test_core_update_joins_the_core_profile(self):
+        self.client.post(
+            "/api/memory/", data={"preferences": "Answer in French\nUse metric units", "core": True}, content_type="application/json"
+        )
+        self.assertEqual(
+            get_core_profile(),
+            "- Visual learner\n- Prefers short answers\n- Answer in French\n- Use metric units"
+        )
+        self.assertEqual(self.client.get("/api/memory/").json()["preferences"].splitlines()[-1], "Use metric units")
+
+
+class AbandonedMessageTests(TestCase):
+
+    def placeholder(self, session, text, age):
+        message = ChatMessage.objects.create(session=session, message=text, is_user=False, is_complete=False)
+        ChatMessage.objects.filter(id=message.id).update(created_at=timezone.now() - timedelta(seconds=age))
+        return message.id
+
+    @override_settings(CHAT_ABANDONED_MESSAGE_AGE=600)
+    def test_new_stream_closes_placeholders_of_dead_writers(self):
+        session = ChatSession.objects.create()
+        other_session = ChatSession.objects.create()
+        empty = self.placeholder(session, "", 3600)
+        partial = self.placeholder(session, "Photosynthesis turns light", 3600)
+        live = self.placeholder(session, "Still streaming", 5)
+        elsewhere = self.placeholder(other_session, "", 3600)
+
+        writer = StreamingMessageWriter(session)
+
+        self.assertFalse(ChatMessage.objects.filter(id=empty).exists())
+        self.assertTrue(ChatMessage.objects.get(id=partial).is_complete)
+        self.assertFalse(ChatMessage.objects.get(id=live).is_complete)
+        self.assertFalse(ChatMessage.objects.get(id=elsewhere).is_complete)
+        self.assertFalse(ChatMessage.objects.get(id=writer.message.id).is_complete)
+        # The recovered partial answer is history again
+        history_messages = build_history_messages(session, 1000, before_message_id=writer.message.id)
+        self.assertEqual([message["content"] for message in history_messages], ["Photosynthesis turns light"])
+
+
+QUIZ_JSON = (
+    '{"title": "Cells {and} \\"organelles\\"", "count": 2, "final": true, "questions": ['
+    '{"question_text": "What does the \\\\ mitochondrion {do}?", "correct_answer": "Makes ATP \\u2013 energy"}, '
+    '{"question_text": "Where is DNA kept]?", "options": ["Nucleus", "Ribosome}"]}'
+    ']}'
+)
+QUIZ_EVENTS = [
+    ("field", "title", 'Cells {and} "organelles"'),
+    ("field", "count", 2),
+    ("field", "final", True),
+    ("item", "questions", {"question_text": "What does the \\ mitochondrion {do}?", "correct_answer": "Makes ATP – energy"}),
+    ("item", "questions", {"question_text": "Where is DNA kept]?", "options": ["Nucleus", "Ribosome}"]}),
+]
+
+
+def parse_in_pieces(text, *boundaries):
+    parser = StreamingJSONParser()
+    events = []
+    start = 0
+    for end in list(boundaries) + [len(text)]:
+        events += parser.feed(text[start:end])
+        start = end
+    return events
+
+
+class StreamingJSONParserTests(SimpleTestCase):
+
+    def test_whole_object(self):
+        self.assertEqual(parse_in_pieces(QUIZ_JSON), QUIZ_EVENTS)
+
+    def test_every_chunk_boundary(self):
+        # Covers splits inside keys, strings, escape sequences (\\", \\\\, \\u2013) and numbers
+        for boundary in range(1, len(QUIZ_JSON)):
+            self.assertEqual(parse_in_pieces(QUIZ_JSON, boundary), QUIZ_EVENTS, f"split at {boundary}: {QUIZ_JSON[boundary - 5:boundary + 5]!r}")
+
+    def test_one_character_at_a_time(self):
+        self.assertEqual(parse_in_pieces(QUIZ_JSON, *range(1, len(QUIZ_JSON))), QUIZ_EVENTS)
+
+    def test_escaped_quote_split_from_its_backslash(self):
+        text = '{"title": "say \\"hi\\" {"}'
+        boundary = text.index('\\"') + 1
+        self.assertEqual(parse_in_pieces(text, boundary), [("field", "title", 'say "hi" {')])
+
+    def test_prose_and_code_fence_around_the_object(self):
+        text = "Sure! Here is your quiz:\n```json\n" + QUIZ_JSON + "\n```\nLet me know if you want {more}."
+        self.assertEqual(parse_in_pieces(text, 10, 30, 200), QUIZ_EVENTS)
+
+    def test_truncated_final_object_keeps_everything_before_it(self):
+        cut = QUIZ_JSON.index('"options"')
+        events = parse_in_pieces(QUIZ_JSON[:cut], 50)
+        self.assertEqual(events, QUIZ_EVENTS[:4])
+
+    def test_malformed_item_is_skipped(self):
+        text = '{"questions": [{"question_text": "A"}, {"question_text": oops}, {"question_text": "C"}]}'
+        self.assertEqual(parse_in_pieces(text), [
+            ("item", "questions", {"question_text": "A"}),
+            ("item", "questions", {"question_text": "C"}),
+        ])
+
+    def test_text_after_the_root_object_is_ignored(self):
+        parser = StreamingJSONParser()
+        self.assertEqual(parser.feed('{"count": 1}'), [("field", "count", 1)])
+        self.assertEqual(parser.feed(' {"count": 2}'), [])
+        self.assertTrue(parser.done)
+
+
+def stats_snapshot():
+    return {
+        model.__name__: list(model.objects.order_by("pk").values())
+        for model in (SessionStats, QuizStats, QuestionStats)
+    }
+
+
+class QuizStatsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.sessions = [ChatSession.objects.create(), ChatSession.objects.create()]
+        self.quizzes = []
+        for session in self.sessions:
+            quiz = Quiz.objects.create(session=session, title="Cells")
+            questions = [
+                Question.objects.create(quiz=quiz, question_text="Energy of the cell?", correct_answer="ATP"),
+                Question.objects.create(quiz=quiz, question_text="Explain osmosis", correct_answer=""),
+                Question.objects.create(quiz=quiz, question_text="Where is DNA?", correct_answer="Nucleus"),
+            ]
+            self.quizzes.append((quiz, questions))
+
+    def submit(self, quiz_number, *answers):
+        quiz, questions = self.quizzes[quiz_number]
+        response = self.client.post(f"/api/quiz/{quiz.id}/submit/", data={"answers": [
+            {"question_id": questions[index].id, "user_answer": answer} for index, answer in answers
+        ]}, content_type="application/json")
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_incremental_stats_match_a_rebuild(self):
+        self.submit(0, (0, "atp "), (1, "Water moves"), (2, "Ribosome"))
+        self.submit(1, (0, "ADP"), (2, "nucleus"))
+        self.submit(0, (0, "ATP"), (2, "Nucleus"), (1, "Water moves across a membrane"))
+        self.submit(0, (2, "Nucleus"))
+        self.submit(1, (1, "No idea"))
+        self.submit(1, (0, "ATP"), (0, "ATP"), (2, "Mitochondria"))
+
+        incremental = stats_snapshot()
+        first_session = SessionStats.objects.get(session=self.sessions[0])
+        self.assertEqual(
+            (first_session.attempts, first_session.graded, first_session.correct, first_session.submissions),
+            (7, 5, 4, 3)
+        )
+        self.assertEqual((first_session.current_streak, first_session.best_streak), (3, 3))
+
+        out = io.StringIO()
+        call_command("rebuild_quiz_stats", stdout=out)
+        self.assertIn("Rebuilt stats for 2 sessions, 2 quizzes and 6 questions", out.getvalue())
+        self.assertEqual(stats_snapshot(), incremental)
+
+        rebuild_stats(session_id=self.sessions[1].id)
+        self.assertEqual(stats_snapshot(), incremental)
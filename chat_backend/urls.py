@@ -8,18 +8,26 @@ from .views import (
     AddMessageView,
     SessionMemoryView,
     StreamingRagAnswerView,
+    ResumeStreamView,
     CreateQuizView,
     AddQuestionsView,
     GetQuizDetailsView,
     SubmitQuizAnswersView,
     ListSessionQuizzesView,
+    PracticeQuizView,
+    SessionStatsView,
+    QuizStatsView,
     GetUserQuizAttemptsView,
     CreateGoalView,
     ListGoalsView,
     GoalDetailView,
     ListSessionsView,
     GenerateQuizFromMessageView,
-    ListAllQuizzesView
+    StreamingQuizFromMessageView,
+    QuizBatchView,
+    QuizBatchStatusView,
+    ListAllQuizzesView,
+    MetricsView
 )
 
 urlpatterns = [
@@ -30,16 +38,25 @@ urlpatterns = [
     path('session/<int:session_id>/message/', AddMessageView.as_view()), 
     path('session/<int:session_id>/memory/', SessionMemoryView.as_view()),
     path('session/<int:session_id>/rag/stream/', StreamingRagAnswerView.as_view()), 
+    path('session/<int:session_id>/rag/stream/<str:stream_id>/', ResumeStreamView.as_view()),
     path('session/<int:session_id>/quiz/create/', CreateQuizView.as_view()),
     path('quiz/<int:quiz_id>/questions/add/', AddQuestionsView.as_view()),
+    path('quiz/questions/add/', AddQuestionsView.as_view()), # create quiz + questions in one call
     path('quiz/<int:quiz_id>/', GetQuizDetailsView.as_view()),
     path('quiz/<int:quiz_id>/submit/', SubmitQuizAnswersView.as_view()),
     path('session/<int:session_id>/quizzes/', ListSessionQuizzesView.as_view()),
+    path('session/<int:session_id>/practice-quiz/', PracticeQuizView.as_view()),
     path('session/<int:session_id>/quiz_attempts/', GetUserQuizAttemptsView.as_view()),
+    path('session/<int:session_id>/stats/', SessionStatsView.as_view()),
+    path('quiz/<int:quiz_id>/stats/', QuizStatsView.as_view()),
     path('session/<int:session_id>/goal/create/', CreateGoalView.as_view()),
     path('goals/', ListGoalsView.as_view()),
     path('goal/<int:goal_id>/', GoalDetailView.as_view()),
     path('sessions/', ListSessionsView.as_view()),
     path('message/<int:message_id>/generate-quiz/', GenerateQuizFromMessageView.as_view()),
+    path('message/<int:message_id>/generate-quiz/stream/', StreamingQuizFromMessageView.as_view()),
     path('quiz/', ListAllQuizzesView.as_view()),
+    path('quiz/batch/', QuizBatchView.as_view()),
+    path('quiz/batch/<int:job_id>/', QuizBatchStatusView.as_view()),
+    path('metrics/', MetricsView.as_view()),
 ]
\ No newline at end of file
@@ -1,12 +1,24 @@
+import logging
 import json
 import os
 from datetime import datetime
 import uuid
 from django.conf import settings
-from ..models import GlobalMemory, ChatSession, ChatMessage, Goal
+from ..models import MemoryEntry, ChatSession, ChatMessage, Goal
 from .vectorstore import get_vector_store, get_rag_context
+from .prompt_cache import get_system_prompt_prefix
+from .memory import save_memory, retrieve_relevant_memories, format_memories, schedule_memory_maintenance
+from .history import build_history_messages
+from .message_writer import StreamingMessageWriter
+from .tokens import count_tokens
+from .metrics import StageTimer
+from .llm_admission import admitted_completion, LLMOverloaded, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from .hedging import hedged_completion
+from .semantic_cache import get_semantic_cache, get_document_key, get_context_key, split_for_replay
 from datetime import datetime
-import traceback
+import time
+
+logger = logging.getLogger(__name__)
 
 def extract_memory(user_input, llm_response, groq_client, MODEL):
     """Extract personalized learning memory using Groq"""
@@ -22,23 +34,23 @@ Capture ONLY these 5 learning-specific elements:
 5. 📈 **Progress Updates** - Milestones/completed topics
 
 ### Output Rules
-- Return {"save": false} if NO learning-relevant details found
+- Return {{"save": false}} if NO learning-relevant details found
 - For valuable insights, return:
-{
+{{
   "save": true,
   "memory": "Concise 3rd-person summary (max 15 words) using learning terminology",
   "category": "Goals/Difficulties/Preferences/Progress"  # Pick ONE main category
-}
+}}
 
 ### Examples
 User: I always get stuck on gradient descent in neural networks
-→ {"save": true, "memory": "Struggles with gradient descent in neural networks", "category": "Difficulties"}
+→ {{"save": true, "memory": "Struggles with gradient descent in neural networks", "category": "Difficulties"}}
 
 User: Can we use more diagrams next time? I'm a visual learner
-→ {"save": true, "memory": "Prefers visual explanations with diagrams", "category": "Preferences"}
+→ {{"save": true, "memory": "Prefers visual explanations with diagrams", "category": "Preferences"}}
 
 User: Just finished module 3 on calculus basics
-→ {"save": true, "memory": "Completed calculus fundamentals module", "category": "Progress"}
+→ {{"save": true, "memory": "Completed calculus fundamentals module", "category": "Progress"}}
 
 ---
 
@@ -54,7 +66,9 @@ Only capture explicit statements about the 5 focus areas.
 # return only one memory object and nothing else"""
 
     try:
-        response = groq_client.chat.completions.create(
+        response = admitted_completion(
+            groq_client,
+            PRIORITY_BACKGROUND,
             messages=[
                 {"role": "system", "content": "You are a memory extraction assistant. Always return valid JSON."},
                 {"role": "user", "content": memory_prompt}
@@ -78,7 +92,7 @@ Only capture explicit statements about the 5 focus areas.
                 return {"save": True, "memory": memory_text}
     
     except Exception as e:
-        print(f"Error extracting memory: {str(e)}")
+        logger.warning("Error extracting memory: %s", e)
         return {"save": False}
     
 
@@ -132,7 +146,9 @@ Extract deadline dates if mentioned (convert relative dates like "next week" to
 Only capture clear, actionable goals."""
 
     try:
-        response = groq_client.chat.completions.create(
+        response = admitted_completion(
+            groq_client,
+            PRIORITY_BACKGROUND,
             messages=[
                 {"role": "system", "content": "You are a goal extraction assistant. Always return valid JSON. Today's date is " + datetime.now().strftime("%Y-%m-%d")},
                 {"role": "user", "content": goal_prompt}
@@ -156,7 +172,7 @@ Only capture clear, actionable goals."""
                 return {"save": False}
     
     except Exception as e:
-        print(f"Error extracting goals: {str(e)}")
+        logger.warning("Error extracting goals: %s", e)
         return {"save": False}
 
 
@@ -168,9 +184,8 @@ def generate_streaming_assistant_response(
     max_tokens=3000,
     temperature=0.7,
     max_chunks=3,
-    recent_messages_count=5
+    history_token_budget=None
 ):
-    print(f"Starting new streaming response for query: {query[:50]}...")
     """
     Generate streaming assistant response with memory, goals, and RAG context integration
     
@@ -181,12 +196,15 @@ def generate_streaming_assistant_response(
         max_tokens (int): Maximum tokens for response
         temperature (float): Temperature for response generation
         max_chunks (int): Maximum RAG chunks to include
-        recent_messages_count (int): Number of recent messages to include
+        history_token_budget (int): Maximum tokens of conversation history to include (defaults to settings.HISTORY_TOKEN_BUDGET)
         
     Yields:
         dict: Streaming response chunks containing 'chunk', 'done', and optional 'error'
-              Final chunk includes 'goals_created' and 'memory_saved' metadata
+              Final chunk includes 'goals_created', 'memory_saved' and 'cached' metadata,
+              plus per-stage 'timings' (ms) when settings.CHAT_TIMINGS_IN_METADATA is enabled
     """
+    logger.debug("Starting new streaming response for query: %s...", query[:50])
+    timer = StageTimer("chat")
     try:
         # Track metadata for final response
         goals_created = []
@@ -200,73 +218,106 @@ def generate_streaming_assistant_response(
             yield {"chunk": "", "done": True, "error": "Invalid session ID"}
             return
         
-        # Load memory context
-        memory_context = ""
-        try:
-            global_memory = GlobalMemory.objects.first()
-            if global_memory and global_memory.preferences:
-                memory_context = global_memory.preferences.strip()
-        except Exception as e:
-            print(f"Error loading memory context: {str(e)}")
+        # Persist the question up front so the turn survives a crash or disconnect mid-stream
+        with timer.span("question_persistence"):
+            user_message = ChatMessage.objects.create(session=session, message=query, is_user=True)
+        
+        # Build enhanced system message: cached prefix (base prompt, core profile, goals) + per-turn context
+        with timer.span("context_load"):
+            system_message, prefix_tokens = get_system_prompt_prefix(session)
+        
+        # Load vector store for RAG context and semantic cache lookups
+        with timer.span("vector_store_load"):
+            vector_store = None
+            try:
+                vector_store = get_vector_store()
+            except Exception as e:
+                logger.warning("Error loading vector store: %s", e)
+        
+        # Embed the query once for memory retrieval, the semantic cache and document search
+        pdf_id = str(session_id)  # Use session_id as pdf_id to get session-specific documents
+        has_document = vector_store is not None and vector_store.get_pdf_info(pdf_id) is not None
+        query_embedding = None
+        with timer.span("query_embedding"):
+            try:
+                if vector_store is not None and (has_document or MemoryEntry.objects.filter(is_core=False).exists()):
+                    query_embedding = vector_store.embed_query(query)
+            except Exception as e:
+                logger.warning("Error embedding query: %s", e)
+        
+        # Retrieve the learner's memories most relevant to this query
+        memories = []
+        with timer.span("memory_retrieval"):
+            try:
+                if query_embedding is not None:
+                    memories = retrieve_relevant_memories(query_embedding, vector_store.embedding_model)
+            except Exception as e:
+                logger.warning("Error retrieving memories: %s", e)
         
-        # Load goals context
-        goals_context = ""
+        # Serve repeated questions about the same document from the semantic cache. Only opening
+        # questions qualify: a follow-up ("explain that in more detail") embeds alike in every
+        # conversation, but its answer depends on the history, which is not part of the key
+        semantic_cache = get_semantic_cache()
+        cache_document_key = None
+        cache_context_key = None
+        cached_response = None
         try:
-            goals = Goal.objects.filter(session=session).order_by('-created_at')
-            if goals.exists():
-                goals_list = []
-                for goal in goals:
-                    goal_text = f"- {goal.title} (Status: {goal.status})"
-                    if goal.description:
-                        goal_text += f": {goal.description}"
-                    if goal.deadline:
-                        goal_text += f" [Deadline: {goal.deadline.strftime('%Y-%m-%d')}]"
-                    goals_list.append(goal_text)
-                goals_context = "\n".join(goals_list)
+            if (
+                semantic_cache is not None and has_document and query_embedding is not None
+                and not _has_prior_turns(session, user_message.id)
+            ):
+                cache_document_key = get_document_key(vector_store, pdf_id)
+                if cache_document_key:
+                    with timer.span("cache_lookup"):
+                        # Answers personalized by memories are only reused under the same memories
+                        cache_context_key = get_context_key(system_message + "".join(str(memory_id) for memory_id, _ in memories))
+                        cached_response = semantic_cache.lookup(cache_document_key, cache_context_key, query_embedding)
         except Exception as e:
-            print(f"Error loading goals context: {str(e)}")
+            logger.warning("Error checking semantic cache: %s", e)
+        
+        if cached_response is not None:
+            yield from _replay_cached_response(session, cached_response, timer)
+            return
         
         # Get RAG context from uploaded documents
-        rag_context = ""
-        try:
-            vector_store = get_vector_store()
-            # Use session_id as pdf_id to get session-specific documents
-            rag_context = get_rag_context(query, vector_store, max_chunks=max_chunks, pdf_id=str(session_id))
-        except Exception as e:
-            print(f"Error loading RAG context: {str(e)}")
+        with timer.span("retrieval"):
+            rag_context = ""
+            try:
+                if has_document:
+                    rag_context = get_rag_context(query, vector_store, max_chunks=max_chunks, pdf_id=pdf_id, query_embedding=query_embedding)
+            except Exception as e:
+                logger.warning("Error loading RAG context: %s", e)
         
         # Prepare messages with enhanced system prompt
         messages = []
         
-        # Build enhanced system message
-        system_message = settings.SYSTEM_PROMPT
-        
+        memory_context = format_memories(memories)
         if memory_context:
-            system_message += f"\n\n### Previous Learning Context:\n{memory_context}\n\nUse this context to personalize your responses and build upon previous interactions."
-        
-        if goals_context:
-            system_message += f"\n\n### User's Goals:\n{goals_context}\n\nKeep these goals in mind when providing assistance. Help the user work towards achieving these goals and provide relevant progress updates."
+            system_message += f"\n\n### Relevant Learning Context:\n{memory_context}\n\nDraw on these notes about the learner where they relate to the question."
         
         if rag_context:
             system_message += f"\n\n### Relevant Document Context:\n{rag_context}\n\nUse this document context to provide accurate, detailed answers. Always cite the source document when referencing information from the uploaded documents."
         
         messages.append({"role": "system", "content": system_message})
         
-    # Add recent conversation history (excluding the current query)
-        try:
-            recent_messages = ChatMessage.objects.filter(session=session).order_by('-created_at')[:recent_messages_count]
-            # Reverse to get chronological order
-            for message in reversed(recent_messages):
-                role = "user" if message.is_user else "assistant"
-                messages.append({"role": role, "content": message.message})
-        except Exception as e:
-            print(f"Error loading recent messages: {str(e)}")
+        # Add conversation history (before the current query), bounded by the remaining prompt budget
+        with timer.span("history_load"):
+            try:
+                if history_token_budget is None:
+                    history_token_budget = getattr(settings, 'HISTORY_TOKEN_BUDGET', 2000)
+                prompt_budget = getattr(settings, 'PROMPT_TOKEN_BUDGET', 8000)
+                used_tokens = prefix_tokens + count_tokens(memory_context) + count_tokens(rag_context) + count_tokens(query)
+                history_token_budget = max(0, min(history_token_budget, prompt_budget - used_tokens))
+                messages.extend(build_history_messages(session, history_token_budget, groq_client=groq_client, before_message_id=user_message.id))
+            except Exception as e:
+                logger.warning("Error loading conversation history: %s", e)
         
         # Add current user query to messages
         messages.append({"role": "user", "content": query})
         
         # Generate streaming response using Groq
-        stream = groq_client.chat.completions.create(
+        llm_started_at = time.perf_counter()
+        request_kwargs = dict(
             messages=messages,
             model=settings.MODEL,
             temperature=temperature,
@@ -275,67 +326,94 @@ def generate_streaming_assistant_response(
             stop=None,
             top_p=1,
         )
+        try:
+            if getattr(settings, 'LLM_HEDGING_ENABLED', False):
+                # Duplicate the request if the first token is slower than usual; stream the faster one
+                stream = hedged_completion(groq_client, PRIORITY_INTERACTIVE, hedge_model=getattr(settings, 'LLM_HEDGE_MODEL', None), **request_kwargs)
+            else:
+                stream = admitted_completion(groq_client, PRIORITY_INTERACTIVE, **request_kwargs)
+        except LLMOverloaded as e:
+            # Nothing was generated: drop the question so the client's retry does not duplicate it
+            user_message.delete()
+            yield {"chunk": "", "done": True, "error": str(e), "error_type": "overloaded", "retry_after": e.retry_after}
+            return
         
-        full_response = ""
-        for chunk in stream:
-            chunk_content = chunk.choices[0].delta.content or ""
-            if chunk_content:  # Only yield non-empty chunks
-                full_response += chunk_content
-                yield {"chunk": chunk_content, "done": False}
-    
-        # Save messages to database
+        # Stream into an incomplete assistant placeholder, written behind at a throttled interval
+        writer = StreamingMessageWriter(session)
+        first_token = True
         try:
-            ChatMessage.objects.create(session=session, message=query, is_user=True)
-            obj = ChatMessage.objects.create(session=session, message=full_response, is_user=False)
-        except Exception as e:
-            print(f"Error saving messages: {str(e)}")
+            for chunk in stream:
+                chunk_content = chunk.choices[0].delta.content or ""
+                if chunk_content:  # Only yield non-empty chunks
+                    if first_token:
+                        first_token = False
+                        timer.record("llm_ttft", time.perf_counter() - llm_started_at)
+                    writer.append(chunk_content)
+                    yield {"chunk": chunk_content, "done": False}
+        finally:
+            # Keep whatever arrived if the stream fails or the consumer goes away
+            writer.flush()
+        timer.record("llm_total", time.perf_counter() - llm_started_at)
+        full_response = writer.text
+    
+        # Cache document answers for near-identical follow-up questions
+        if cache_context_key and query_embedding is not None and rag_context and full_response:
+            semantic_cache.store(cache_document_key, cache_context_key, query_embedding, full_response)
+        
+        # Finalize the assistant message
+        with timer.span("persistence"):
+            obj = None
+            try:
+                obj = writer.finalize()
+            except Exception as e:
+                logger.warning("Error saving messages: %s", e)
         
         # Extract and save memory if applicable
-        try:
-            memory_data = extract_memory(query, full_response, groq_client, settings.MODEL)
-            if memory_data.get("save", False):
-                memory_text = memory_data.get("memory", "")
-                if memory_text:
-                    global_memory = GlobalMemory.objects.first()
-                    if global_memory:
-                        global_memory.preferences += f"\n{memory_text}"
-                        global_memory.save()
+        with timer.span("memory_extraction"):
+            try:
+                memory_data = extract_memory(query, full_response, groq_client, settings.MODEL)
+                if memory_data.get("save", False):
+                    memory_text = memory_data.get("memory", "")
+                    if memory_text and save_memory(memory_text, memory_data.get("category", "")):
                         memory_saved = True
                         memory_content = memory_text
-        except Exception as e:
-            print(f"Error extracting/saving memory: {str(e)}")
+                        if vector_store is not None:
+                            schedule_memory_maintenance(vector_store.embedding_model)
+            except Exception as e:
+                logger.warning("Error extracting/saving memory: %s", e)
         
         # Extract and save goals if applicable
-        try:
-            goals_data = extract_goals(query, full_response, groq_client, settings.MODEL)
-            if goals_data.get("save", False):
-                goals_list = goals_data.get("goals", [])
-                for goal_data in goals_list:
-                    try:
-                        deadline = None
-                        if goal_data.get("deadline"):
-                            deadline = datetime.fromisoformat(goal_data["deadline"])
+        with timer.span("goal_extraction"):
+            try:
+                goals_data = extract_goals(query, full_response, groq_client, settings.MODEL)
+                if goals_data.get("save", False):
+                    goals_list = goals_data.get("goals", [])
+                    for goal_data in goals_list:
+                        try:
+                            deadline = None
+                            if goal_data.get("deadline"):
+                                deadline = datetime.fromisoformat(goal_data["deadline"])
                         
-                        goal = Goal.objects.create(
-                            session=session,
-                            title=goal_data.get("title", ""),
-                            description=goal_data.get("description", ""),
-                            deadline=deadline,
-                            status=goal_data.get("status", "pending")
-                        )
+                            goal = Goal.objects.create(
+                                session=session,
+                                title=goal_data.get("title", ""),
+                                description=goal_data.get("description", ""),
+                                deadline=deadline,
+                                status=goal_data.get("status", "pending")
+                            )
                         
-                        # Add to goals_created list
-                        goals_created.append({
-                            "id": goal.id,
-                            "title": goal.title,
-                            "description": goal.description,
-                            "deadline": goal.deadline.isoformat() if goal.deadline else None,
-                            "status": goal.status
-                        })
-                    except Exception as e:
-                        print(f"Error creating goal: {str(e)}")
-        except Exception as e:
-            print(f"Error extracting/saving goals: {str(e)}")
+                            # Add to goals_created list
+                            goals_created.append({
+                                "id": goal.id,
+                                "title": goal.title,
+                                "description": goal.description,
+                                "deadline": goal.deadline.isoformat() if goal.deadline else None,
+                                "status": goal.status
+                            })
+                        except Exception as e:
+                            logger.warning("Error creating goal: %s", e)
+            except Exception as e:
+                logger.warning("Error extracting/saving goals: %s", e)
         
         # Final chunk with metadata
         final_chunk = {
@@ -346,17 +424,60 @@ def generate_streaming_assistant_response(
                 "new_message_id": obj.id if obj else None,
                 "goals_created": goals_created,
                 "memory_saved": memory_saved,
-                "memory_content": memory_content if memory_saved else None
+                "memory_content": memory_content if memory_saved else None,
+                "cached": False
             }
         }
-        print(f"Streaming response completed for query: {query[:50]}...")
+        _attach_timings(final_chunk, timer)
+        logger.debug("Streaming response completed for query: %s...", query[:50])
         yield final_chunk
         
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Error generating response")
         yield {"chunk": "", "done": True, "error": f"Error generating response: {str(e)}"}
 
 
+def _attach_timings(final_chunk, timer):
+    """Record the turn's total time and expose stage timings in the final metadata if enabled"""
+    timings = timer.finish()
+    if getattr(settings, 'CHAT_TIMINGS_IN_METADATA', False):
+        final_chunk["metadata"]["timings"] = timings
+
+
+def _has_prior_turns(session, message_id):
+    """Whether the conversation has history before this message (verbatim turns or a summary)"""
+    if session.history_summary.strip():
+        return True
+    return ChatMessage.objects.filter(session=session, is_complete=True, id__lt=message_id).exists()
+
+
+def _replay_cached_response(session, response, timer):
+    """Stream a semantic cache hit with the same chunk framing as a live generation"""
+    for piece in split_for_replay(response):
+        yield {"chunk": piece, "done": False}
+
+    obj = None
+    with timer.span("persistence"):
+        try:
+            obj = ChatMessage.objects.create(session=session, message=response, is_user=False)
+        except Exception as e:
+            logger.warning("Error saving messages: %s", e)
+
+    final_chunk = {
+        "chunk": "",
+        "done": True,
+        "metadata": {
+            "new_message_id": obj.id if obj else None,
+            "goals_created": [],
+            "memory_saved": False,
+            "memory_content": None,
+            "cached": True
+        }
+    }
+    _attach_timings(final_chunk, timer)
+    yield final_chunk
+
+
 """
 Usage Examples:
 
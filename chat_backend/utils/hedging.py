@@ -0,0 +1,196 @@
+import logging
+import queue
+import threading
+import time
+from django.conf import settings
+from .llm_admission import admitted_completion, LLMOverloaded
+from .metrics import registry as metrics_registry
+
+logger = logging.getLogger(__name__)
+
+
+class HedgeBudget:
+    """Allow at most `ratio` hedges per primary request, with a small burst allowance"""
+
+    def __init__(self, ratio, burst):
+        self.ratio = ratio
+        self.burst = burst
+        self.credits = float(burst)
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self.credits = min(self.burst, self.credits + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self.credits >= 1:
+                self.credits -= 1
+                return True
+            return False
+
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+def get_hedge_budget():
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = HedgeBudget(
+                ratio=getattr(settings, 'LLM_HEDGE_BUDGET_RATIO', 0.05),
+                burst=getattr(settings, 'LLM_HEDGE_BUDGET_BURST', 5),
+            )
+        return _budget
+
+
+def get_hedge_delay():
+    """Hedge after the observed p95 time-to-first-token, clamped to the configured bounds"""
+    histogram = metrics_registry.histogram("chat.llm_ttft")
+    delay = getattr(settings, 'LLM_HEDGE_DEFAULT_DELAY', 2.0)
+    if histogram.count >= getattr(settings, 'LLM_HEDGE_MIN_SAMPLES', 20):
+        delay = histogram.quantile(0.95)
+    return min(max(delay, getattr(settings, 'LLM_HEDGE_MIN_DELAY', 0.5)), getattr(settings, 'LLM_HEDGE_MAX_DELAY', 5.0))
+
+
+def _has_content(chunk):
+    return bool(chunk.choices) and bool(chunk.choices[0].delta.content)
+
+
+class _Attempt:
+    """One upstream streaming request, read in its own thread into the shared event queue"""
+
+    def __init__(self, name, start, events):
+        self.name = name
+        self.start = start
+        self.events = events
+        self.stream = None
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        try:
+            stream = self.start()
+            with self._lock:
+                self.stream = stream
+            if self.cancelled.is_set():
+                return
+            for chunk in stream:
+                if self.cancelled.is_set():
+                    return
+                self.events.put((self, "chunk", chunk))
+            self.events.put((self, "end", None))
+        except Exception as e:
+            if not self.cancelled.is_set():
+                self.events.put((self, "error", e))
+        finally:
+            self._close()
+
+    def _close(self):
+        with self._lock:
+            stream = self.stream
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def cancel(self):
+        """Stop reading and close the upstream response, aborting the request in flight"""
+        self.cancelled.set()
+        self._close()
+
+
+def hedged_completion(groq_client, priority, hedge_model=None, **request_kwargs):
+    """
+    Start a streaming completion, hedging it with a second request if the first token is slow
+
+    If no token arrives within get_hedge_delay() and the hedge budget allows it, an identical
+    request (optionally to hedge_model) is started; a primary that fails before its first token
+    fails over to the second request immediately, also within the hedge budget. Whichever request produces content first is
+    streamed, and the other one is cancelled.
+
+    Blocks until the first token (or failure), like admitted_completion raises on admission.
+
+    Returns:
+        iterator: Upstream stream chunks of the winning request
+    """
+    events = queue.Queue()
+    budget = get_hedge_budget()
+    budget.earn()
+
+    hedge_kwargs = dict(request_kwargs)
+    if hedge_model:
+        hedge_kwargs["model"] = hedge_model
+
+    primary = _Attempt("primary", lambda: admitted_completion(groq_client, priority, **request_kwargs), events)
+    attempts = [primary]
+    finished = set()
+    errors = []
+    hedge_deadline = time.monotonic() + get_hedge_delay()
+
+    def start_hedge(reason):
+        logger.info("Hedging LLM request (%s)", reason)
+        attempts.append(_Attempt("hedge", lambda: admitted_completion(groq_client, priority, **hedge_kwargs), events))
+
+    while True:
+        timeout = None
+        if len(attempts) == 1 and hedge_deadline is not None:
+            timeout = max(0.0, hedge_deadline - time.monotonic())
+        try:
+            attempt, kind, payload = events.get(timeout=timeout)
+        except queue.Empty:
+            hedge_deadline = None
+            if budget.try_spend():
+                start_hedge("slow first token")
+            continue
+
+        if kind == "chunk":
+            if _has_content(payload):
+                winner, first_chunk = attempt, payload
+                break
+            continue
+
+        if kind == "end":
+            # Finished without content: an empty answer is still an answer
+            winner, first_chunk = attempt, None
+            break
+
+        errors.append(payload)
+        finished.add(attempt)
+        # Failover spends the hedge budget too: a failing upstream must not double the load
+        if len(attempts) == 1 and not isinstance(payload, LLMOverloaded) and budget.try_spend():
+            hedge_deadline = None
+            start_hedge(f"primary failed: {payload}")
+            continue
+        if len(finished) == len(attempts):
+            raise errors[0]
+
+    for attempt in attempts:
+        if attempt is not winner:
+            attempt.cancel()
+    if len(attempts) > 1:
+        logger.info("Hedged LLM request won by %s attempt", winner.name)
+    return _follow(winner, first_chunk, events)
+
+
+def _follow(winner, first_chunk, events):
+    """Yield the winning request's chunks, ignoring leftovers from cancelled attempts"""
+    try:
+        if first_chunk is None:
+            return
+        yield first_chunk
+        while True:
+            attempt, kind, payload = events.get()
+            if attempt is not winner:
+                continue
+            if kind == "chunk":
+                yield payload
+            elif kind == "end":
+                return
+            else:
+                raise payload
+    finally:
+        winner.cancel()
@@ -0,0 +1,188 @@
+import logging
+import threading
+from django.conf import settings
+from django.db import connections
+from ..models import ChatSession, ChatMessage
+from .tokens import count_tokens, truncate_to_tokens
+from .llm_admission import admitted_completion, PRIORITY_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+# Approximate per-message framing overhead of the chat completions format
+MESSAGE_TOKEN_OVERHEAD = 4
+HISTORY_SCAN_BATCH = 20
+SUMMARY_HEADER = "### Summary of earlier conversation:\n"
+
+# Sessions with a summary refresh in flight in this process
+_summaries_in_flight = set()
+_summaries_lock = threading.Lock()
+
+
+def _complete_messages(session):
+    """Messages eligible for history and summaries: answers still streaming (or cut off) are left out"""
+    return ChatMessage.objects.filter(session=session, is_complete=True)
+
+
+def build_history_messages(session, token_budget, groq_client=None, before_message_id=None):
+    """
+    Build the conversation history for a session within a token budget
+
+    Messages are taken from the newest backwards until the budget is exhausted. Turns that
+    already fell out of the window are represented by the session's rolling summary, which is
+    refreshed in the background once enough unsummarized turns pile up behind the window.
+
+    Args:
+        session (ChatSession): Session to load history for
+        token_budget (int): Maximum tokens spent on summary + verbatim messages
+        groq_client: Groq client used for background summary refreshes (None disables them)
+        before_message_id (int): Only include messages older than this one (the current question)
+
+    Returns:
+        list: Chat completion messages in chronological order
+    """
+    summary = session.history_summary.strip()
+    summary_message = None
+    used = 0
+    if summary:
+        # The budget is an upper bound: a summary larger than the budget is cut to fit (or left out)
+        summary_budget = token_budget - count_tokens(SUMMARY_HEADER) - MESSAGE_TOKEN_OVERHEAD
+        summary = truncate_to_tokens(summary, summary_budget)
+        content = f"{SUMMARY_HEADER}{summary}"
+        cost = count_tokens(content) + MESSAGE_TOKEN_OVERHEAD
+        if summary and cost <= token_budget:
+            summary_message = {"role": "system", "content": content}
+            used = cost
+
+    messages = _complete_messages(session).order_by('-id')
+    if session.summary_until_message_id:
+        messages = messages.filter(id__gt=session.summary_until_message_id)
+    if before_message_id is not None:
+        messages = messages.filter(id__lt=before_message_id)
+
+    selected = []
+    oldest_included_id = None
+    budget_exhausted = False
+    offset = 0
+    while not budget_exhausted:
+        batch = list(messages.values_list('id', 'message', 'is_user')[offset:offset + HISTORY_SCAN_BATCH])
+        for message_id, text, is_user in batch:
+            cost = count_tokens(text) + MESSAGE_TOKEN_OVERHEAD
+            if used + cost > token_budget:
+                budget_exhausted = True
+                break
+            used += cost
+            oldest_included_id = message_id
+            selected.append({"role": "user" if is_user else "assistant", "content": text})
+        if len(batch) < HISTORY_SCAN_BATCH:
+            break
+        offset += HISTORY_SCAN_BATCH
+
+    if budget_exhausted and groq_client is not None:
+        _maybe_refresh_summary(session, oldest_included_id or before_message_id, groq_client)
+
+    history = [summary_message] if summary_message else []
+    history.extend(reversed(selected))
+    return history
+
+
+def _maybe_refresh_summary(session, oldest_included_id, groq_client):
+    """Schedule a background summary refresh if enough turns fell out of the window"""
+    pending = _complete_messages(session)
+    if session.summary_until_message_id:
+        pending = pending.filter(id__gt=session.summary_until_message_id)
+    if oldest_included_id is not None:
+        pending = pending.filter(id__lt=oldest_included_id)
+
+    trigger = getattr(settings, 'HISTORY_SUMMARY_TRIGGER_MESSAGES', 6)
+    if pending.count() < trigger:
+        return
+
+    with _summaries_lock:
+        if session.id in _summaries_in_flight:
+            return
+        _summaries_in_flight.add(session.id)
+
+    thread = threading.Thread(
+        target=_refresh_summary,
+        args=(session.id, oldest_included_id, groq_client),
+        daemon=True,
+    )
+    thread.start()
+
+
+def _refresh_summary(session_id, before_message_id, groq_client):
+    """Fold unsummarized turns older than the history window into the session summary"""
+    try:
+        session = ChatSession.objects.get(id=session_id)
+        previous_until = session.summary_until_message_id
+
+        pending = _complete_messages(session).order_by('id')
+        if previous_until:
+            pending = pending.filter(id__gt=previous_until)
+        if before_message_id is not None:
+            pending = pending.filter(id__lt=before_message_id)
+
+        # Summarize oldest first, bounded per refresh; the rest is picked up by the next refresh
+        input_budget = getattr(settings, 'HISTORY_SUMMARY_INPUT_BUDGET', 4000)
+        transcript = []
+        used = 0
+        last_id = None
+        for message_id, text, is_user in pending.values_list('id', 'message', 'is_user').iterator():
+            line = f"{'User' if is_user else 'Assistant'}: {text}"
+            cost = count_tokens(line)
+            if transcript and used + cost > input_budget:
+                break
+            transcript.append(line)
+            used += cost
+            last_id = message_id
+
+        if last_id is None:
+            return
+
+        summary = summarize_conversation(session.history_summary, "\n\n".join(transcript), groq_client)
+        if not summary:
+            return
+
+        # Compare-and-set so a concurrent refresh cannot move the summary backwards
+        ChatSession.objects.filter(id=session_id, summary_until_message_id=previous_until).update(
+            history_summary=summary,
+            summary_until_message_id=last_id,
+        )
+    except Exception as e:
+        logger.warning("Error refreshing history summary for session %s: %s", session_id, e)
+    finally:
+        with _summaries_lock:
+            _summaries_in_flight.discard(session_id)
+        connections.close_all()
+
+
+def summarize_conversation(previous_summary, transcript, groq_client):
+    """Merge new conversation turns into an existing summary using Groq"""
+    max_tokens = getattr(settings, 'HISTORY_SUMMARY_MAX_TOKENS', 300)
+    summary_prompt = f"""### Role
+You're a Conversation Summarizer maintaining a running summary of a tutoring conversation.
+
+### Existing Summary
+{previous_summary or "(none yet)"}
+
+### New Conversation Turns
+{transcript}
+
+### Instructions
+- Update the existing summary with the new turns
+- Keep topics covered, questions asked, explanations given and anything the learner struggled with
+- Write concise prose, at most {max_tokens} tokens
+- Output only the updated summary"""
+
+    response = admitted_completion(
+        groq_client,
+        PRIORITY_BACKGROUND,
+        messages=[
+            {"role": "system", "content": "You are a conversation summarization assistant."},
+            {"role": "user", "content": summary_prompt}
+        ],
+        model=settings.MODEL,
+        temperature=0.2,
+        max_tokens=max_tokens
+    )
+    return response.choices[0].message.content.strip()
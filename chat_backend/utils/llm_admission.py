@@ -0,0 +1,235 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from django.conf import settings
+from groq import RateLimitError
+from .tokens import count_tokens
+from .metrics import registry as metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# Lower values are admitted first
+PRIORITY_INTERACTIVE = 0  # streamed chat answers
+PRIORITY_QUIZ = 1  # quiz generation the user is waiting on
+PRIORITY_BACKGROUND = 2  # memory/goal extraction, history summaries
+
+
+class LLMOverloaded(Exception):
+    """Raised when an LLM call cannot be admitted (queue full, wait too long or upstream 429)"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Tokens-per-minute budget refilled continuously"""
+
+    def __init__(self, tokens_per_minute):
+        self.capacity = tokens_per_minute
+        self.rate = tokens_per_minute / 60.0
+        self.tokens = float(tokens_per_minute)
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay_for(self, amount):
+        """Seconds until amount tokens are available (0 if they are now)"""
+        self._refill()
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        self._refill()
+        self.tokens -= amount
+
+    def drain(self):
+        """Empty the bucket, e.g. after the provider answered 429"""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+class AdmissionController:
+    """
+    Shared gate for upstream LLM calls
+
+    Enforces a maximum number of in-flight calls and an optional tokens-per-minute budget.
+    Waiting callers are admitted strictly by (priority, arrival order). When the queue is full a
+    newcomer displaces the lowest-priority waiter if it outranks it; the displaced caller, a
+    newcomer that cannot displace anyone, or a caller waiting longer than queue_timeout gets
+    LLMOverloaded.
+    """
+
+    def __init__(self, max_in_flight, tokens_per_minute=0, max_queue=32, queue_timeout=30):
+        self.max_in_flight = max_in_flight
+        self.bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiting = []
+        self._evicted = set()
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def acquire(self, priority, tokens=0):
+        with self._cond:
+            if len(self._waiting) >= self.max_queue:
+                # Queue full: bump the lowest-priority waiter if the newcomer outranks it, else shed the newcomer
+                lowest = max(self._waiting)
+                if lowest[0] <= priority:
+                    raise LLMOverloaded("The assistant is busy right now, please try again shortly", retry_after=self.queue_timeout)
+                self._waiting.remove(lowest)
+                heapq.heapify(self._waiting)
+                self._evicted.add(lowest)
+                self._cond.notify_all()
+
+            if self.bucket is not None:
+                # A single request larger than the whole budget would otherwise wait forever
+                tokens = min(tokens, self.bucket.capacity)
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, entry)
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while True:
+                    if entry in self._evicted:
+                        self._evicted.discard(entry)
+                        raise LLMOverloaded("The assistant is busy right now, please try again shortly", retry_after=self.queue_timeout)
+                    wait = None
+                    if self._waiting[0] == entry and self.in_flight < self.max_in_flight:
+                        wait = self.bucket.delay_for(tokens) if self.bucket is not None else 0.0
+                        if wait == 0.0:
+                            heapq.heappop(self._waiting)
+                            if self.bucket is not None:
+                                self.bucket.consume(tokens)
+                            self.in_flight += 1
+                            self._cond.notify_all()
+                            return
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise LLMOverloaded("Timed out waiting for assistant capacity, please try again shortly", retry_after=self.queue_timeout)
+                    self._cond.wait(min(wait, remaining) if wait else remaining)
+            except BaseException:
+                if entry in self._waiting:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+                raise
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def throttle(self):
+        """Back off after an upstream rate limit by emptying the token budget"""
+        if self.bucket is not None:
+            with self._cond:
+                self.bucket.drain()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "in_flight": self.in_flight,
+                "queued": len(self._waiting),
+                "tokens_available": round(self.bucket.tokens) if self.bucket is not None else None,
+            }
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller():
+    """Get the process-wide admission controller configured from settings"""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController(
+                max_in_flight=getattr(settings, 'LLM_MAX_IN_FLIGHT', 8),
+                tokens_per_minute=getattr(settings, 'LLM_TOKENS_PER_MINUTE', 0),
+                max_queue=getattr(settings, 'LLM_MAX_QUEUE', 32),
+                queue_timeout=getattr(settings, 'LLM_QUEUE_TIMEOUT', 30),
+            )
+        return _controller
+
+
+def estimate_request_tokens(request_kwargs):
+    """Estimate tokens charged against the budget: prompt plus expected completion"""
+    prompt_tokens = sum(count_tokens(message.get("content") or "") for message in request_kwargs.get("messages", []))
+    max_completion = request_kwargs.get("max_completion_tokens") or request_kwargs.get("max_tokens") or 0
+    expected_completion = getattr(settings, 'LLM_EXPECTED_COMPLETION_TOKENS', 500)
+    return prompt_tokens + min(max_completion, expected_completion)
+
+
+def admitted_completion(groq_client, priority, **request_kwargs):
+    """
+    Call groq_client.chat.completions.create once the admission controller lets it through
+
+    Non-streaming calls release their slot when the response arrives; streaming calls return an
+    AdmittedStream that holds the slot until the stream is exhausted or closed.
+
+    Raises:
+        LLMOverloaded: If the call is shed, or the provider rate-limits it (HTTP 429)
+    """
+    controller = get_admission_controller()
+    started_at = time.perf_counter()
+    controller.acquire(priority, estimate_request_tokens(request_kwargs))
+    metrics_registry.observe(f"llm.admission_wait.p{priority}", time.perf_counter() - started_at)
+    try:
+        response = groq_client.chat.completions.create(**request_kwargs)
+    except RateLimitError as e:
+        controller.release()
+        controller.throttle()
+        retry_after = e.response.headers.get("retry-after") if getattr(e, "response", None) is not None else None
+        logger.warning("Groq rate limit hit: %s", e)
+        raise LLMOverloaded("The assistant is rate limited right now, please try again shortly", retry_after=retry_after) from e
+    except BaseException:
+        controller.release()
+        raise
+
+    if request_kwargs.get("stream"):
+        return AdmittedStream(response, controller)
+    controller.release()
+    return response
+
+
+class AdmittedStream:
+    """Iterate an upstream stream, releasing its admission slot exactly once when it ends or is closed"""
+
+    def __init__(self, stream, controller):
+        self._stream = stream
+        self._iterator = iter(stream)
+        self._controller = controller
+        self._released = False
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._iterator)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        # May be called from another thread to abort the request (see utils.hedging)
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._controller.release()
+        close = getattr(self._stream, "close", None)
+        if close is not None:
+            close()
+
+    def __del__(self):
+        self.close()
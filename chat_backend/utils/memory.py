@@ -0,0 +1,293 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction, connection, connections
+from ..models import MemoryEntry
+from .tokens import count_tokens
+from .sqlite import retry_on_locked
+
+logger = logging.getLogger(__name__)
+
+# Categories that describe how the learner wants to be taught; relevant to every turn
+CORE_CATEGORIES = {"Preferences"}
+
+# Appends since the last consolidation in this process, and whether background maintenance
+# (embedding new memories, consolidation) is running
+_appends_since_consolidation = 0
+_maintenance_running = False
+_consolidation_lock = threading.Lock()
+
+# Normalized embedding matrix of the non-core memories, rebuilt when the index version moves
+INDEX_VERSION_KEY = "memory:index_version"
+CONSOLIDATE_BLOCK_ROWS = 256
+_index = None
+_index_lock = threading.Lock()
+
+
+def normalize_memory(content):
+    """Normalize memory text for duplicate detection: collapse whitespace, drop trailing punctuation, lowercase"""
+    return re.sub(r"\s+", " ", content).strip().strip(".!;,").lower()
+
+
+def memory_hash(content):
+    return hashlib.sha256(normalize_memory(content).encode("utf-8")).hexdigest()
+
+
+@retry_on_locked
+def save_memory(content, category="", is_core=None):
+    """
+    Append a memory as its own entry with a single INSERT
+
+    The embedding is computed in the background (schedule_memory_maintenance). A memory whose normalized text is already
+    stored is rejected by the unique content hash rather than by a read beforehand, so concurrent
+    writers never overwrite each other.
+
+    Returns:
+        MemoryEntry: The new entry, or None if it was a duplicate
+    """
+    global _appends_since_consolidation
+    if is_core is None:
+        is_core = category in CORE_CATEGORIES
+    content = content.strip()
+    try:
+        with transaction.atomic():
+            entry = MemoryEntry.objects.create(
+                content=content,
+                content_hash=memory_hash(content),
+                category=category or "",
+                is_core=is_core,
+            )
+    except IntegrityError:
+        return None
+    with _consolidation_lock:
+        _appends_since_consolidation += 1
+    return entry
+
+
+def get_core_profile(token_budget=None):
+    """Newest core memories that fit in the core profile token budget, as prompt lines"""
+    if token_budget is None:
+        token_budget = getattr(settings, 'MEMORY_CORE_TOKEN_BUDGET', 300)
+    lines = []
+    used = 0
+    for content in MemoryEntry.objects.filter(is_core=True).order_by('-id').values_list('content', flat=True):
+        cost = count_tokens(content)
+        if used + cost > token_budget:
+            break
+        used += cost
+        lines.append(f"- {content}")
+    lines.reverse()
+    return "\n".join(lines)
+
+
+def _to_vector(embedding):
+    vector = np.frombuffer(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _bump_index_version():
+    try:
+        cache.incr(INDEX_VERSION_KEY)
+    except ValueError:
+        cache.set(INDEX_VERSION_KEY, time.time_ns(), None)
+
+
+def invalidate_memory_index():
+    """
+    Drop the cached retrieval matrix (called on every MemoryEntry save/delete)
+
+    Inside a transaction the version is bumped again on commit, so a matrix built from the
+    pre-commit rows in the meantime is not kept.
+    """
+    try:
+        _bump_index_version()
+        if connection.in_atomic_block:
+            transaction.on_commit(_bump_index_version)
+    except Exception as e:
+        logger.warning("Error invalidating memory index: %s", e)
+
+
+def _get_index_version():
+    version = cache.get(INDEX_VERSION_KEY)
+    if version is None:
+        cache.add(INDEX_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(INDEX_VERSION_KEY)
+    return version
+
+
+def get_memory_index():
+    """
+    Ids, contents and normalized embedding matrix of the embedded non-core memories
+
+    Built once per index version and shared by all requests of the process. `pending` tells
+    whether some memories still wait for their embedding.
+    """
+    global _index
+    version = _get_index_version()
+    with _index_lock:
+        if _index is not None and _index["version"] == version:
+            return _index
+
+    rows = []
+    vectors = []
+    for entry_id, content, embedding in (
+        MemoryEntry.objects.filter(is_core=False, embedding__isnull=False).order_by('-id').values_list('id', 'content', 'embedding')
+    ):
+        vector = _to_vector(bytes(embedding))
+        # Entries embedded by an earlier embedding model (another dimension) are left out
+        if vectors and vector.shape[0] != vectors[0].shape[0]:
+            continue
+        rows.append((entry_id, content))
+        vectors.append(vector)
+    index = {
+        "version": version,
+        "ids": [row[0] for row in rows],
+        "contents": [row[1] for row in rows],
+        "matrix": np.vstack(vectors) if vectors else None,
+        "pending": MemoryEntry.objects.filter(embedding__isnull=True).exists(),
+    }
+    with _index_lock:
+        _index = index
+    return index
+
+
+def embed_pending_memories(embedding_model, batch_size=64):
+    """Embed memories that have no embedding yet"""
+    pending = list(MemoryEntry.objects.filter(embedding__isnull=True).only('id', 'content')[:batch_size])
+    if not pending:
+        return 0
+    vectors = embedding_model.embed_documents([entry.content for entry in pending])
+    for entry, vector in zip(pending, vectors):
+        entry.embedding = np.asarray(vector, dtype=np.float32).tobytes()
+    MemoryEntry.objects.bulk_update(pending, ['embedding'])
+    # bulk_update sends no post_save signals
+    invalidate_memory_index()
+    return len(pending)
+
+
+def retrieve_relevant_memories(query_embedding, embedding_model=None, top_k=None, min_score=None):
+    """
+    Rank non-core memories by cosine similarity to the query embedding
+
+    Reads the cached memory index, so a turn costs one matrix product and no embedding call.
+
+    Args:
+        query_embedding: Normalized query embedding, shape (dim,) or (1, dim)
+        embedding_model: Used to embed memories that have no embedding yet, in the background
+            (None skips that)
+        top_k (int): Maximum memories returned (defaults to settings.MEMORY_TOP_K)
+        min_score (float): Minimum cosine similarity (defaults to settings.MEMORY_MIN_SCORE)
+
+    Returns:
+        list: (memory id, content) tuples, most relevant first
+    """
+    if top_k is None:
+        top_k = getattr(settings, 'MEMORY_TOP_K', 5)
+    if min_score is None:
+        min_score = getattr(settings, 'MEMORY_MIN_SCORE', 0.3)
+
+    index = get_memory_index()
+    if index["pending"] and embedding_model is not None:
+        schedule_memory_maintenance(embedding_model)
+    matrix = index["matrix"]
+    if matrix is None:
+        return []
+
+    query_vector = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+    if matrix.shape[1] != query_vector.shape[0]:
+        # Embedding model changed since these memories were embedded
+        return []
+    scores = matrix @ query_vector
+    ranked = np.argsort(-scores)[:top_k]
+    return [(index["ids"][i], index["contents"][i]) for i in ranked if scores[i] >= min_score]
+
+
+def format_memories(memories):
+    return "\n".join(f"- {content}" for _, content in memories)
+
+
+def consolidate_memories(embedding_model, threshold=None):
+    """
+    Merge near-duplicate memories
+
+    Within each (category, core) group, an entry whose embedding is at least `threshold` similar
+    to a newer entry is deleted, so the most recent phrasing of a memory survives. Similarities
+    are computed CONSOLIDATE_BLOCK_ROWS rows at a time, so memory grows linearly with the group.
+
+    Returns:
+        int: Number of entries removed
+    """
+    if threshold is None:
+        threshold = getattr(settings, 'MEMORY_CONSOLIDATE_THRESHOLD', 0.92)
+
+    while embed_pending_memories(embedding_model):
+        pass
+
+    groups = {}
+    for entry_id, category, is_core, embedding in (
+        MemoryEntry.objects.filter(embedding__isnull=False).order_by('-id').values_list('id', 'category', 'is_core', 'embedding')
+    ):
+        groups.setdefault((category, is_core), []).append((entry_id, _to_vector(bytes(embedding))))
+
+    duplicates = []
+    for rows in groups.values():
+        if len(rows) < 2 or len({vector.shape[0] for _, vector in rows}) > 1:
+            continue
+        matrix = np.vstack([vector for _, vector in rows])
+        removed = np.zeros(len(rows), dtype=bool)
+        # Rows are newest first: each surviving entry absorbs the older ones close to it
+        for start in range(0, len(rows), CONSOLIDATE_BLOCK_ROWS):
+            block = matrix[start:start + CONSOLIDATE_BLOCK_ROWS]
+            similarity = block @ matrix[start:].T
+            for offset in range(block.shape[0]):
+                i = start + offset
+                if removed[i]:
+                    continue
+                removed[i + 1 + np.flatnonzero(similarity[offset, offset + 1:] >= threshold)] = True
+        duplicates.extend(rows[i][0] for i in np.flatnonzero(removed))
+
+    if duplicates:
+        MemoryEntry.objects.filter(id__in=duplicates).delete()
+    return len(duplicates)
+
+
+def schedule_memory_maintenance(embedding_model):
+    """
+    Embed new memories in a background thread, consolidating too once enough memories were
+    appended in this process; a no-op while a previous run is still going
+    """
+    global _appends_since_consolidation, _maintenance_running
+    with _consolidation_lock:
+        if _maintenance_running:
+            return
+        consolidate = _appends_since_consolidation >= getattr(settings, 'MEMORY_CONSOLIDATE_EVERY', 20)
+        if consolidate:
+            _appends_since_consolidation = 0
+        _maintenance_running = True
+
+    thread = threading.Thread(target=_run_maintenance, args=(embedding_model, consolidate), daemon=True)
+    thread.start()
+
+
+def _run_maintenance(embedding_model, consolidate):
+    global _maintenance_running
+    try:
+        if consolidate:
+            removed = consolidate_memories(embedding_model)
+            if removed:
+                logger.info("Consolidated %s near-duplicate memories", removed)
+        else:
+            while embed_pending_memories(embedding_model):
+                pass
+    except Exception as e:
+        logger.warning("Error in background memory maintenance: %s", e)
+    finally:
+        with _consolidation_lock:
+            _maintenance_running = False
+        connections.close_all()
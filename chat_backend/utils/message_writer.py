@@ -0,0 +1,92 @@
+import logging
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from ..models import ChatMessage
+from .sqlite import retry_on_locked
+
+logger = logging.getLogger(__name__)
+
+
+def close_abandoned_messages(session, max_age=None):
+    """
+    Close placeholders whose writer died before finalizing (worker killed mid-stream)
+
+    A placeholder older than max_age seconds cannot belong to a live stream any more. The text
+    flushed before the crash is kept as a complete message; a placeholder that never received
+    any text is deleted.
+
+    Returns:
+        int: Number of placeholders closed or deleted
+    """
+    if max_age is None:
+        max_age = getattr(settings, 'CHAT_ABANDONED_MESSAGE_AGE', 600)
+    try:
+        # One read per turn; the writes only happen after a crash
+        abandoned = list(ChatMessage.objects.filter(
+            session=session, is_user=False, is_complete=False,
+            created_at__lt=timezone.now() - timedelta(seconds=max_age)
+        ).values_list('id', 'message'))
+        if not abandoned:
+            return 0
+        empty_ids = [message_id for message_id, text in abandoned if not text]
+        partial_ids = [message_id for message_id, text in abandoned if text]
+        if empty_ids:
+            ChatMessage.objects.filter(id__in=empty_ids).delete()
+        if partial_ids:
+            ChatMessage.objects.filter(id__in=partial_ids).update(is_complete=True)
+    except Exception as e:
+        logger.warning("Error closing abandoned messages of session %s: %s", session.id, e)
+        return 0
+    logger.info("Closed %s and deleted %s abandoned messages in session %s", len(partial_ids), len(empty_ids), session.id)
+    return len(abandoned)
+
+
+class StreamingMessageWriter:
+    """
+    Write-behind buffer for an assistant message being streamed
+
+    The message row is created up front as an incomplete placeholder. Streamed text is collected
+    in memory and written to the row at most every `flush_interval` seconds, so a crash or
+    disconnect loses at most that much of the answer without paying one write per token.
+    Placeholders left behind by a crashed writer are closed when the session streams again.
+    """
+
+    def __init__(self, session, flush_interval=None):
+        if flush_interval is None:
+            flush_interval = getattr(settings, 'CHAT_PERSIST_INTERVAL', 1.0)
+        self.flush_interval = flush_interval
+        close_abandoned_messages(session)
+        self.message = ChatMessage.objects.create(session=session, message="", is_user=False, is_complete=False)
+        self._parts = []
+        self._flushed_parts = 0
+        self._last_flush = time.monotonic()
+
+    @property
+    def text(self):
+        return "".join(self._parts)
+
+    def append(self, text):
+        self._parts.append(text)
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write the text received so far, if anything new arrived since the last write"""
+        self._last_flush = time.monotonic()
+        if len(self._parts) == self._flushed_parts:
+            return
+        try:
+            ChatMessage.objects.filter(id=self.message.id).update(message=self.text)
+            self._flushed_parts = len(self._parts)
+        except Exception as e:
+            logger.warning("Error saving partial message %s: %s", self.message.id, e)
+
+    @retry_on_locked
+    def finalize(self):
+        """Write the full answer and mark the message complete"""
+        self.message.message = self.text
+        self.message.is_complete = True
+        ChatMessage.objects.filter(id=self.message.id).update(message=self.message.message, is_complete=True)
+        return self.message
@@ -0,0 +1,116 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram, safe to update from concurrent requests"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket it falls in (None if empty)"""
+        with self._lock:
+            if self.count == 0:
+                return None
+            rank = q * self.count
+            seen = 0
+            for index, bucket_count in enumerate(self.counts):
+                seen += bucket_count
+                if seen >= rank:
+                    return self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+        return self.buckets[-1]
+
+    def snapshot(self):
+        with self._lock:
+            cumulative = 0
+            buckets = {}
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), self.counts):
+                cumulative += bucket_count
+                buckets[str(bound)] = cumulative
+            count, total = self.count, self.sum
+        return {
+            "count": count,
+            "sum": round(total, 6),
+            "buckets": buckets,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class MetricsRegistry:
+    """In-process registry of named latency histograms"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            return histogram
+
+    def observe(self, name, seconds):
+        self.histogram(name).observe(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            histograms = dict(self._histograms)
+        return {name: histogram.snapshot() for name, histogram in sorted(histograms.items())}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+registry = MetricsRegistry()
+
+
+class StageTimer:
+    """
+    Collect the stage timings of one request and feed them into the registry
+
+    Each stage is recorded under '<prefix>.<stage>' in the registry and kept in milliseconds
+    for the response metadata.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.timings = {}
+        self.started_at = time.perf_counter()
+
+    @contextmanager
+    def span(self, stage):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started_at)
+
+    def record(self, stage, seconds):
+        self.timings[stage] = round(seconds * 1000, 2)
+        registry.observe(f"{self.prefix}.{stage}", seconds)
+
+    def finish(self):
+        """Record the end-to-end duration and return all timings in milliseconds"""
+        self.record("total", time.perf_counter() - self.started_at)
+        return dict(self.timings)
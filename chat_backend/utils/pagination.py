@@ -0,0 +1,138 @@
+import base64
+import binascii
+import json
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def get_page_size(request, default, maximum, param='page_size'):
+    """Requested page size clamped to 1..maximum (default when missing or invalid)"""
+    try:
+        page_size = int(request.query_params.get(param, default))
+    except (TypeError, ValueError):
+        return default
+    return min(max(page_size, 1), maximum)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Newest-first cursor pagination on (created_at, id)
+
+    Each page is a range scan after the last row of the previous page, so it costs the same
+    at any depth (unlike OFFSET). The cursor is opaque to clients; use the `next` link.
+    Works on model instances and on values() rows that include created_at and id.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.next_cursor = None
+        page_size = get_page_size(request, self.page_size, self.max_page_size, self.page_size_query_param)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            created_at, pk = self.decode_cursor(cursor)
+            # The redundant created_at__lte bound lets the (created_at, id) index seek to the cursor
+            queryset = queryset.filter(created_at__lte=created_at).filter(Q(created_at__lt=created_at) | Q(id__lt=pk))
+
+        # One extra row tells whether there is a next page without a COUNT
+        rows = list(queryset.order_by('-created_at', '-id')[:page_size + 1])
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_cursor = self.encode_cursor(rows[-1])
+        return rows
+
+    def encode_cursor(self, row):
+        if isinstance(row, dict):
+            created_at, pk = row['created_at'], row['id']
+        else:
+            created_at, pk = row.created_at, row.id
+        raw = json.dumps([created_at.isoformat(), pk]).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    def decode_cursor(self, cursor):
+        try:
+            created_at, pk = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeEncodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'next_cursor': self.next_cursor,
+            'results': data
+        })
+
+
+class MessageHistoryPagination(BasePagination):
+    """
+    Id-cursor pagination of a chat history, for scrolling back and for incremental sync
+
+    Without parameters the newest page is returned, newest first; ?before=<id> continues
+    with older messages. ?after=<id> returns the messages that follow, oldest first, so a
+    client can poll with the `after` of its last response and only receive new messages.
+    Rows must have id and is_complete. Invalid parameters raise ValueError.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        before = self._message_id(request, 'before')
+        after = self._message_id(request, 'after')
+        if before is not None and after is not None:
+            raise ValueError("Use either before or after, not both")
+        page_size = get_page_size(request, self.page_size, self.max_page_size, self.page_size_query_param)
+
+        if after is not None:
+            rows = list(queryset.filter(id__gt=after).order_by('id')[:page_size + 1])
+        else:
+            if before is not None:
+                queryset = queryset.filter(id__lt=before)
+            rows = list(queryset.order_by('-id')[:page_size + 1])
+        self.has_more = len(rows) > page_size
+        rows = rows[:page_size]
+
+        chronological = rows if after is not None else rows[::-1]
+        self.before = chronological[0]['id'] if after is None and self.has_more else None
+        self.after = chronological[-1]['id'] if chronological else after
+        at_tail = not self.has_more if after is not None else before is None
+        if at_tail and chronological and not chronological[-1]['is_complete']:
+            # The newest answer is still being streamed: the next poll starts before it,
+            # so the client gets it again once it is complete
+            self.after = chronological[-2]['id'] if len(chronological) > 1 else after
+        return rows
+
+    def _message_id(self, request, param):
+        value = request.query_params.get(param)
+        if value in (None, ''):
+            return None
+        if not value.isdigit():
+            raise ValueError(f"{param} must be a message id")
+        return int(value)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'messages': data,
+            'has_more': self.has_more,
+            'before': self.before,
+            'after': self.after
+        })
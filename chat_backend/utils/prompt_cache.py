@@ -0,0 +1,111 @@
+import logging
+import time
+from django.conf import settings
+from django.core.cache import cache
+from ..models import Goal
+from .tokens import count_tokens
+from .memory import get_core_profile
+
+logger = logging.getLogger(__name__)
+
+MEMORY_VERSION_KEY = "prompt:memory_version"
+
+
+def _goals_version_key(session_id):
+    return f"prompt:goals_version:{session_id}"
+
+
+def _prefix_key(session_id, memory_version, goals_version):
+    return f"prompt:prefix:{session_id}:{memory_version}:{goals_version}"
+
+
+def _bump_version(key):
+    """Increment a version counter, invalidating every prefix built against the old value"""
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Counter missing (never read or evicted): restart from a value that cannot match stale prefixes
+        cache.set(key, time.time_ns(), None)
+
+
+def bump_memory_version():
+    """Invalidate cached system prompts of every session (the core profile is shared)"""
+    _bump_version(MEMORY_VERSION_KEY)
+
+
+def bump_goals_version(session_id):
+    """Invalidate the cached system prompt of a single session"""
+    _bump_version(_goals_version_key(session_id))
+
+
+def _get_versions(session_id):
+    goals_key = _goals_version_key(session_id)
+    versions = cache.get_many([MEMORY_VERSION_KEY, goals_key])
+    for key in (MEMORY_VERSION_KEY, goals_key):
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return versions[MEMORY_VERSION_KEY], versions[goals_key]
+
+
+def build_system_prompt_prefix(session):
+    """Assemble the stable part of the system prompt: base prompt, core learner profile and goals"""
+    # Load the core learner profile; other memories are retrieved per query
+    memory_context = ""
+    try:
+        memory_context = get_core_profile()
+    except Exception as e:
+        logger.warning("Error loading memory context: %s", e)
+
+    # Load goals context
+    goals_context = ""
+    try:
+        goals_list = []
+        for goal in Goal.objects.filter(session=session).order_by('-created_at'):
+            goal_text = f"- {goal.title} (Status: {goal.status})"
+            if goal.description:
+                goal_text += f": {goal.description}"
+            if goal.deadline:
+                goal_text += f" [Deadline: {goal.deadline.strftime('%Y-%m-%d')}]"
+            goals_list.append(goal_text)
+        goals_context = "\n".join(goals_list)
+    except Exception as e:
+        logger.warning("Error loading goals context: %s", e)
+
+    system_message = settings.SYSTEM_PROMPT
+
+    if memory_context:
+        system_message += f"\n\n### Previous Learning Context:\n{memory_context}\n\nUse this context to personalize your responses and build upon previous interactions."
+
+    if goals_context:
+        system_message += f"\n\n### User's Goals:\n{goals_context}\n\nKeep these goals in mind when providing assistance. Help the user work towards achieving these goals and provide relevant progress updates."
+
+    return system_message
+
+
+def get_system_prompt_prefix(session):
+    """
+    Get the system prompt prefix for a session, served from cache while memory and goals are unchanged
+
+    The cache key embeds the core memory version and the session's goals version, both bumped
+    by model signals, so stale prefixes are never served and simply expire.
+
+    Returns:
+        tuple: (prefix text, prefix token count)
+    """
+    timeout = getattr(settings, 'SYSTEM_PROMPT_CACHE_TIMEOUT', 3600)
+    try:
+        memory_version, goals_version = _get_versions(session.id)
+        key = _prefix_key(session.id, memory_version, goals_version)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached["prefix"], cached["token_count"]
+    except Exception as e:
+        logger.warning("Error reading system prompt cache: %s", e)
+        key = None
+
+    prefix = build_system_prompt_prefix(session)
+    token_count = count_tokens(prefix)
+    if key is not None:
+        cache.set(key, {"prefix": prefix, "token_count": token_count}, timeout)
+    return prefix, token_count
@@ -0,0 +1,88 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from ..models import ChatMessage, QuizBatchJob, QuizBatchItem
+from .quiz_generation import generate_quiz
+from .quiz_writer import QuizAlreadyExists
+from .llm_admission import PRIORITY_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+
+def start_quiz_batch(groq_client, session_id=None, message_ids=None, regenerate=False):
+    """
+    Create a batch job generating quizzes for many messages and run it in the background
+
+    Messages are either the given message_ids (restricted to the session when one is given) or
+    every completed assistant answer of the session.
+    Messages that already have a quiz are found in the same query and recorded as skipped; the
+    rest are generated concurrently, at most settings.QUIZ_BATCH_CONCURRENCY at a time.
+
+    Returns:
+        QuizBatchJob: The job, already running
+    """
+    if message_ids is not None:
+        messages = ChatMessage.objects.filter(id__in=message_ids)
+        if session_id is not None:
+            messages = messages.filter(session_id=session_id)
+    else:
+        messages = ChatMessage.objects.filter(session_id=session_id, is_user=False, is_complete=True)
+    rows = list(messages.order_by('id').values_list('id', 'quiz_id'))
+
+    job = QuizBatchJob.objects.create(session_id=session_id)
+    QuizBatchItem.objects.bulk_create([
+        QuizBatchItem(job=job, message_id=message_id, quiz_id=quiz_id, status='skipped' if quiz_id else 'pending')
+        for message_id, quiz_id in rows
+    ])
+
+    pending = list(job.items.filter(status='pending').values_list('id', 'message_id'))
+    if not pending:
+        QuizBatchJob.objects.filter(id=job.id).update(status='completed', finished_at=timezone.now())
+        job.refresh_from_db()
+        return job
+
+    QuizBatchJob.objects.filter(id=job.id).update(status='running')
+    job.status = 'running'
+    thread = threading.Thread(target=_run_batch, args=(job.id, pending, groq_client, regenerate), daemon=True)
+    thread.start()
+    return job
+
+
+def _run_batch(job_id, pending, groq_client, regenerate):
+    status = 'completed'
+    try:
+        concurrency = getattr(settings, 'QUIZ_BATCH_CONCURRENCY', 4)
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"quiz-batch-{job_id}") as executor:
+            list(executor.map(lambda item: _run_item(item[0], item[1], groq_client, regenerate), pending))
+    except Exception:
+        logger.exception("Quiz batch %s failed", job_id)
+        status = 'failed'
+    finally:
+        QuizBatchJob.objects.filter(id=job_id).update(status=status, finished_at=timezone.now())
+        connections.close_all()
+
+
+def _run_item(item_id, message_id, groq_client, regenerate):
+    """Generate the quiz of one batch item, recording the outcome on the item"""
+    items = QuizBatchItem.objects.filter(id=item_id)
+    try:
+        items.update(status='running')
+        message = ChatMessage.objects.get(id=message_id)
+        quiz, _, cached = generate_quiz(message, groq_client, regenerate=regenerate, priority=PRIORITY_BACKGROUND)
+        items.update(status='completed', quiz=quiz, cached=cached)
+    except QuizAlreadyExists:
+        # Another request quizzed the message while the batch was queued
+        quiz_id = ChatMessage.objects.filter(id=message_id).values_list('quiz_id', flat=True).first()
+        items.update(status='skipped', quiz_id=quiz_id)
+    except Exception as e:
+        logger.warning("Quiz batch item %s (message %s) failed: %s", item_id, message_id, e)
+        try:
+            items.update(status='failed', error=str(e))
+        except Exception:
+            logger.exception("Could not record failure of quiz batch item %s", item_id)
+    finally:
+        # Each pool thread has its own connection
+        connections.close_all()
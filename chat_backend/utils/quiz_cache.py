@@ -0,0 +1,40 @@
+import hashlib
+import re
+from django.conf import settings
+from django.db.models import F
+from ..models import QuizGenerationCache
+
+
+def quiz_cache_key(content, prompt_version=None):
+    """Hash of the prompt version and the message content with whitespace and case normalized"""
+    if prompt_version is None:
+        prompt_version = getattr(settings, 'QUIZ_PROMPT_VERSION', '1')
+    normalized = re.sub(r"\s+", " ", content).strip().casefold()
+    return hashlib.sha256(f"{prompt_version}\n{normalized}".encode("utf-8")).hexdigest()
+
+
+def get_cached_quiz(key):
+    """Return the cached quiz payload for a key (None on a miss), counting the hit"""
+    payload = QuizGenerationCache.objects.filter(key=key).values_list('payload', flat=True).first()
+    if payload is not None:
+        QuizGenerationCache.objects.filter(key=key).update(hits=F('hits') + 1)
+    return payload
+
+
+def store_cached_quiz(key, quiz, questions):
+    """Cache a generated quiz (as stored after validation) for identical content"""
+    QuizGenerationCache.objects.update_or_create(
+        key=key,
+        defaults={
+            "prompt_version": getattr(settings, 'QUIZ_PROMPT_VERSION', '1'),
+            "payload": {
+                "title": quiz.title,
+                "description": quiz.description,
+                "questions": [{
+                    "question_text": question.question_text,
+                    "options": question.options,
+                    "correct_answer": question.correct_answer
+                } for question in questions],
+            },
+        },
+    )
@@ -0,0 +1,252 @@
+import json
+import logging
+from django.conf import settings
+from ..models import Quiz, Question
+from .quiz_writer import create_quiz, clean_questions, QuizValidationError
+from .quiz_cache import quiz_cache_key, get_cached_quiz, store_cached_quiz
+from .streaming_json import StreamingJSONParser
+from .llm_admission import admitted_completion, PRIORITY_QUIZ, PRIORITY_BACKGROUND
+from .response_cache import bump_quiz_versions
+
+logger = logging.getLogger(__name__)
+
+
+def build_quiz_messages(content):
+    """Chat messages asking the model for a 5-question multiple choice quiz about content"""
+    quiz_prompt = f"""### Role
+You're a Quiz Generation Assistant. Create a comprehensive quiz based on the given message content.
+
+### Task
+Generate a quiz with 5 multiple choice questions based on the message content. Focus on key concepts, important details, and practical applications.
+
+### Output Format
+Return a JSON object with this structure:
+{{
+  "title": "Quiz title based on the message content",
+  "description": "Brief description of what this quiz covers",
+  "questions": [
+    {{
+      "question_text": "Question text here",
+      "options": ["Option A", "Option B", "Option C", "Option D"],
+      "correct_answer": "Correct option text (must match one of the options exactly)"
+    }}
+  ]
+}}
+
+### Message Content
+{content}
+
+### Instructions
+- Create questions that test understanding of the main concepts
+- Make sure all options are plausible but only one is correct
+- Keep questions clear and concise
+- Ensure the correct_answer exactly matches one of the options#
+
+# Rules:
+# Output only a VALID JSON object with the structure specified above.
+# Do not include any other text or comments."""
+
+    return [
+        {"role": "system", "content": "You are a quiz generation assistant. Always return valid JSON."},
+        {"role": "user", "content": quiz_prompt}
+    ]
+
+
+
+def generate_quiz(message, groq_client, regenerate=False, priority=PRIORITY_QUIZ):
+    """
+    Generate and save a quiz for a chat message, reusing a cached generation for identical content
+
+    Args:
+        message (ChatMessage): Message to build the quiz from
+        groq_client: Groq client used on a cache miss
+        regenerate (bool): Skip the cache lookup (the fresh result replaces the cached one)
+        priority (int): Admission priority of the Groq call
+
+    Returns:
+        tuple: (Quiz, list of Question, whether it came from the cache)
+
+    Raises:
+        QuizValidationError: If the model output is not a valid quiz
+        QuizAlreadyExists: If the message got a quiz in the meantime
+        LLMOverloaded: If the Groq call is not admitted
+    """
+    quiz_data, cached, cache_key = _quiz_payload(message.message, groq_client, regenerate, priority)
+    quiz, questions = _save_quiz(message, quiz_data)
+    if not cached:
+        store_cached_quiz(cache_key, quiz, questions)
+    return quiz, questions, cached
+
+
+def generate_document_quiz(session_id, content, chunk_indices, groq_client, priority=PRIORITY_BACKGROUND):
+    """
+    Generate and save a practice quiz for a group of PDF chunks (not linked to any chat message)
+
+    Args:
+        session_id (int): Session whose PDF the chunks come from
+        content (str): Text of the chunks
+        chunk_indices (list): Indices of the chunks, stored on the quiz as source_chunks
+        groq_client: Groq client used on a cache miss
+        priority (int): Admission priority of the Groq call
+
+    Returns:
+        tuple: (Quiz, list of Question, whether it came from the cache)
+    """
+    quiz_data, cached, cache_key = _quiz_payload(content, groq_client, False, priority)
+    quiz, questions = create_quiz(
+        session_id,
+        quiz_data.get("title") or "Practice Quiz",
+        quiz_data.get("description", ""),
+        questions_data=quiz_data.get("questions", []),
+        source="document",
+        source_chunks=list(chunk_indices)
+    )
+    if not cached:
+        store_cached_quiz(cache_key, quiz, questions)
+    return quiz, questions, cached
+
+
+def _quiz_payload(content, groq_client, regenerate, priority):
+    """Quiz JSON for content, from the cache or a Groq call; returns (payload, cached, cache key)"""
+    cache_key = quiz_cache_key(content)
+    if not regenerate:
+        cached_quiz = get_cached_quiz(cache_key)
+        if cached_quiz is not None:
+            return cached_quiz, True, cache_key
+
+    response = admitted_completion(
+        groq_client,
+        priority,
+        messages=build_quiz_messages(content),
+        model=settings.MODEL,
+        temperature=0.7,
+        max_tokens=3000
+    )
+    try:
+        quiz_data = json.loads(response.choices[0].message.content.strip())
+    except json.JSONDecodeError:
+        raise QuizValidationError("Failed to generate valid quiz data")
+    if not isinstance(quiz_data, dict):
+        raise QuizValidationError("Failed to generate valid quiz data")
+    return quiz_data, False, cache_key
+
+
+def _save_quiz(message, quiz_data):
+    """Create the quiz with its questions and link it to the message in one transaction"""
+    return create_quiz(
+        message.session_id,
+        quiz_data.get("title") or f"Quiz for Message {message.id}",
+        quiz_data.get("description", ""),
+        questions_data=quiz_data.get("questions", []),
+        message_id=message.id
+    )
+
+def completion_text(stream):
+    """Text deltas of a streaming chat completion; closes the upstream stream when done or abandoned"""
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+
+
+def stream_quiz_generation(message, pieces, cache_key=None, cached=False):
+    """
+    Build a quiz for a chat message from streamed model output, persisting it as it arrives
+
+    The quiz is created (and linked to the message) as soon as its title is parsed, and each
+    question is inserted as soon as its object closes. If the output is truncated or malformed,
+    the questions that did arrive are kept; a quiz without any question is removed again.
+
+    Args:
+        message (ChatMessage): Message the quiz is generated from
+        pieces: Iterable of output text pieces (see completion_text)
+        cache_key (str): Quiz cache key to store a complete generation under (None skips caching)
+        cached (bool): Whether pieces replay a cached generation
+
+    Yields:
+        dict: Events: 'quiz' once created, 'question' per saved question, and a final event
+              marked done with the quiz id, question count and whether the output was complete
+    """
+    parser = StreamingJSONParser()
+    quiz = None
+    title = None
+    description = ""
+    questions = []
+
+    def ensure_quiz():
+        nonlocal quiz
+        if quiz is None:
+            quiz, _ = create_quiz(message.session_id, title or f"Quiz for Message {message.id}", description, message_id=message.id)
+            return {"type": "quiz", "quiz_id": quiz.id, "title": quiz.title, "description": quiz.description, "done": False}
+        return None
+
+    try:
+        try:
+            for text in pieces:
+                for kind, key, value in parser.feed(text):
+                    if kind == "field" and key == "title" and isinstance(value, str):
+                        title = value
+                        event = ensure_quiz()
+                        if event:
+                            yield event
+                    elif kind == "field" and key == "description" and isinstance(value, str):
+                        description = value
+                        if quiz is not None:
+                            Quiz.objects.filter(id=quiz.id).update(description=description)
+                            bump_quiz_versions(quiz.id, quiz.session_id)
+                            quiz.description = description
+                    elif kind == "item" and key == "questions":
+                        try:
+                            q_data = clean_questions([value])
+                        except QuizValidationError:
+                            q_data = []
+                        if not q_data:
+                            continue
+                        event = ensure_quiz()
+                        if event:
+                            yield event
+                        question = Question.objects.create(quiz=quiz, **q_data[0])
+                        questions.append(question)
+                        yield {"type": "question", "question": {
+                            "id": question.id,
+                            "question_text": question.question_text,
+                            "options": question.options,
+                            "correct_answer": question.correct_answer
+                        }, "done": False}
+        except QuizValidationError as e:
+            yield {"type": "error", "error": str(e), "done": True}
+            return
+        except Exception as e:
+            # Keep what was salvaged; the client learns the quiz is partial from 'complete'
+            logger.warning("Quiz generation for message %s failed after %d questions: %s", message.id, len(questions), e)
+            if not questions:
+                yield {"type": "error", "error": f"Failed to generate quiz: {e}", "done": True}
+                return
+
+        if not questions:
+            yield {"type": "error", "error": "Failed to generate valid quiz data", "done": True}
+            return
+
+        if parser.done and cache_key:
+            store_cached_quiz(cache_key, quiz, questions)
+        yield {
+            "type": "complete",
+            "quiz_id": quiz.id,
+            "title": quiz.title,
+            "description": quiz.description,
+            "question_count": len(questions),
+            "complete": parser.done,
+            "cached": cached,
+            "done": True
+        }
+    finally:
+        close = getattr(pieces, "close", None)
+        if close is not None:
+            close()
+        if quiz is not None and not questions:
+            # Nothing usable arrived: free the message for another attempt
+            quiz.delete()
@@ -0,0 +1,91 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections
+from ..models import Quiz
+from .vectorstore import get_vector_store
+from .quiz_generation import generate_document_quiz
+
+logger = logging.getLogger(__name__)
+
+# Sessions whose question banks are being generated in this process
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def group_chunks(chunks, chunks_per_group, max_groups):
+    """
+    Split PDF chunks into runs of consecutive chunks, one question bank per run
+
+    Returns:
+        list: (chunk indices, joined text) tuples, at most max_groups of them
+    """
+    chunks_per_group = max(1, chunks_per_group)
+    groups = []
+    for start in range(0, len(chunks), chunks_per_group):
+        if len(groups) >= max_groups:
+            break
+        indices = list(range(start, min(start + chunks_per_group, len(chunks))))
+        groups.append((indices, "\n\n".join(chunks[i] for i in indices)))
+    return groups
+
+
+def is_pregenerating(session_id):
+    """Whether question banks for the session are still being generated"""
+    with _in_flight_lock:
+        return session_id in _in_flight
+
+
+def start_quiz_pregeneration(session_id, groq_client):
+    """
+    Generate practice quizzes from the session's PDF chunks in the background
+
+    Does nothing unless settings.QUIZ_PREGENERATION_ENABLED is set, or if a run for the
+    session is already in progress in this process.
+
+    Returns:
+        bool: Whether a run was started
+    """
+    if not getattr(settings, 'QUIZ_PREGENERATION_ENABLED', False):
+        return False
+    with _in_flight_lock:
+        if session_id in _in_flight:
+            return False
+        _in_flight.add(session_id)
+
+    thread = threading.Thread(target=_pregenerate, args=(session_id, groq_client), daemon=True)
+    thread.start()
+    return True
+
+
+def _pregenerate(session_id, groq_client):
+    try:
+        chunks = get_vector_store().get_pdf_chunks(str(session_id))
+        # Banks of a previously uploaded PDF that were never practiced are replaced
+        Quiz.objects.filter(session_id=session_id, source='document', attempts__isnull=True).delete()
+        groups = group_chunks(
+            chunks,
+            getattr(settings, 'QUIZ_PREGENERATION_CHUNKS_PER_GROUP', 3),
+            getattr(settings, 'QUIZ_PREGENERATION_MAX_GROUPS', 10)
+        )
+        concurrency = getattr(settings, 'QUIZ_BATCH_CONCURRENCY', 4)
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"quiz-pregen-{session_id}") as executor:
+            list(executor.map(lambda group: _generate_bank(session_id, group[0], group[1], groq_client), groups))
+    except Exception:
+        logger.exception("Quiz pre-generation for session %s failed", session_id)
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard(session_id)
+        connections.close_all()
+
+
+def _generate_bank(session_id, chunk_indices, text, groq_client):
+    """Generate the quiz of one chunk group; failures are logged and skipped"""
+    try:
+        generate_document_quiz(session_id, text, chunk_indices, groq_client)
+    except Exception as e:
+        logger.warning("Quiz pre-generation for session %s, chunks %s failed: %s", session_id, chunk_indices, e)
+    finally:
+        # Each pool thread has its own connection
+        connections.close_all()
@@ -0,0 +1,190 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+from ..models import UserQuizAttempt, SessionStats, QuizStats, QuestionStats
+from .sqlite import retry_on_locked
+
+COUNTERS = ("attempts", "graded", "correct")
+
+
+def _tally(attempts, key):
+    """Counter deltas of a submission per key(attempt); attempts whose key is None are skipped"""
+    totals = {}
+    for attempt in attempts:
+        k = key(attempt)
+        if k is None:
+            continue
+        total = totals.setdefault(k, {"attempts": 0, "graded": 0, "correct": 0})
+        total["attempts"] += 1
+        if attempt.is_correct is not None:
+            total["graded"] += 1
+            total["correct"] += int(attempt.is_correct)
+    return totals
+
+
+def _apply(model, key_field, totals, create_fields, last_attempt_at, submissions=False):
+    """
+    Add the deltas to the stats rows, creating missing rows first
+
+    Rows getting the same deltas share one UPDATE, so a typical submission (one attempt per
+    question, right or wrong) costs a handful of queries whatever the number of questions.
+    All rows take the submission time as last_attempt_at for the same reason.
+    """
+    model.objects.bulk_create(
+        [model(**{key_field: k}, **create_fields(k)) for k in totals],
+        ignore_conflicts=True
+    )
+    by_delta = defaultdict(list)
+    for k, total in totals.items():
+        by_delta[tuple(total[name] for name in COUNTERS)].append(k)
+
+    for (attempts, graded, correct), keys in by_delta.items():
+        updates = {
+            "attempts": F("attempts") + attempts,
+            "graded": F("graded") + graded,
+            "correct": F("correct") + correct,
+            "last_attempt_at": last_attempt_at,
+        }
+        if submissions:
+            updates["submissions"] = F("submissions") + 1
+        model.objects.filter(**{f"{key_field}__in": keys}).update(**updates)
+
+
+def _advance_streak(current, best, graded_results):
+    """Streaks after a run of graded answers (True/False) in attempt order"""
+    for is_correct in graded_results:
+        current = current + 1 if is_correct else 0
+        best = max(best, current)
+    return current, best
+
+
+@retry_on_locked
+def save_submission(attempts):
+    """
+    Insert the attempts of one submission and update the stats, all or nothing
+
+    The attempts share the submission time, which the stats record as last_attempt_at: a
+    rebuild from the rows (Max per question, quiz or session) then gives the same value.
+    """
+    submitted_at = timezone.now()
+    for attempt in attempts:
+        attempt.attempted_at = submitted_at
+    with transaction.atomic():
+        attempts = UserQuizAttempt.objects.bulk_create(attempts)
+        record_submission(attempts)
+    return attempts
+
+
+def record_submission(attempts):
+    """
+    Update session, quiz and question stats for the attempts of one submission
+
+    Call inside the transaction that inserted the attempts, so stats never drift from the rows.
+    """
+    if not attempts:
+        return
+    attempts = sorted(attempts, key=lambda attempt: attempt.id or 0)
+    submitted_at = max(attempt.attempted_at for attempt in attempts)
+
+    quiz_sessions = {attempt.quiz_id: attempt.quiz.session_id for attempt in attempts}
+    question_quizzes = {attempt.question_id: attempt.quiz_id for attempt in attempts if attempt.question_id}
+    _apply(QuizStats, "quiz_id", _tally(attempts, lambda a: a.quiz_id),
+           lambda quiz_id: {"session_id": quiz_sessions[quiz_id]}, submitted_at, submissions=True)
+    _apply(QuestionStats, "question_id", _tally(attempts, lambda a: a.question_id),
+           lambda question_id: {"quiz_id": question_quizzes[question_id]}, submitted_at)
+
+    for session_id, total in _tally(attempts, lambda a: a.session_id).items():
+        SessionStats.objects.bulk_create([SessionStats(session_id=session_id)], ignore_conflicts=True)
+        # Streaks depend on the previous value, so read it under a row lock
+        stats = SessionStats.objects.select_for_update().get(session_id=session_id)
+        current, best = _advance_streak(stats.current_streak, stats.best_streak, [
+            attempt.is_correct for attempt in attempts
+            if attempt.session_id == session_id and attempt.is_correct is not None
+        ])
+        SessionStats.objects.filter(session_id=session_id).update(
+            attempts=F("attempts") + total["attempts"],
+            graded=F("graded") + total["graded"],
+            correct=F("correct") + total["correct"],
+            submissions=F("submissions") + 1,
+            current_streak=current,
+            best_streak=best,
+            last_attempt_at=submitted_at
+        )
+
+
+def rebuild_stats(session_id=None):
+    """
+    Recompute stats from UserQuizAttempt rows, for all sessions or one
+
+    Submissions are counted by attempt_group, so attempts stored before groups existed
+    count as attempts but not as submissions.
+
+    Returns:
+        dict: Number of session, quiz and question stats rows written
+    """
+    # Session stats count the session's attempts; quiz and question stats count the attempts
+    # on the session's quizzes
+    attempts = UserQuizAttempt.objects.all()
+    quiz_attempts = UserQuizAttempt.objects.all()
+    if session_id is not None:
+        attempts = attempts.filter(session_id=session_id)
+        quiz_attempts = quiz_attempts.filter(quiz__session_id=session_id)
+    counters = {
+        "attempts": Count("id"),
+        "graded": Count("is_correct"),
+        "correct": Count("id", filter=Q(is_correct=True)),
+        "last_attempt_at": Max("attempted_at"),
+    }
+
+    with transaction.atomic():
+        if session_id is None:
+            SessionStats.objects.all().delete()
+            QuizStats.objects.all().delete()
+            QuestionStats.objects.all().delete()
+        else:
+            SessionStats.objects.filter(session_id=session_id).delete()
+            QuizStats.objects.filter(session_id=session_id).delete()
+            QuestionStats.objects.filter(quiz__session_id=session_id).delete()
+
+        quiz_rows = quiz_attempts.values("quiz_id", "quiz__session_id").annotate(
+            submissions=Count("attempt_group", distinct=True), **counters
+        )
+        QuizStats.objects.bulk_create([
+            QuizStats(quiz_id=row["quiz_id"], session_id=row["quiz__session_id"], submissions=row["submissions"],
+                      **{name: row[name] for name in counters})
+            for row in quiz_rows
+        ])
+
+        question_rows = quiz_attempts.filter(question__isnull=False).values("question_id", "quiz_id").annotate(**counters)
+        QuestionStats.objects.bulk_create([
+            QuestionStats(question_id=row["question_id"], quiz_id=row["quiz_id"], **{name: row[name] for name in counters})
+            for row in question_rows
+        ])
+
+        streaks = {}
+        graded = attempts.filter(is_correct__isnull=False).order_by("session_id", "id").values_list("session_id", "is_correct")
+        for attempt_session_id, is_correct in graded.iterator():
+            streaks[attempt_session_id] = _advance_streak(*streaks.get(attempt_session_id, (0, 0)), [is_correct])
+
+        session_rows = attempts.values("session_id").annotate(
+            submissions=Count("attempt_group", distinct=True), **counters
+        )
+        SessionStats.objects.bulk_create([
+            SessionStats(
+                session_id=row["session_id"],
+                submissions=row["submissions"],
+                current_streak=streaks.get(row["session_id"], (0, 0))[0],
+                best_streak=streaks.get(row["session_id"], (0, 0))[1],
+                **{name: row[name] for name in counters}
+            )
+            for row in session_rows
+        ])
+
+    return {"sessions": len(session_rows), "quizzes": len(quiz_rows), "questions": len(question_rows)}
+
+
+def with_accuracy(row):
+    """Add accuracy over graded answers to a stats values() row"""
+    row["accuracy"] = round(row["correct"] / row["graded"], 4) if row["graded"] else None
+    return row
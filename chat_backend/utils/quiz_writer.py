@@ -0,0 +1,95 @@
+from django.db import transaction
+from ..models import Quiz, Question, ChatMessage
+from .sqlite import retry_on_locked
+from .response_cache import bump_version, quiz_resource
+
+
+class QuizValidationError(ValueError):
+    """Raised when a quiz or question payload is invalid; the message is safe to return to clients"""
+
+
+class QuizAlreadyExists(QuizValidationError):
+    """Raised when the chat message to link already has a quiz"""
+
+
+def clean_questions(questions_data):
+    """
+    Validate a list of question payloads
+
+    Items without question_text are skipped, as AddQuestionsView always did.
+
+    Returns:
+        list: Dicts with question_text, correct_answer and options
+
+    Raises:
+        QuizValidationError: If the payload is not a non-empty list of well-formed questions
+    """
+    if not isinstance(questions_data, list) or not questions_data:
+        raise QuizValidationError("List of questions is required")
+
+    cleaned = []
+    for index, q_data in enumerate(questions_data):
+        if not isinstance(q_data, dict):
+            raise QuizValidationError(f"Question {index} must be an object")
+        question_text = q_data.get("question_text")
+        if not question_text:
+            continue
+        options = q_data.get("options", [])
+        if not isinstance(options, list):
+            raise QuizValidationError(f"Question {index}: options must be a list")
+        cleaned.append({
+            "question_text": str(question_text),
+            "correct_answer": str(q_data.get("correct_answer") or ""),
+            "options": options,
+        })
+    return cleaned
+
+
+def add_questions(quiz, questions):
+    """Insert cleaned questions for a quiz with one bulk INSERT (ids are set on the returned objects)"""
+    created_questions = Question.objects.bulk_create([Question(quiz=quiz, **q_data) for q_data in questions])
+    # bulk_create sends no post_save signals
+    if created_questions:
+        bump_version(quiz_resource(quiz.id))
+    return created_questions
+
+
+@retry_on_locked
+def create_quiz(session_id, title, description="", questions_data=None, message_id=None, source="chat", source_chunks=None):
+    """
+    Create a quiz with its questions and optionally link it to a chat message, all in one transaction
+
+    Args:
+        session_id (int): Session the quiz belongs to
+        title (str): Quiz title
+        description (str): Quiz description
+        questions_data (list): Raw question payloads, validated with clean_questions (None for an empty quiz)
+        message_id (int): Chat message to link the quiz to; it must not have a quiz yet
+        source (str): 'chat' or 'document'
+        source_chunks (list): PDF chunk indices of a document quiz
+
+    Returns:
+        tuple: (Quiz, list of created Question objects)
+
+    Raises:
+        QuizValidationError: If the payload is invalid
+        QuizAlreadyExists: If the message already has a quiz (nothing is written)
+    """
+    if not title:
+        raise QuizValidationError("Quiz title is required")
+    questions = clean_questions(questions_data) if questions_data is not None else []
+
+    with transaction.atomic():
+        quiz = Quiz.objects.create(
+            session_id=session_id,
+            title=title,
+            description=description or "",
+            source=source,
+            source_chunks=source_chunks or []
+        )
+        created_questions = add_questions(quiz, questions)
+        if message_id is not None:
+            # Conditional update so two concurrent generations cannot both claim the message
+            if not ChatMessage.objects.filter(id=message_id, quiz__isnull=True).update(quiz=quiz):
+                raise QuizAlreadyExists("Quiz already exists for this message")
+    return quiz, created_questions
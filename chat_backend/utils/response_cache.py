@@ -0,0 +1,120 @@
+import hashlib
+import logging
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+SESSIONS = "sessions"
+GOALS = "goals"
+
+
+def quiz_resource(quiz_id):
+    return f"quiz:{quiz_id}"
+
+
+def session_quizzes_resource(session_id):
+    return f"session_quizzes:{session_id}"
+
+
+def _version_key(resource):
+    return f"response:version:{resource}"
+
+
+def _modified_key(resource):
+    return f"response:modified:{resource}"
+
+
+def _response_key(resource, version):
+    return f"response:{resource}:{version}"
+
+
+def _bump(resource):
+    key = _version_key(resource)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Counter missing (never read or evicted): restart from a value that cannot match stale entries
+        cache.set(key, time.time_ns(), None)
+    cache.set(_modified_key(resource), time.time(), None)
+
+
+def bump_version(resource):
+    """
+    Invalidate the cached responses of a resource
+
+    Inside a transaction the version is bumped again on commit: a request served between the
+    write and the commit may have cached the old rows under the intermediate version.
+    """
+    try:
+        _bump(resource)
+        if connection.in_atomic_block:
+            transaction.on_commit(lambda: _bump(resource))
+    except Exception as e:
+        logger.warning("Error bumping response cache version of %s: %s", resource, e)
+
+
+def bump_quiz_versions(quiz_id, session_id):
+    """Invalidate a quiz's details and its session's quiz list"""
+    bump_version(quiz_resource(quiz_id))
+    if session_id:
+        bump_version(session_quizzes_resource(session_id))
+
+
+def get_version(resource):
+    """(version, time of the last write) of a resource; unknown write times count as now"""
+    keys = {_version_key(resource): time.time_ns(), _modified_key(resource): time.time()}
+    values = cache.get_many(list(keys))
+    for key, initial in keys.items():
+        if key not in values:
+            cache.add(key, initial, None)
+            values[key] = cache.get(key)
+    return values[_version_key(resource)], values[_modified_key(resource)]
+
+
+def cached_response(request, resource, build):
+    """
+    Serve a GET response from cache while the resource version is unchanged
+
+    build() returns the Response for a cache miss; only 200 responses are cached. Responses
+    carry an ETag (hash of the body), and a request whose If-None-Match still matches gets a
+    304 with no body, so a poll of unchanged data costs two cache reads and no query.
+
+    Last-Modified is the second of the resource's last write. HTTP dates have no sub-second
+    part, so it is only sent once that second is over: any later write then moves it. As
+    usual, If-Modified-Since is only checked when no If-None-Match is sent.
+    """
+    timeout = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 3600)
+    last_modified = None
+    try:
+        version, modified_at = get_version(resource)
+        key = _response_key(resource, version)
+        entry = cache.get(key)
+        if int(modified_at) < int(time.time()):
+            last_modified = int(modified_at)
+    except Exception as e:
+        logger.warning("Error reading response cache: %s", e)
+        key, entry = None, None
+
+    if entry is None:
+        response = build()
+        if response.status_code != 200:
+            return response
+        digest = hashlib.md5(JSONRenderer().render(response.data)).hexdigest()
+        entry = {"data": response.data, "etag": f'"{digest}"'}
+        if key is not None:
+            cache.set(key, entry, timeout)
+
+    response = Response(entry["data"])
+    response["ETag"] = entry["etag"]
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    # Clients may keep the body but must revalidate on every poll
+    patch_cache_control(response, no_cache=True)
+    return get_conditional_response(request, etag=entry["etag"], last_modified=last_modified, response=response)
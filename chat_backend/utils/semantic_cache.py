@@ -0,0 +1,108 @@
+import hashlib
+import re
+import threading
+import time
+import numpy as np
+from django.conf import settings
+
+
+class SemanticCache:
+    """
+    In-process cache of assistant answers keyed on (document, personal context, query embedding)
+
+    Entries are bucketed per document; a lookup returns the most similar cached query in the
+    bucket whose cosine similarity reaches the threshold. Each bucket is capped and evicts the
+    least recently used entry first.
+    """
+
+    def __init__(self, threshold=0.95, ttl=24 * 60 * 60, max_entries_per_pdf=200):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries_per_pdf = max_entries_per_pdf
+        self._buckets = {}  # document key -> list of entry dicts
+        self._lock = threading.Lock()
+
+    def lookup(self, document_key, context_key, query_embedding):
+        """Return the cached response for the closest matching query, or None"""
+        query_vector = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        now = time.time()
+        with self._lock:
+            entries = self._buckets.get(document_key)
+            if not entries:
+                return None
+
+            # Drop expired entries while we hold the lock
+            entries[:] = [entry for entry in entries if now - entry['created_at'] < self.ttl]
+            candidates = [entry for entry in entries if entry['context_key'] == context_key]
+            if not candidates:
+                return None
+
+            scores = np.vstack([entry['embedding'] for entry in candidates]) @ query_vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+
+            entry = candidates[best]
+            entry['last_used'] = now
+            return entry['response']
+
+    def store(self, document_key, context_key, query_embedding, response):
+        """Cache a response for a query embedding"""
+        now = time.time()
+        entry = {
+            'context_key': context_key,
+            'embedding': np.asarray(query_embedding, dtype=np.float32).reshape(-1),
+            'response': response,
+            'created_at': now,
+            'last_used': now,
+        }
+        with self._lock:
+            entries = self._buckets.setdefault(document_key, [])
+            entries.append(entry)
+            if len(entries) > self.max_entries_per_pdf:
+                entries.remove(min(entries, key=lambda e: e['last_used']))
+
+    def clear(self, document_key=None):
+        """Drop every entry, or only those of one document"""
+        with self._lock:
+            if document_key is None:
+                self._buckets.clear()
+            else:
+                self._buckets.pop(document_key, None)
+
+
+_semantic_cache = None
+_semantic_cache_lock = threading.Lock()
+
+
+def get_semantic_cache():
+    """Get the process-wide semantic cache, or None when disabled in settings"""
+    global _semantic_cache
+    if not getattr(settings, 'SEMANTIC_CACHE_ENABLED', False):
+        return None
+    with _semantic_cache_lock:
+        if _semantic_cache is None:
+            _semantic_cache = SemanticCache(
+                threshold=getattr(settings, 'SEMANTIC_CACHE_THRESHOLD', 0.95),
+                ttl=getattr(settings, 'SEMANTIC_CACHE_TTL', 24 * 60 * 60),
+                max_entries_per_pdf=getattr(settings, 'SEMANTIC_CACHE_MAX_ENTRIES_PER_PDF', 200),
+            )
+        return _semantic_cache
+
+
+def get_document_key(vector_store, pdf_id):
+    """Key cache buckets on document content so identical PDFs uploaded to different sessions share answers"""
+    pdf_info = vector_store.get_pdf_info(pdf_id)
+    if not pdf_info:
+        return None
+    return pdf_info.get('content_hash') or pdf_id
+
+
+def get_context_key(system_prompt_prefix):
+    """Answers personalized by memory or goals only match queries asked under the same prefix"""
+    return hashlib.sha256(system_prompt_prefix.encode("utf-8")).hexdigest()
+
+
+def split_for_replay(text):
+    """Split a cached answer into word-sized chunks so replays use the normal streaming framing"""
+    return re.findall(r"\s*\S+\s*", text) or [text]
@@ -0,0 +1,55 @@
+import functools
+import logging
+import random
+import time
+from django.conf import settings
+from django.db import OperationalError, connection as default_connection
+
+logger = logging.getLogger(__name__)
+
+LOCK_ERRORS = ("database is locked", "database table is locked")
+
+
+def pragma_statements(pragmas, in_memory=False):
+    """PRAGMA statements for a {name: value} mapping (journal_mode is skipped for in-memory databases)"""
+    return [
+        f"PRAGMA {name} = {value}" for name, value in pragmas.items()
+        if not (in_memory and name == 'journal_mode')
+    ]
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """connection_created handler applying settings.SQLITE_PRAGMAS to every new SQLite connection"""
+    if connection.vendor != 'sqlite':
+        return
+    statements = pragma_statements(getattr(settings, 'SQLITE_PRAGMAS', {}), connection.is_in_memory_db())
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def is_lock_error(error):
+    return isinstance(error, OperationalError) and any(message in str(error) for message in LOCK_ERRORS)
+
+
+def retry_on_locked(func):
+    """
+    Retry a write transaction that failed because the database stayed locked past busy_timeout
+
+    Retries back off exponentially (settings.SQLITE_LOCK_RETRIES attempts, starting at
+    settings.SQLITE_LOCK_RETRY_DELAY seconds). Inside an outer atomic block the error is raised
+    as is: only the outermost transaction can be retried.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = getattr(settings, 'SQLITE_LOCK_RETRIES', 3)
+        delay = getattr(settings, 'SQLITE_LOCK_RETRY_DELAY', 0.05)
+        for attempt in range(retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if attempt == retries or not is_lock_error(e) or default_connection.in_atomic_block:
+                    raise
+                logger.warning("%s hit a locked database, retrying (%d/%d)", func.__qualname__, attempt + 1, retries)
+                time.sleep(delay * 2 ** attempt * (1 + random.random()))
+    return wrapper
@@ -0,0 +1,175 @@
+import json
+import logging
+import queue
+import threading
+import time
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+KEEP_ALIVE = ": keep-alive\n\n"
+_END = object()
+
+
+def format_sse(data):
+    """Frame a chunk dict as a Server-Sent Events data line"""
+    return f"data: {json.dumps(data)}\n\n"
+
+
+def _is_text_delta(data):
+    """Plain text deltas can be merged; anything carrying done/error/metadata is sent as-is"""
+    return not data.get("done", False) and data.keys() <= {"chunk", "done"}
+
+
+class _Coalescer:
+    """Buffer text deltas and release them as one event once a size or age threshold is hit"""
+
+    def __init__(self, max_bytes, max_delay):
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.parts = []
+        self.size = 0
+        self.started_at = None
+
+    def add(self, text):
+        if not self.parts:
+            self.started_at = time.monotonic()
+        self.parts.append(text)
+        self.size += len(text.encode("utf-8"))
+
+    def due(self):
+        if not self.parts:
+            return False
+        return self.size >= self.max_bytes or time.monotonic() - self.started_at >= self.max_delay
+
+    def time_until_due(self):
+        return max(0.0, self.started_at + self.max_delay - time.monotonic())
+
+    def flush(self):
+        event = format_sse({"chunk": "".join(self.parts), "done": False})
+        self.parts = []
+        self.size = 0
+        self.started_at = None
+        return event
+
+
+def stream_sse(source, max_bytes=None, max_delay=None, heartbeat_interval=None, threaded=None):
+    """
+    Turn an iterator of chunk dicts into SSE events with coalescing and keep-alive comments
+
+    Text deltas are merged until max_bytes are buffered or the oldest buffered delta is
+    max_delay seconds old. When heartbeat_interval is positive the source runs in a worker
+    thread so a ': keep-alive' comment can be sent whenever it stays silent that long
+    (retrieval, Groq time-to-first-token, post-stream extraction). threaded=True runs the
+    source in a worker thread without heartbeats, so the age flush still happens while the
+    source is silent (threaded defaults to whether heartbeats are on). Iteration stops after
+    the first chunk marked done.
+    """
+    if max_bytes is None:
+        max_bytes = getattr(settings, 'SSE_COALESCE_MAX_BYTES', 256)
+    if max_delay is None:
+        max_delay = getattr(settings, 'SSE_COALESCE_INTERVAL', 0.02)
+    if heartbeat_interval is None:
+        heartbeat_interval = getattr(settings, 'SSE_HEARTBEAT_INTERVAL', 15)
+
+    heartbeat_interval = heartbeat_interval if heartbeat_interval and heartbeat_interval > 0 else None
+    if threaded is None:
+        threaded = heartbeat_interval is not None
+
+    coalescer = _Coalescer(max_bytes, max_delay)
+    worker = None
+    if threaded:
+        worker = _ThreadedSource(source)
+        next_item = worker.get
+    else:
+        iterator = iter(source)
+
+        def next_item(timeout):
+            return next(iterator, _END)
+
+    events_sent = 0
+    try:
+        while True:
+            timeout = heartbeat_interval
+            if coalescer.parts:
+                due_in = coalescer.time_until_due()
+                timeout = due_in if timeout is None else min(timeout, due_in)
+            item = next_item(timeout)
+            if item is _END:
+                break
+
+            if item is None:
+                # Source stayed silent: flush an aged buffer, otherwise keep the connection alive
+                if coalescer.due():
+                    events_sent += 1
+                    yield coalescer.flush()
+                elif not coalescer.parts and heartbeat_interval is not None:
+                    yield KEEP_ALIVE
+                continue
+
+            if _is_text_delta(item):
+                if item.get("chunk"):
+                    coalescer.add(item["chunk"])
+                if coalescer.due():
+                    events_sent += 1
+                    yield coalescer.flush()
+                continue
+
+            if coalescer.parts:
+                events_sent += 1
+                yield coalescer.flush()
+            events_sent += 1
+            yield format_sse(item)
+            if item.get("done", False):
+                break
+
+        if coalescer.parts:
+            events_sent += 1
+            yield coalescer.flush()
+    finally:
+        # Also runs when the client disconnects and the response closes this generator
+        if worker is not None:
+            worker.stop()
+        logger.debug("SSE stream finished after %d events", events_sent)
+
+
+class _ThreadedSource:
+    """Run a generator in a worker thread, handing its items over through a queue"""
+
+    def __init__(self, source):
+        self.source = source
+        self.queue = queue.Queue()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            for item in self.source:
+                if self.stopped.is_set():
+                    break
+                self.queue.put(item)
+        except Exception as e:
+            self.queue.put(e)
+        finally:
+            close = getattr(self.source, "close", None)
+            if close is not None:
+                close()
+            self.queue.put(_END)
+            # The source may have used the ORM from this thread
+            connections.close_all()
+
+    def get(self, timeout):
+        """Next item, None on timeout, _END when exhausted; re-raises source exceptions"""
+        try:
+            item = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def stop(self):
+        self.stopped.set()
+
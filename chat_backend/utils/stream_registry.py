@@ -0,0 +1,135 @@
+import collections
+import logging
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.db import connections
+from .sse import stream_sse, format_sse, KEEP_ALIVE
+
+logger = logging.getLogger(__name__)
+
+
+class StreamBuffer:
+    """
+    Numbered SSE events of one answer, kept in a bounded ring buffer
+
+    The producer appends events as the answer is generated; any number of subscribers (the
+    original request and later reconnects) read from it, so a dropped client can resume from
+    its Last-Event-ID without the answer being generated again.
+    """
+
+    def __init__(self, session_id, max_events):
+        self.stream_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.events = collections.deque(maxlen=max_events)  # (seq, framed event)
+        self.last_seq = 0
+        self.done = False
+        self.finished_at = None
+        self._cond = threading.Condition()
+
+    def append(self, event):
+        with self._cond:
+            self.last_seq += 1
+            self.events.append((self.last_seq, f"id: {self.stream_id}:{self.last_seq}\n{event}"))
+            self._cond.notify_all()
+
+    def finish(self):
+        with self._cond:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._cond.notify_all()
+
+    def subscribe(self, after_seq=0, heartbeat_interval=None):
+        """Yield events numbered after after_seq, then follow the live tail until the answer is done"""
+        if heartbeat_interval is None:
+            heartbeat_interval = getattr(settings, 'SSE_HEARTBEAT_INTERVAL', 15)
+        while True:
+            heartbeat = False
+            with self._cond:
+                if self.events and self.events[0][0] > after_seq + 1:
+                    # The events right after after_seq were already evicted from the ring buffer
+                    expired, pending = True, []
+                else:
+                    expired = False
+                    pending = [(seq, event) for seq, event in self.events if seq > after_seq]
+                    if not pending and not self.done:
+                        heartbeat = not self._cond.wait(heartbeat_interval or None)
+                        if not heartbeat:
+                            continue
+
+            if expired:
+                yield format_sse({"chunk": "", "done": True, "error": "Stream can no longer be resumed, please ask again", "error_type": "replay_unavailable"})
+                return
+            if heartbeat:
+                yield KEEP_ALIVE
+                continue
+            if not pending:
+                return
+            after_seq = pending[-1][0]
+            for _, event in pending:
+                yield event
+
+
+class StreamRegistry:
+    """Per-process registry of resumable answer streams"""
+
+    def __init__(self):
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def start(self, session_id, source):
+        """Generate source into a new StreamBuffer from a background thread and return the buffer"""
+        self._purge_expired()
+        buffer = StreamBuffer(session_id, getattr(settings, 'SSE_REPLAY_BUFFER_EVENTS', 1000))
+        with self._lock:
+            self._streams[buffer.stream_id] = buffer
+        threading.Thread(target=self._produce, args=(buffer, source), daemon=True).start()
+        return buffer
+
+    def get(self, stream_id):
+        with self._lock:
+            return self._streams.get(stream_id)
+
+    def _produce(self, buffer, source):
+        try:
+            # Heartbeats are added per subscriber, so the producer only coalesces. The source still
+            # runs in its own thread so buffered text is flushed on time while the source is busy
+            # (e.g. persisting the answer and extracting memories after the last token)
+            for event in stream_sse(source, heartbeat_interval=0, threaded=True):
+                buffer.append(event)
+        except Exception as e:
+            logger.exception("Streaming error for session %s", buffer.session_id)
+            buffer.append(format_sse({"chunk": "", "done": True, "error": str(e)}))
+        finally:
+            buffer.finish()
+            # The source used the ORM from this thread
+            connections.close_all()
+
+    def _purge_expired(self):
+        ttl = getattr(settings, 'SSE_REPLAY_TTL', 300)
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                stream_id for stream_id, buffer in self._streams.items()
+                if buffer.finished_at is not None and now - buffer.finished_at > ttl
+            ]
+            for stream_id in expired:
+                del self._streams[stream_id]
+
+
+stream_registry = StreamRegistry()
+
+
+def parse_last_event_id(value):
+    """Parse '<stream_id>:<seq>' (or a bare '<seq>') into (stream_id or None, seq); (None, 0) if malformed"""
+    if not value:
+        return None, 0
+    stream_id, _, seq = value.strip().rpartition(":")
+    try:
+        seq = int(seq)
+    except ValueError:
+        return None, 0
+    if seq < 0:
+        return None, 0
+    return stream_id or None, seq
@@ -0,0 +1,112 @@
+import json
+
+_WHITESPACE = " \t\r\n"
+
+
+class StreamingJSONParser:
+    """
+    Incremental, tolerant parser for a streamed JSON object
+
+    Text is fed in arbitrary pieces as it arrives from the model. Anything before the first '{'
+    (prose, a ```json fence) and after the root object closes is ignored. Events are returned as
+    soon as they are complete:
+
+        ("field", key, value)  a scalar or string value of the root object
+        ("item", key, value)   an object element of an array held by the root object
+
+    Elements that fail to decode are skipped, so a truncated or slightly malformed completion
+    still yields everything that closed before the damage.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.started = False
+        self.done = False
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.token_start = None  # start of the root-level string or scalar being read
+        self.item_start = None  # start of the array element object being read
+        self.key = None  # last root-level key read
+        self.expect_key = False
+        self.array_key = None  # root-level key of the array being read
+
+    def feed(self, text):
+        """Consume more text; returns the events completed by it"""
+        self.buffer += text
+        events = []
+        while self.position < len(self.buffer) and not self.done:
+            self._step(self.buffer[self.position], events)
+            self.position += 1
+        return events
+
+    def _decode(self, start, end):
+        try:
+            return True, json.loads(self.buffer[start:end])
+        except ValueError:
+            return False, None
+
+    def _end_scalar(self, events):
+        """Finish a bare root-level value (number, true, false, null) that ends before self.position"""
+        if self.token_start is not None and not self.expect_key:
+            ok, value = self._decode(self.token_start, self.position)
+            if ok and self.key is not None:
+                events.append(("field", self.key, value))
+        self.token_start = None
+
+    def _step(self, char, events):
+        if not self.started:
+            if char == "{":
+                self.started = True
+                self.stack.append("{")
+                self.expect_key = True
+            return
+
+        depth = len(self.stack)
+        if self.in_string:
+            if self.escape:
+                self.escape = False
+            elif char == "\\":
+                self.escape = True
+            elif char == '"':
+                self.in_string = False
+                if depth == 1 and self.token_start is not None:
+                    ok, value = self._decode(self.token_start, self.position + 1)
+                    if self.expect_key:
+                        self.key = value if ok else None
+                    elif ok and self.key is not None:
+                        events.append(("field", self.key, value))
+                    self.token_start = None
+            return
+
+        if depth == 1 and self.token_start is not None and (char in _WHITESPACE or char in ",}"):
+            self._end_scalar(events)
+
+        if char == '"':
+            self.in_string = True
+            if depth == 1:
+                self.token_start = self.position
+        elif char in "{[":
+            if depth == 1:
+                self.array_key = self.key if char == "[" else None
+            elif depth == 2 and self.stack[-1] == "[" and char == "{":
+                self.item_start = self.position
+            self.stack.append(char)
+        elif char in "}]":
+            self.stack.pop()
+            depth = len(self.stack)
+            if depth == 2 and char == "}" and self.item_start is not None:
+                ok, value = self._decode(self.item_start, self.position + 1)
+                if ok and self.array_key is not None:
+                    events.append(("item", self.array_key, value))
+                self.item_start = None
+            elif depth == 0:
+                self.done = True
+        elif depth == 1:
+            if char == ",":
+                self.expect_key = True
+            elif char == ":":
+                self.expect_key = False
+            elif char not in _WHITESPACE and self.token_start is None:
+                self.token_start = self.position
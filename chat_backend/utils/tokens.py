@@ -0,0 +1,38 @@
+import logging
+import tiktoken
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    """Load the cl100k_base encoder once per process (None if it cannot be loaded, e.g. offline)"""
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning("Error loading tiktoken encoding, falling back to estimates: %s", e)
+        return None
+
+
+def count_tokens(text):
+    """Count tokens in text using the same encoder as the PDF chunker"""
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is None:
+        # Rough estimate: ~4 characters per token for English text
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Longest prefix of text that fits in max_tokens ("" if nothing fits)"""
+    if max_tokens <= 0 or not text:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = get_encoding()
+    if encoding is None:
+        return text[:max(max_tokens - 1, 0) * 4]
+    return encoding.decode(encoding.encode(text)[:max_tokens])
@@ -1,13 +1,15 @@
 import PyPDF2
 import faiss
 import numpy as np
-import tiktoken
 import os
 import pickle
 import streamlit as st
 import uuid
+import hashlib
+import httpx
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from django.conf import settings
+from .tokens import get_encoding
 
 def extract_text_from_pdf(pdf_file):
     """Extract text from uploaded PDF file"""
@@ -23,7 +25,11 @@ def extract_text_from_pdf(pdf_file):
 
 def chunk_text(text, chunk_size=500, overlap=50):
     """Split text into overlapping chunks for better context retention"""
-    encoding = tiktoken.get_encoding("cl100k_base")
+    encoding = get_encoding()
+    if encoding is None:
+        # Encoder unavailable (e.g. offline): chunk by characters at ~4 characters per token
+        step = (chunk_size - overlap) * 4
+        return [text[i:i + chunk_size * 4] for i in range(0, len(text), step)]
     tokens = encoding.encode(text)
     
     chunks = []
@@ -102,6 +108,7 @@ class VectorStore:
         self.pdf_registry[pdf_id] = {
             'filename': filename,
             'chunk_count': len(texts),
+            'content_hash': hashlib.sha256("\n".join(texts).encode("utf-8")).hexdigest(),
             'created_at': pdf_data['created_at'],
             'file_path': pdf_file_path
         }
@@ -166,8 +173,22 @@ class VectorStore:
                 self.pdf_registry = {}
         return False
     
-    def search(self, query, k=3, pdf_id=None):
-        """Search for similar documents, optionally filtered by PDF ID"""
+    def get_pdf_chunks(self, pdf_id):
+        """Chunk texts of a PDF in document order (empty if the PDF is unknown)"""
+        pdf_data = self._load_pdf_data(pdf_id)
+        if not pdf_data:
+            return []
+        return [doc['text'] for doc in sorted(pdf_data['documents'], key=lambda doc: doc['chunk_index'])]
+    
+    def embed_query(self, query):
+        """Embed a query as a normalized (1, dim) float32 array"""
+        query_embedding = self.embedding_model.embed_query(query)
+        query_embedding = np.array([query_embedding], dtype=np.float32)
+        faiss.normalize_L2(query_embedding)
+        return query_embedding
+    
+    def search(self, query, k=3, pdf_id=None, query_embedding=None):
+        """Search for similar documents, optionally filtered by PDF ID (reuses query_embedding if given)"""
         if pdf_id:
             # Search within specific PDF
             pdf_data = self._load_pdf_data(pdf_id)
@@ -184,9 +205,8 @@ class VectorStore:
             temp_index.add(embeddings)
             
             # Generate query embedding
-            query_embedding = self.embedding_model.embed_query(query)
-            query_embedding = np.array([query_embedding], dtype=np.float32)
-            faiss.normalize_L2(query_embedding)
+            if query_embedding is None:
+                query_embedding = self.embed_query(query)
             
             # Search
             scores, indices = temp_index.search(query_embedding, min(k, len(pdf_data['documents'])))
@@ -212,9 +232,8 @@ class VectorStore:
                 return []
             
             # Generate query embedding
-            query_embedding = self.embedding_model.embed_query(query)
-            query_embedding = np.array([query_embedding], dtype=np.float32)
-            faiss.normalize_L2(query_embedding)
+            if query_embedding is None:
+                query_embedding = self.embed_query(query)
             
             # Search
             scores, indices = self.index.search(query_embedding, min(k, len(self.documents)))
@@ -284,8 +303,45 @@ class VectorStore:
         return len(self.pdf_registry) > 0
 
 
+class OpenAICompatibleEmbeddings:
+    """Embeddings from an OpenAI-compatible /v1/embeddings endpoint (e.g. the mock_llm_server command)"""
+
+    def __init__(self, model, base_url, api_key="", batch_size=96, timeout=60):
+        self.model = model
+        self.url = base_url.rstrip("/") + "/v1/embeddings"
+        self.api_key = api_key
+        self.batch_size = batch_size
+        self.timeout = timeout
+
+    def _embed(self, texts):
+        response = httpx.post(
+            self.url,
+            json={"model": self.model, "input": texts},
+            headers={"Authorization": f"Bearer {self.api_key}"} if self.api_key else None,
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        data = sorted(response.json()["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in data]
+
+    def embed_documents(self, texts):
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            embeddings.extend(self._embed(texts[start:start + self.batch_size]))
+        return embeddings
+
+    def embed_query(self, text):
+        return self._embed([text])[0]
+
+
 def load_embedding_model():
-    """Load the Google Generative AI embedding model"""
+    """Load the embedding model selected by settings.EMBEDDING_BACKEND"""
+    if getattr(settings, 'EMBEDDING_BACKEND', 'google') == 'openai':
+        return OpenAICompatibleEmbeddings(
+            model=settings.EMBEDDING_MODEL,
+            base_url=settings.EMBEDDING_BASE_URL,
+            api_key=getattr(settings, 'EMBEDDING_API_KEY', ''),
+        )
     return GoogleGenerativeAIEmbeddings(model=settings.EMBEDDING_MODEL)
 
 
@@ -315,9 +371,9 @@ def process_pdf_upload(uploaded_file, pdf_id=None):
     return None, 0
 
 
-def get_rag_context(query, vector_store, max_chunks=3, pdf_id=None):
+def get_rag_context(query, vector_store, max_chunks=3, pdf_id=None, query_embedding=None):
     """Get relevant context from vector store for RAG, optionally filtered by PDF ID"""
-    results = vector_store.search(query, k=max_chunks, pdf_id=pdf_id)
+    results = vector_store.search(query, k=max_chunks, pdf_id=pdf_id, query_embedding=query_embedding)
 
     if not results:
         return ""
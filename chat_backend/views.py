@@ -2,42 +2,97 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import APIException
 
-from .models import GlobalMemory, ChatSession, ChatMessage , Quiz, Question, UserQuizAttempt , Goal
+from .models import GlobalMemory, MemoryEntry, ChatSession, ChatMessage , Quiz, Question, UserQuizAttempt , Goal, QuizBatchJob, SessionStats, QuizStats, QuestionStats
 from .utils.vectorstore import process_pdf_upload     
 
 from django.conf import settings
 from groq import Groq
 from .utils.groq_utils import generate_streaming_assistant_response
+from .utils.memory import save_memory
+from .utils.quiz_writer import create_quiz, add_questions, clean_questions, QuizValidationError, QuizAlreadyExists
+from .utils.quiz_cache import quiz_cache_key, get_cached_quiz
+from .utils.quiz_generation import build_quiz_messages, completion_text, generate_quiz, stream_quiz_generation
+from .utils.quiz_batch import start_quiz_batch
+from .utils.quiz_pregeneration import start_quiz_pregeneration, is_pregenerating
+from .utils.quiz_stats import save_submission, with_accuracy
+from .utils.pagination import KeysetPagination, MessageHistoryPagination
+from .utils.response_cache import cached_response, quiz_resource, session_quizzes_resource, SESSIONS, GOALS
+from .utils.sse import stream_sse
+from .utils.stream_registry import stream_registry, parse_last_event_id
+from .utils.metrics import registry as metrics_registry
+from .utils.llm_admission import admitted_completion, LLMOverloaded, PRIORITY_QUIZ, get_admission_controller
 from django.http import StreamingHttpResponse
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
+import datetime
 import json
+import logging
 import traceback
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def sse_response(events, stream_id=None):
+    """Wrap SSE events in a streaming response that proxies will not buffer"""
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable nginx buffering
+    if stream_id:
+        response['X-Stream-Id'] = stream_id
+    return response
+
+
+def request_flag(request, name):
+    """Boolean option from the request body or query string ("1", "true" or "yes")"""
+    return str(request.data.get(name, request.query_params.get(name, ""))).lower() in ("1", "true", "yes")
+
+
+def overloaded_response(error):
+    """503 response for LLM calls shed by the admission controller"""
+    response = Response({"error": str(error)}, status=503)
+    if error.retry_after:
+        response['Retry-After'] = str(error.retry_after)
+    return response
+
 
 class InitMemoryView(APIView):
     def post(self, request):
         if GlobalMemory.objects.exists():
             return Response({"error": "Memory already exists"}, status=400) 
         preferences = request.data.get("preferences", "")
-        GlobalMemory.objects.create(preferences=preferences)
+        GlobalMemory.objects.create(preferences="") # Marks memory as initialized; entries hold the content
+        for line in preferences.splitlines():
+            if line.strip():
+                save_memory(line, "Preferences", is_core=True)
         return Response({"message": "Global memory initialized"}) 
 
 
 class UpdateMemoryView(APIView):
     def post(self, request):
-        memory = GlobalMemory.objects.first() 
-        if not memory:
+        if not GlobalMemory.objects.exists():
             return Response({"error": "Global memory not initialized. Please call /memory/init/ first."}, status=400)
-        preferences = request.data.get("preferences")
-        if preferences:
-            memory.preferences += preferences + "\n"
-        memory.save() 
+        preferences = request.data.get("preferences") or ""
+        # Updates are retrieved by relevance; core=true pins them to every prompt like the initial preferences
+        is_core = request_flag(request, "core")
+        for line in preferences.splitlines():
+            if line.strip():
+                save_memory(line, "Preferences" if is_core else "", is_core=is_core)
         return Response({"message": "Memory updated"}) 
 
     def get(self, request):
-        memory = GlobalMemory.objects.first() 
-        if not memory:
+        if not GlobalMemory.objects.exists():
             return Response({"error": "Global memory not initialized."}, status=400)
-        return Response({"preferences": memory.preferences}) 
+        entries = list(MemoryEntry.objects.order_by('id').values('id', 'content', 'category', 'is_core', 'created_at'))
+        return Response({
+            "preferences": "\n".join(entry["content"] for entry in entries),
+            "entries": entries,
+        }) 
+
 
 class CreateSessionView(APIView):
     def post(self, request):
@@ -65,9 +120,14 @@ class UploadPDFView(APIView):
         # Process PDF and save to vector store with session_id as pdf_id
         try:
             pdf_id, chunk_count = process_pdf_upload(pdf_file, pdf_id=str(session_id))
+            pregenerating = False
+            if chunk_count:
+                groq_client = Groq(api_key=getattr(settings, 'GROQ_API_KEY', ''), base_url=getattr(settings, 'GROQ_BASE_URL', None))
+                pregenerating = start_quiz_pregeneration(session.id, groq_client)
             return Response({
                 "message": "PDF uploaded and processed successfully",
-                "pdf_id": pdf_id
+                "pdf_id": pdf_id,
+                "quiz_pregeneration": pregenerating
             })
         except Exception as e:
             traceback.print_exc()
@@ -110,47 +170,60 @@ class CustomPagination(PageNumberPagination):
         max_page_size = 100
 
 class SessionMemoryView(APIView):
-    pagination_class = CustomPagination
+    pagination_class = MessageHistoryPagination
 
     def get(self, request, session_id):
+        """
+        Session history, a page at a time: newest first (?before=<id> for older messages),
+        or ?after=<id> for the messages since the last poll, oldest first
+        """
         try:
             session = ChatSession.objects.get(id=session_id)
         except ChatSession.DoesNotExist:
             return Response({"error": "Invalid session ID"}, status=404)
 
-        # Get messages with quiz information using select_related for better performance
-        messages = session.messages.select_related('quiz').order_by("created_at")
-        
-        # Build message list with quiz details
+        # Quiz details and question counts come with the page query (no per-message queries)
+        question_count = (
+            Question.objects.filter(quiz=OuterRef('quiz_id'))
+            .order_by().values('quiz').annotate(count=Count('id')).values('count')
+        )
+        messages = session.messages.annotate(quiz_question_count=Coalesce(Subquery(question_count), 0)).values(
+            "id", "message", "is_user", "is_complete", "created_at",
+            "quiz_id", "quiz__title", "quiz__description", "quiz_question_count"
+        )
+
+        paginator = self.pagination_class()
+        try:
+            page = paginator.paginate_queryset(messages, request, view=self)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
         message_list = []
-        for message in messages:
-            message_data = {
-                "id": message.id,
-                "message": message.message,
-                "is_user": message.is_user,
-                "created_at": message.created_at,
-                "quiz": None
-            }
-            
-            # Add quiz information if the message has an associated quiz
-            if message.quiz:
-                message_data["quiz"] = {
-                    "id": message.quiz.id,
-                    "title": message.quiz.title,
-                    "description": message.quiz.description,
-                    "num_questions": message.quiz.questions.count()
-                }
-            
-            message_list.append(message_data)
-        
-        return Response({
-            "messages": message_list,
-            "pdf_uploaded": session.uploaded_pdf.name if session.uploaded_pdf else None
-        })
+        for row in page:
+            message_list.append({
+                "id": row["id"],
+                "message": row["message"],
+                "is_user": row["is_user"],
+                "is_complete": row["is_complete"], # False for an answer still streaming or cut off
+                "created_at": row["created_at"],
+                "quiz": {
+                    "id": row["quiz_id"],
+                    "title": row["quiz__title"],
+                    "description": row["quiz__description"],
+                    "num_questions": row["quiz_question_count"]
+                } if row["quiz_id"] else None
+            })
+
+        response = paginator.get_paginated_response(message_list)
+        response.data["pdf_uploaded"] = session.uploaded_pdf.name if session.uploaded_pdf else None
+        return response
 
 
 class ListSessionsView(APIView):
     def get(self, request):
+        return cached_response(request, SESSIONS, self.build)
+
+    def build(self):
         sessions = ChatSession.objects.all().values("id", "created_at")
         return Response({"sessions": list(sessions)})
     
@@ -172,43 +245,62 @@ class CreateQuizView(APIView):
 
 
 class AddQuestionsView(APIView):
-    def post(self, request, quiz_id):
+    def post(self, request, quiz_id=None):
+        """
+        Add questions to a quiz, or create a quiz together with its questions when no quiz_id is given
+        (payload: session_id, title, description, questions)
+        """
+        if quiz_id is None:
+            return self.create_with_questions(request)
+
         try:
             quiz = Quiz.objects.get(id=quiz_id)
         except Quiz.DoesNotExist:
             return Response({"error": "Invalid quiz ID"}, status=404)
 
-        questions_data = request.data.get("questions") 
-        if not isinstance(questions_data, list) or not questions_data:
-            return Response({"error": "List of questions is required"}, status=400)
-
-        created_questions = []
-        for q_data in questions_data:
-            question_text = q_data.get("question_text")
-            correct_answer = q_data.get("correct_answer", "")
-            options = q_data.get("options", [])
-
-            if not question_text:
-               
-                continue
+        try:
+            questions = clean_questions(request.data.get("questions"))
+        except QuizValidationError as e:
+            return Response({"error": str(e)}, status=400)
+
+        created_questions = add_questions(quiz, questions)
+        return Response({"message": "Questions added successfully", "questions": [{
+            "id": question.id, 
+            "question_text": question.question_text,
+            "options": question.options
+        } for question in created_questions]}, status=201)
+
+    def create_with_questions(self, request):
+        session_id = request.data.get("session_id")
+        if not ChatSession.objects.filter(id=session_id).exists():
+            return Response({"error": "Invalid session ID"}, status=404)
 
-            question = Question.objects.create(
-                quiz=quiz,
-                question_text=question_text,
-                correct_answer=correct_answer,
-                options=options
+        try:
+            quiz, created_questions = create_quiz(
+                session_id,
+                request.data.get("title"),
+                request.data.get("description", ""),
+                questions_data=request.data.get("questions")
             )
-            created_questions.append({
-                "id": question.id, 
+        except QuizValidationError as e:
+            return Response({"error": str(e)}, status=400)
+
+        return Response({
+            "message": "Quiz created successfully",
+            "quiz_id": quiz.id,
+            "questions": [{
+                "id": question.id,
                 "question_text": question.question_text,
                 "options": question.options
-            })
-
-        return Response({"message": "Questions added successfully", "questions": created_questions}, status=201)
+            } for question in created_questions]
+        }, status=201)
 
 
 class GetQuizDetailsView(APIView):
     def get(self, request, quiz_id):
+        return cached_response(request, quiz_resource(quiz_id), lambda: self.build(quiz_id))
+
+    def build(self, quiz_id):
         try:
             quiz = Quiz.objects.get(id=quiz_id)
         except Quiz.DoesNotExist:
@@ -236,51 +328,133 @@ class SubmitQuizAnswersView(APIView):
         if not isinstance(answers_data, list) or not answers_data:
             return Response({"error": "List of answers is required"}, status=400)
 
-        submitted_answers = []
-        for ans_data in answers_data:
-            question_id = ans_data.get("question_id")
-            user_answer_text = ans_data.get("user_answer", "")
-
-            try:
-                question = Question.objects.get(id=question_id, quiz=quiz)
-            except Question.DoesNotExist:
+        # Load every answered question in one query, grade in memory, then insert all attempts at once
+        try:
+            question_ids = [int(ans_data.get("question_id")) for ans_data in answers_data]
+        except (TypeError, ValueError, AttributeError):
+            return Response({"error": "Each answer needs a numeric question_id"}, status=400)
+        questions = Question.objects.filter(quiz=quiz).in_bulk(question_ids)
+
+        attempt_group = uuid.uuid4()
+        attempts = []
+        for question_id, ans_data in zip(question_ids, answers_data):
+            question = questions.get(question_id)
+            if question is None:
                 return Response({"error": f"Question {question_id} not found in this quiz"}, status=404)
 
-            
+            user_answer_text = ans_data.get("user_answer", "")
             is_correct = None
             if question.correct_answer:
                 is_correct = (user_answer_text.strip().lower() == question.correct_answer.strip().lower())
 
-            attempt = UserQuizAttempt.objects.create(
-                session=quiz.session,
+            attempts.append(UserQuizAttempt(
+                session_id=quiz.session_id,
                 quiz=quiz,
                 question=question,
                 user_answer=user_answer_text,
-                is_correct=is_correct
-            )
-            submitted_answers.append({
-                "question_id": question.id,
-                "question_text": question.question_text,
-                "options": question.options,
-                "user_answer": user_answer_text,
-                "correct_answer": question.correct_answer,
-                "is_correct": is_correct,
-                "attempt_id": attempt.id
-            })
+                is_correct=is_correct,
+                attempt_group=attempt_group
+            ))
 
+        # All or nothing: a failure cannot leave a half-written submission
+        attempts = save_submission(attempts)
 
-        return Response({"message": "Quiz answers submitted", "results": submitted_answers}, status=201)
+        submitted_answers = [{
+            "question_id": attempt.question.id,
+            "question_text": attempt.question.question_text,
+            "options": attempt.question.options,
+            "user_answer": attempt.user_answer,
+            "correct_answer": attempt.question.correct_answer,
+            "is_correct": attempt.is_correct,
+            "attempt_id": attempt.id
+        } for attempt in attempts]
+
+        return Response({"message": "Quiz answers submitted", "attempt_group": attempt_group, "results": submitted_answers}, status=201)
 
 class ListSessionQuizzesView(APIView):
     def get(self, request, session_id):
+        return cached_response(request, session_quizzes_resource(session_id), lambda: self.build(session_id))
+
+    def build(self, session_id):
         try:
             session = ChatSession.objects.get(id=session_id)
         except ChatSession.DoesNotExist:
             return Response({"error": "Invalid session ID"}, status=404)
 
-        quizzes = session.quizzes.all().values("id", "title", "description", "created_at")
+        quizzes = session.quizzes.all().values("id", "title", "description", "source", "created_at")
         return Response({"quizzes": list(quizzes)})
 
+STATS_FIELDS = ("attempts", "graded", "correct", "last_attempt_at")
+
+class SessionStatsView(APIView):
+    """Progress summary of a session and its quizzes, read from the stats tables"""
+    def get(self, request, session_id):
+        if not ChatSession.objects.filter(id=session_id).exists():
+            return Response({"error": "Invalid session ID"}, status=404)
+
+        totals = SessionStats.objects.filter(session_id=session_id).values(
+            *STATS_FIELDS, "submissions", "current_streak", "best_streak"
+        ).first() or {
+            **dict.fromkeys(STATS_FIELDS, 0), "last_attempt_at": None,
+            "submissions": 0, "current_streak": 0, "best_streak": 0
+        }
+        quizzes = QuizStats.objects.filter(session_id=session_id).order_by('-last_attempt_at').values(
+            "quiz_id", "quiz__title", *STATS_FIELDS, "submissions"
+        )
+        return Response({
+            "session_id": session_id,
+            "totals": with_accuracy(totals),
+            "quizzes": [with_accuracy(row) for row in quizzes]
+        })
+
+class QuizStatsView(APIView):
+    """Per-quiz and per-question results, read from the stats tables"""
+    def get(self, request, quiz_id):
+        if not Quiz.objects.filter(id=quiz_id).exists():
+            return Response({"error": "Invalid quiz ID"}, status=404)
+
+        totals = QuizStats.objects.filter(quiz_id=quiz_id).values(*STATS_FIELDS, "submissions").first() or {
+            **dict.fromkeys(STATS_FIELDS, 0), "last_attempt_at": None, "submissions": 0
+        }
+        questions = QuestionStats.objects.filter(quiz_id=quiz_id).order_by('question_id').values(
+            "question_id", "question__question_text", *STATS_FIELDS
+        )
+        return Response({
+            "quiz_id": quiz_id,
+            "totals": with_accuracy(totals),
+            "questions": [with_accuracy(row) for row in questions]
+        })
+
+class PracticeQuizView(APIView):
+    """Serve a quiz pre-generated from the session PDF, least practiced first (no LLM call)"""
+    def get(self, request, session_id):
+        try:
+            session = ChatSession.objects.get(id=session_id)
+        except ChatSession.DoesNotExist:
+            return Response({"error": "Invalid session ID"}, status=404)
+
+        quiz = (
+            session.quizzes.filter(source='document')
+            .annotate(attempt_count=Count('attempts'))
+            .order_by('attempt_count', 'id')
+            .first()
+        )
+        if quiz is None:
+            if is_pregenerating(session.id):
+                return Response({"status": "generating"}, status=202)
+            return Response({"error": "No practice quizzes for this session"}, status=404)
+
+        questions = quiz.questions.all().values("id", "question_text", "options")
+        return Response({
+            "id": quiz.id,
+            "session_id": session.id,
+            "title": quiz.title,
+            "description": quiz.description,
+            "source_chunks": quiz.source_chunks,
+            "created_at": quiz.created_at,
+            "questions": list(questions)
+        })
+
 class GetUserQuizAttemptsView(APIView):
     def get(self, request, session_id):
         try:
@@ -290,9 +464,16 @@ class GetUserQuizAttemptsView(APIView):
 
         quiz_id = request.query_params.get('quiz_id')
 
+        attempt_group = request.query_params.get('attempt_group')
+
         attempts_query = session.quiz_attempts.all()
         if quiz_id:
             attempts_query = attempts_query.filter(quiz__id=quiz_id)
+        if attempt_group:
+            try:
+                attempts_query = attempts_query.filter(attempt_group=uuid.UUID(attempt_group))
+            except ValueError:
+                return Response({"error": "Invalid attempt_group"}, status=400)
 
         attempts = attempts_query.order_by("attempted_at").values(
             "id",
@@ -302,6 +483,7 @@ class GetUserQuizAttemptsView(APIView):
             "question__question_text",
             "user_answer",
             "is_correct",
+            "attempt_group",
             "attempted_at"
         )
         return Response({"attempts": list(attempts)})
@@ -350,6 +532,9 @@ class CreateGoalView(APIView):
 
 class ListGoalsView(APIView):
     def get(self, request):
+        return cached_response(request, GOALS, self.build)
+
+    def build(self):
         # return all goals
         goals = Goal.objects.all().order_by('deadline', 'created_at').values(
             "id", "title", "description", "deadline", "status", "created_at"
@@ -466,38 +651,36 @@ class StreamingRagAnswerView(APIView):
 
         # Initialize Groq client
         try:
-            groq_client = Groq(api_key=getattr(settings, 'GROQ_API_KEY', ''))
+            groq_client = Groq(api_key=getattr(settings, 'GROQ_API_KEY', ''), base_url=getattr(settings, 'GROQ_BASE_URL', None))
             
-            def generate_response():
-                """Generator function for streaming response"""
-                try:
-                    for chunk_data in generate_streaming_assistant_response(
-                        query=query,
-                        session_id=session_id,
-                        groq_client=groq_client
-                    ):
-                        yield f"data: {json.dumps(chunk_data)}\n\n"
-                        print(chunk_data)
-                        if chunk_data.get("done", False):
-                            break
-                except Exception as e:
-                    error_chunk = {"chunk": "", "done": True, "error": str(e)}
-                    yield f"data: {json.dumps(error_chunk)}\n\n"
-                    print(f"Streaming error: {str(e)}")
-
-            response = StreamingHttpResponse(
-                generate_response(),
-                content_type='text/event-stream'
-            )
-            response['Cache-Control'] = 'no-cache'
-            response['Connection'] = 'keep-alive'
-            response['X-Accel-Buffering'] = 'no'  # Disable nginx buffering
-            
-            return response
+            # Generate in the background into a resumable buffer; this request is its first subscriber
+            stream = stream_registry.start(session_id, generate_streaming_assistant_response(
+                query=query,
+                session_id=session_id,
+                groq_client=groq_client
+            ))
+            return sse_response(stream.subscribe(), stream.stream_id)
                 
         except Exception as e:
             return Response({"error": f"Streaming error: {str(e)}"}, status=500)
 
+
+class ResumeStreamView(APIView):
+    def get(self, request, session_id, stream_id):
+        """
+        Replay the events of a chat answer stream after Last-Event-ID, then follow its live tail
+        """
+        stream = stream_registry.get(stream_id)
+        if stream is None or stream.session_id != session_id:
+            return Response({"error": "Stream not found or expired"}, status=404)
+
+        last_event_id = request.headers.get("Last-Event-ID") or request.query_params.get("last_event_id")
+        last_stream_id, last_seq = parse_last_event_id(last_event_id)
+        if last_stream_id and last_stream_id != stream_id:
+            return Response({"error": "Last-Event-ID belongs to a different stream"}, status=400)
+
+        return sse_response(stream.subscribe(after_seq=last_seq), stream.stream_id)
+
 class GenerateQuizFromMessageView(APIView):
     def post(self, request, message_id):
         """
@@ -517,100 +700,36 @@ class GenerateQuizFromMessageView(APIView):
                 "quiz_id": existing_quiz.id
             }, status=400)
         
+        # Identical content (from any session) reuses an earlier generation unless regenerate=true
+        regenerate = request_flag(request, "regenerate")
+        
         try:
             # Initialize Groq client
-            groq_client = Groq(api_key=settings.GROQ_API_KEY)
-            
-            # Create quiz generation prompt
-            quiz_prompt = f"""### Role
-You're a Quiz Generation Assistant. Create a comprehensive quiz based on the given message content.
-
-### Task
-Generate a quiz with 5 multiple choice questions based on the message content. Focus on key concepts, important details, and practical applications.
-
-### Output Format
-Return a JSON object with this structure:
-{{
-  "title": "Quiz title based on the message content",
-  "description": "Brief description of what this quiz covers",
-  "questions": [
-    {{
-      "question_text": "Question text here",
-      "options": ["Option A", "Option B", "Option C", "Option D"],
-      "correct_answer": "Correct option text (must match one of the options exactly)"
-    }}
-  ]
-}}
-
-### Message Content
-{message.message}
-
-### Instructions
-- Create questions that test understanding of the main concepts
-- Make sure all options are plausible but only one is correct
-- Keep questions clear and concise
-- Ensure the correct_answer exactly matches one of the options#
-
-# Rules:
-# Output only a VALID JSON object with the structure specified above.
-# Do not include any other text or comments."""
-
-            # Generate quiz using Groq
-            response = groq_client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": "You are a quiz generation assistant. Always return valid JSON."},
-                    {"role": "user", "content": quiz_prompt}
-                ],
-                model=settings.MODEL,
-                temperature=0.7,
-                max_tokens=3000
-            )
-            
-            quiz_data_text = response.choices[0].message.content.strip()
+            groq_client = Groq(api_key=settings.GROQ_API_KEY, base_url=getattr(settings, 'GROQ_BASE_URL', None))
             
-            # Parse the JSON response
-            # quiz_data_text = quiz_data_text.replace("```json", "").replace("```", "")
-            # print(quiz_data_text, file=open("quiz_data_text.json", "w"))
-            try:
-                quiz_data = json.loads(quiz_data_text)
-            except json.JSONDecodeError:
-                return Response({"error": "Failed to generate valid quiz data"}, status=500)
-            
-            # Create the quiz
-            quiz = Quiz.objects.create(
-                session=message.session,
-                title=quiz_data.get("title", f"Quiz for Message {message_id}"),
-                description=quiz_data.get("description", "")
-            )
-            
-            # Link the quiz to the message
-            message.quiz = quiz
-            message.save()
-            
-            # Create questions
-            created_questions = []
-            for q_data in quiz_data.get("questions", []):
-                question = Question.objects.create(
-                    quiz=quiz,
-                    question_text=q_data.get("question_text", ""),
-                    correct_answer=q_data.get("correct_answer", ""),
-                    options=q_data.get("options", [])
-                )
-                created_questions.append({
-                    "id": question.id,
-                    "question_text": question.question_text,
-                    "options": question.options,
-                    "correct_answer": question.correct_answer
-                })
+            # Generate quiz using Groq (or the quiz cache) and save it with its questions
+            quiz, questions, cached = generate_quiz(message, groq_client, regenerate=regenerate)
             
             return Response({
                 "message": "Quiz generated successfully",
                 "quiz_id": quiz.id,
                 "title": quiz.title,
                 "description": quiz.description,
-                "questions": created_questions
+                "questions": [{
+                    "id": question.id,
+                    "question_text": question.question_text,
+                    "options": question.options,
+                    "correct_answer": question.correct_answer
+                } for question in questions],
+                "cached": cached
             }, status=201)
             
+        except QuizAlreadyExists as e:
+            return Response({"error": str(e)}, status=400)
+        except QuizValidationError as e:
+            return Response({"error": str(e)}, status=500)
+        except LLMOverloaded as e:
+            return overloaded_response(e)
         except Exception as e:
             traceback.print_exc()
             return Response({
@@ -618,43 +737,199 @@ Return a JSON object with this structure:
             }, status=500)
 
 
+class StreamingQuizFromMessageView(APIView):
+    def post(self, request, message_id):
+        """
+        Generate a quiz from a message as Server-Sent Events, saving each question as it arrives
+        """
+        try:
+            message = ChatMessage.objects.get(id=message_id)
+        except ChatMessage.DoesNotExist:
+            return Response({"error": "Message not found"}, status=404)
+
+        existing_quiz = Quiz.objects.filter(chat_messages=message).first()
+        if existing_quiz:
+            return Response({
+                "error": "Quiz already exists for this message",
+                "quiz_id": existing_quiz.id
+            }, status=400)
+
+        regenerate = request_flag(request, "regenerate")
+        cache_key = quiz_cache_key(message.message)
+        if not regenerate:
+            cached_quiz = get_cached_quiz(cache_key)
+            if cached_quiz is not None:
+                return sse_response(stream_sse(stream_quiz_generation(message, [json.dumps(cached_quiz)], cached=True)))
+
+        try:
+            groq_client = Groq(api_key=settings.GROQ_API_KEY, base_url=getattr(settings, 'GROQ_BASE_URL', None))
+            # Admission happens here, so an overloaded upstream still gets a proper 503
+            stream = admitted_completion(
+                groq_client,
+                PRIORITY_QUIZ,
+                messages=build_quiz_messages(message.message),
+                model=settings.MODEL,
+                temperature=0.7,
+                max_tokens=3000,
+                stream=True
+            )
+        except LLMOverloaded as e:
+            return overloaded_response(e)
+        except Exception as e:
+            logger.exception("Error starting quiz generation for message %s", message_id)
+            return Response({"error": f"Failed to generate quiz: {str(e)}"}, status=500)
+
+        return sse_response(stream_sse(stream_quiz_generation(message, completion_text(stream), cache_key=cache_key)))
+
+
+class QuizBatchView(APIView):
+    def post(self, request):
+        """
+        Start generating quizzes for a whole session (session_id) or for a list of message_ids
+        as a background job; poll quiz/batch/<job_id>/ for per-message status
+        """
+        session_id = request.data.get("session_id")
+        message_ids = request.data.get("message_ids")
+        regenerate = request_flag(request, "regenerate")
+
+        if message_ids is not None:
+            if not isinstance(message_ids, list) or not message_ids:
+                return Response({"error": "message_ids must be a non-empty list"}, status=400)
+            try:
+                message_ids = sorted({int(message_id) for message_id in message_ids})
+            except (TypeError, ValueError):
+                return Response({"error": "message_ids must be integers"}, status=400)
+            found = dict(ChatMessage.objects.filter(id__in=message_ids).values_list('id', 'session_id'))
+            missing = [message_id for message_id in message_ids if message_id not in found]
+            if missing:
+                return Response({"error": "Messages not found", "message_ids": missing}, status=404)
+            if session_id is not None:
+                # The job is recorded under session_id, so every message must belong to it
+                try:
+                    session_id = int(session_id)
+                except (TypeError, ValueError):
+                    return Response({"error": "session_id must be an integer"}, status=400)
+                foreign = [message_id for message_id in message_ids if found[message_id] != session_id]
+                if foreign:
+                    return Response({"error": "Messages belong to another session", "message_ids": foreign}, status=400)
+            batch_size = len(message_ids)
+        elif session_id is not None:
+            if not ChatSession.objects.filter(id=session_id).exists():
+                return Response({"error": "Invalid session ID"}, status=404)
+            batch_size = ChatMessage.objects.filter(session_id=session_id, is_user=False, is_complete=True).count()
+        else:
+            return Response({"error": "session_id or message_ids is required"}, status=400)
+
+        max_messages = getattr(settings, 'QUIZ_BATCH_MAX_MESSAGES', 100)
+        if batch_size > max_messages:
+            return Response({"error": f"A batch can cover at most {max_messages} messages"}, status=400)
+
+        groq_client = Groq(api_key=settings.GROQ_API_KEY, base_url=getattr(settings, 'GROQ_BASE_URL', None))
+        job = start_quiz_batch(groq_client, session_id=session_id, message_ids=message_ids, regenerate=regenerate)
+        return Response(quiz_batch_status(job), status=202)
+
+
+class QuizBatchStatusView(APIView):
+    def get(self, request, job_id):
+        try:
+            job = QuizBatchJob.objects.get(id=job_id)
+        except QuizBatchJob.DoesNotExist:
+            return Response({"error": "Batch job not found"}, status=404)
+        return Response(quiz_batch_status(job))
+
+
+def quiz_batch_status(job):
+    """Job status with per-message item status and counts per status"""
+    items = list(job.items.order_by('id').values('message_id', 'status', 'quiz_id', 'cached', 'error'))
+    counts = {}
+    for item in items:
+        counts[item["status"]] = counts.get(item["status"], 0) + 1
+    return {
+        "job_id": job.id,
+        "session_id": job.session_id,
+        "status": job.status,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+        "counts": counts,
+        "items": items
+    }
+
+
+def parse_date_bound(value):
+    """Aware datetime from an ISO datetime or date (midnight) query parameter, None if invalid"""
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                return None
+            parsed = datetime.datetime.combine(day, datetime.time.min)
+    except ValueError:
+        return None
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
 class ListAllQuizzesView(APIView):
     def get(self, request):
         """
         List all quizzes across all sessions with pagination
+
+        Page-number pagination in id order by default. ?pagination=cursor (or a ?cursor= from a
+        `next` link) switches to cursor pagination, newest first, which costs the same at any
+        depth and skips the COUNT. Filters: ?session_id=, ?created_after= (inclusive) and ?created_before= (exclusive),
+        both ISO dates or datetimes.
         """
+        quizzes = Quiz.objects.all()
+        session_id = request.query_params.get('session_id')
+        if session_id:
+            if not session_id.isdigit():
+                return Response({"error": "session_id must be an integer"}, status=400)
+            quizzes = quizzes.filter(session_id=session_id)
+        for param, lookup in (('created_after', 'created_at__gte'), ('created_before', 'created_at__lt')):
+            value = request.query_params.get(param)
+            if value:
+                bound = parse_date_bound(value)
+                if bound is None:
+                    return Response({"error": f"{param} must be an ISO date or datetime"}, status=400)
+                quizzes = quizzes.filter(**{lookup: bound})
+
+        # Question count and linked message in the page query itself (no per-quiz queries)
+        question_count = (
+            Question.objects.filter(quiz=OuterRef('pk'))
+            .order_by().values('quiz').annotate(count=Count('id')).values('count')
+        )
+        linked_message = ChatMessage.objects.filter(quiz=OuterRef('pk')).order_by('id').values('id')[:1]
+        quizzes = quizzes.annotate(
+            question_count=Coalesce(Subquery(question_count), 0),
+            linked_message_id=Subquery(linked_message)
+        ).values(
+            "id", "title", "description", "session_id", "source", "created_at", "question_count", "linked_message_id"
+        )
+
         try:
-            # Get all quizzes with related data
-            quizzes = Quiz.objects.select_related('session').prefetch_related('questions').all()
-            
-            # Apply pagination
-            paginator = CustomPagination()
-            paginated_quizzes = paginator.paginate_queryset(quizzes, request)
-            
-            quiz_list = []
-            for quiz in paginated_quizzes:
-                quiz_data = {
-                    "id": quiz.id,
-                    "title": quiz.title,
-                    "description": quiz.description,
-                    "session_id": quiz.session.id if quiz.session else None,
-                    "created_at": quiz.created_at,
-                    "question_count": quiz.questions.count(),
-                    "linked_message_id": None
-                }
-                
-                # Find the linked message
-                linked_message = quiz.chat_messages.first()
-                if linked_message:
-                    quiz_data["linked_message_id"] = linked_message.id
-                
-                quiz_list.append(quiz_data)
-            
-            return paginator.get_paginated_response(quiz_list)
-            
+            if request.query_params.get('pagination') == 'cursor' or 'cursor' in request.query_params:
+                paginator = KeysetPagination()
+            else:
+                paginator = CustomPagination()
+                quizzes = quizzes.order_by('id')
+            page = paginator.paginate_queryset(quizzes, request)
+            return paginator.get_paginated_response(list(page))
+        except APIException:
+            raise
         except Exception as e:
             traceback.print_exc()
             return Response({
                 "error": f"Failed to retrieve quizzes: {str(e)}"
             }, status=500)
 
+
+class MetricsView(APIView):
+    def get(self, request):
+        """
+        Latency histograms (seconds) aggregated in this process, e.g. chat.llm_ttft
+        """
+        return Response({
+            "histograms": metrics_registry.snapshot(),
+            "llm_admission": get_admission_controller().stats()
+        })
@@ -103,6 +103,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Write transactions take the write lock up front, so they queue on busy_timeout
+            # instead of failing when a read lock cannot be upgraded (see SQLITE_PRAGMAS)
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 5,
+        },
     }
 }
 
@@ -153,6 +159,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
 GROQ_API_KEY = os.getenv('GROQ_API_KEY', '')  # Add your Groq API key to environment variables
+GROQ_BASE_URL = os.getenv('GROQ_BASE_URL') or None  # e.g. a local stub server; None uses api.groq.com
 SYSTEM_PROMPT = """
 You are a helpful assistant that can answer questions and help with tasks.
 Keep your responses short and concise.
@@ -162,4 +169,121 @@ MEMORY_FILE = os.path.join(BASE_DIR, "memories/consolidated_memory.txt")
 GOALS_FILE = os.path.join(BASE_DIR, "goals/goals.json")
 DOCUMENTS_DIR = os.path.join(BASE_DIR, "documents")
 VECTOR_STORE_FILE = os.path.join(BASE_DIR, "documents/vector_store.pkl")
-EMBEDDING_MODEL = "models/gemini-embedding-exp-03-07"  # Google Generative AI embedding model
\ No newline at end of file
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'google')  # 'google', or 'openai' for an OpenAI-compatible endpoint
+EMBEDDING_BASE_URL = os.getenv('EMBEDDING_BASE_URL', 'http://127.0.0.1:8765')  # used by the 'openai' backend
+EMBEDDING_API_KEY = os.getenv('EMBEDDING_API_KEY', '')
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', "models/gemini-embedding-exp-03-07")  # Google Generative AI embedding model
+# Cached system prompt prefix (base prompt + memory + goals), invalidated by model signals
+SYSTEM_PROMPT_CACHE_TIMEOUT = 60 * 60  # seconds
+
+# Conversation history window (tokens) and rolling summary of older turns
+PROMPT_TOKEN_BUDGET = 8000  # system prompt + RAG context + history + query
+HISTORY_TOKEN_BUDGET = 2000
+HISTORY_SUMMARY_TRIGGER_MESSAGES = 6  # unsummarized messages behind the window before a refresh
+HISTORY_SUMMARY_INPUT_BUDGET = 4000  # max transcript tokens folded in per refresh
+HISTORY_SUMMARY_MAX_TOKENS = 300
+
+# Semantic response cache for repeated questions about the same document (per process)
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'false').lower() == 'true'
+SEMANTIC_CACHE_THRESHOLD = 0.95  # cosine similarity between query embeddings
+SEMANTIC_CACHE_TTL = 24 * 60 * 60  # seconds
+SEMANTIC_CACHE_MAX_ENTRIES_PER_PDF = 200
+
+# Server-Sent Events framing: text deltas are coalesced until either threshold is reached,
+# and a ': keep-alive' comment is sent when the stream is silent for the heartbeat interval
+SSE_COALESCE_MAX_BYTES = 256
+SSE_COALESCE_INTERVAL = 0.02  # seconds
+SSE_HEARTBEAT_INTERVAL = 15  # seconds, 0 disables heartbeats (and the streaming worker thread)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'chat_backend': {
+            'handlers': ['console'],
+            'level': os.getenv('CHAT_BACKEND_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
+# Include per-stage chat turn timings (ms) in the final streamed metadata
+CHAT_TIMINGS_IN_METADATA = os.getenv('CHAT_TIMINGS_IN_METADATA', 'false').lower() == 'true'
+
+# Admission control for upstream LLM calls (shared by chat, quiz generation and extraction)
+LLM_MAX_IN_FLIGHT = 8
+LLM_TOKENS_PER_MINUTE = int(os.getenv('LLM_TOKENS_PER_MINUTE', '0'))  # 0 disables the token budget
+LLM_EXPECTED_COMPLETION_TOKENS = 500  # charged per call instead of the full max_tokens
+LLM_MAX_QUEUE = 32  # waiting calls beyond this are shed immediately
+LLM_QUEUE_TIMEOUT = 30  # seconds a call may wait for admission
+
+# Hedged chat requests: if the first token is slower than the observed p95 (clamped to the
+# bounds below), send a second identical request and stream whichever answers first
+LLM_HEDGING_ENABLED = os.getenv('LLM_HEDGING_ENABLED', 'false').lower() == 'true'
+LLM_HEDGE_MODEL = os.getenv('LLM_HEDGE_MODEL') or None  # fallback model for the hedge, None = same model
+LLM_HEDGE_DEFAULT_DELAY = 2.0  # seconds, used until enough TTFT samples exist
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_HEDGE_MIN_DELAY = 0.5
+LLM_HEDGE_MAX_DELAY = 5.0
+LLM_HEDGE_BUDGET_RATIO = 0.05  # at most ~5% extra requests
+LLM_HEDGE_BUDGET_BURST = 5
+
+# Resumable chat streams: events kept per answer for Last-Event-ID replay (per process)
+SSE_REPLAY_BUFFER_EVENTS = 1000
+SSE_REPLAY_TTL = 5 * 60  # seconds a finished stream stays resumable
+
+# Learner memory: core profile entries always go into the system prompt (within this budget),
+# other memories are retrieved per query by embedding similarity
+MEMORY_CORE_TOKEN_BUDGET = 300
+MEMORY_TOP_K = 5
+MEMORY_MIN_SCORE = 0.3
+MEMORY_CONSOLIDATE_THRESHOLD = 0.92  # cosine similarity above which memories are merged
+MEMORY_CONSOLIDATE_EVERY = 20  # appended memories between background consolidations
+
+# Streamed answers are written to their (incomplete) ChatMessage at most this often, in seconds
+CHAT_PERSIST_INTERVAL = 1.0
+# Incomplete answers older than this (seconds) were left by a dead worker and are closed on the next turn
+CHAT_ABANDONED_MESSAGE_AGE = 600
+
+# Generated quizzes are cached by message content; bump when the quiz prompt changes
+QUIZ_PROMPT_VERSION = "1"
+
+# Batch quiz generation: quizzes generated at once per job, and messages allowed per job
+QUIZ_BATCH_CONCURRENCY = 4
+QUIZ_BATCH_MAX_MESSAGES = 100
+
+# Practice quizzes pre-generated from uploaded PDFs: one quiz per run of consecutive chunks
+QUIZ_PREGENERATION_ENABLED = os.getenv('QUIZ_PREGENERATION_ENABLED', 'false').lower() == 'true'
+QUIZ_PREGENERATION_CHUNKS_PER_GROUP = 3
+QUIZ_PREGENERATION_MAX_GROUPS = 10
+
+# Applied to every new SQLite connection (chat_backend.utils.sqlite): WAL lets readers run during
+# streaming writes; with NORMAL sync the database stays consistent, but the last commits can be
+# lost on power failure
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # ms, matches DATABASES OPTIONS timeout
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,  # negative = KiB, ~64 MB page cache per connection
+    'temp_store': 'MEMORY',
+}
+# Write transactions still locked after busy_timeout are retried with backoff
+SQLITE_LOCK_RETRIES = 3
+SQLITE_LOCK_RETRY_DELAY = 0.05  # seconds, doubled per retry
+
+# Django cache: system prompt prefixes and versioned API responses. The local-memory
+# cache is per process; with several worker processes use the file backend
+# (CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache, CACHE_LOCATION=<directory>)
+# so the version bumps of one process invalidate the responses cached by the others
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'personalized-learning-coach'),
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+# Cached list/detail responses, invalidated by model signals; the timeout only frees memory
+RESPONSE_CACHE_TIMEOUT = 60 * 60  # seconds